@@ -5,21 +5,85 @@ Pure HTML, CSS, JavaScript, and Python Flask
 No external dependencies except Flask
 """
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, make_response, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, make_response, send_from_directory, g, has_app_context, Response
 import sqlite3
+import threading
+import atexit
+import sys
 import hashlib
 import secrets
 import json
+import base64
+import csv
+import gzip
+import zlib
 import random
+import functools
+import concurrent.futures
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import time
 import os
 import bcrypt
 from flask_wtf.csrf import CSRFProtect
 from flask_wtf import csrf
+from werkzeug.security import safe_join
+import mimetypes
 import re
 import html
 
+try:
+    import brotli  # Optional: adds Content-Encoding: br next to gzip
+except ImportError:
+    brotli = None
+
+def compile_alternation(patterns, flags=0):
+    """Compile regex patterns into one alternation that matches wherever any of them does"""
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), flags)
+
+# Threat detection patterns, keyed by strict mode. Each list is compiled into a
+# single alternation so a value is scanned once, however many patterns there are.
+SQL_INJECTION_PATTERNS = {
+    # Strict mode: common SQL injection characters and keywords
+    True: [
+        r"(;|'|\"|\-\-|\/\*|\*\/|@@|@|char|nchar|varchar|nvarchar|alter|begin|cast|create|cursor|declare|delete|drop|end|exec|execute|fetch|insert|kill|open|select|sys|sysobjects|syscolumns|table|update)",
+        r"(union|join|where|order\s+by|group\s+by|having)\s+",
+        r"(script|javascript|vbscript|onload|onerror|onclick)",
+    ],
+    # Relaxed mode: only dangerous SQL commands with suspicious patterns
+    False: [
+        r";\s*(drop|delete|truncate|alter|create|exec|execute)\s+",
+        r"(union\s+select|union\s+all\s+select)",
+        r"(exec\s*\(|execute\s*\()",
+        r"(--|\/\*|\*\/)\s*(drop|delete|insert|update|exec)",
+    ],
+}
+XSS_PATTERNS = {
+    # Strict mode: all XSS patterns
+    True: [
+        r'<script[^>]*>',
+        r'javascript:',
+        r'onload\s*=',
+        r'onerror\s*=',
+        r'onclick\s*=',
+        r'onmouseover\s*=',
+        r'<iframe[^>]*>',
+        r'<object[^>]*>',
+        r'<embed[^>]*>',
+    ],
+    # Relaxed mode: only active script injection
+    False: [
+        r'<script[^>]*>.*</script>',
+        r'javascript:\s*[a-z]',
+        r'on\w+\s*=\s*["\']?\s*(javascript|alert)',
+        r'<iframe[^>]*src\s*=',
+        r'<object[^>]*data\s*=',
+        r'<embed[^>]*src\s*=',
+    ],
+}
+SQL_INJECTION_RE = {strict: compile_alternation(patterns) for strict, patterns in SQL_INJECTION_PATTERNS.items()}
+XSS_RE = {strict: compile_alternation(patterns) for strict, patterns in XSS_PATTERNS.items()}
+
 # Input validation and sanitization module
 class InputValidator:
     """Comprehensive input validation and sanitization"""
@@ -147,29 +211,7 @@ class InputValidator:
         if not value:
             return False
         
-        value_lower = str(value).lower()
-        
-        if strict:
-            # Strict mode: Check for common SQL injection patterns
-            sql_patterns = [
-                r"(\s*(;|'|\"|\-\-|\/\*|\*\/|@@|@|char|nchar|varchar|nvarchar|alter|begin|cast|create|cursor|declare|delete|drop|end|exec|execute|fetch|insert|kill|open|select|sys|sysobjects|syscolumns|table|update)\s*)",
-                r"(\s*(union|join|where|order\s+by|group\s+by|having)\s+)",
-                r"(\s*(script|javascript|vbscript|onload|onerror|onclick)\s*)",
-            ]
-        else:
-            # Relaxed mode: Only check for dangerous SQL commands with suspicious patterns
-            sql_patterns = [
-                r";\s*(drop|delete|truncate|alter|create|exec|execute)\s+",
-                r"(union\s+select|union\s+all\s+select)",
-                r"(exec\s*\(|execute\s*\()",
-                r"(--|\/\*|\*\/)\s*(drop|delete|insert|update|exec)",
-            ]
-        
-        for pattern in sql_patterns:
-            if re.search(pattern, value_lower):
-                return True
-        
-        return False
+        return SQL_INJECTION_RE[bool(strict)].search(str(value).lower()) is not None
     
     @staticmethod
     def detect_xss(value, strict=True):
@@ -181,37 +223,7 @@ class InputValidator:
         if not value:
             return False
         
-        value_lower = str(value).lower()
-        
-        if strict:
-            # Strict mode: Check for all XSS patterns
-            xss_patterns = [
-                r'<script[^>]*>',
-                r'javascript:',
-                r'onload\s*=',
-                r'onerror\s*=',
-                r'onclick\s*=',
-                r'onmouseover\s*=',
-                r'<iframe[^>]*>',
-                r'<object[^>]*>',
-                r'<embed[^>]*>',
-            ]
-        else:
-            # Relaxed mode: Only check for active script injection
-            xss_patterns = [
-                r'<script[^>]*>.*</script>',
-                r'javascript:\s*[a-z]',
-                r'on\w+\s*=\s*["\']?\s*(javascript|alert)',
-                r'<iframe[^>]*src\s*=',
-                r'<object[^>]*data\s*=',
-                r'<embed[^>]*src\s*=',
-            ]
-        
-        for pattern in xss_patterns:
-            if re.search(pattern, value_lower):
-                return True
-        
-        return False
+        return XSS_RE[bool(strict)].search(str(value).lower()) is not None
 
 # Input validation decorator
 def validate_input(validation_rules):
@@ -265,7 +277,10 @@ app.jinja_env.lstrip_blocks = True
 # Use a more secure secret key management
 # In production, this should be loaded from environment variables
 SECRET_KEY_FILE = 'secret_key.txt'
-if os.path.exists(SECRET_KEY_FILE):
+if os.environ.get('EXAM_SECRET_KEY'):
+    # Tests and scripts pass a throwaway key so no key file is written
+    app.secret_key = os.environ['EXAM_SECRET_KEY']
+elif os.path.exists(SECRET_KEY_FILE):
     with open(SECRET_KEY_FILE, 'r') as f:
         app.secret_key = f.read().strip()
 else:
@@ -295,15 +310,69 @@ def safe_name_filter(value):
     cleaned = re.sub(r'[^a-zA-Z0-9\s\-\.\'\,]', '', str(value))
     return html.escape(cleaned[:100])  # Limit length
 
+# Sanitizing filters run on every rendered value, and the same titles, names and
+# options repeat across pages, so results are memoized per input string.
+FILTER_CACHE_SIZE = 4096
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+class PatternStripper:
+    """Removes regex patterns in order, with a single-pass fast path
+    
+    The passes must stay sequential (removing one match can expose another),
+    but if no pattern matches the original text none of them can change it, so
+    one search over the combined alternation settles the common case.
+    """
+    
+    def __init__(self, patterns, flags=0):
+        self.passes = [re.compile(pattern, flags) for pattern in patterns]
+        self.any_match = compile_alternation(patterns, flags)
+    
+    def strip(self, text):
+        if not self.any_match.search(text):
+            return text
+        for pattern in self.passes:
+            text = pattern.sub('', text)
+        return text
+
+SAFE_TEXT_STRIPPER = PatternStripper([
+    r'<script[^>]*>.*?</script>',  # Remove potential script content
+    r'javascript:',
+    r'on\w+\s*=',
+    r'<[^>]+>',  # Remove HTML tags (the flags don't change this pattern)
+], re.IGNORECASE | re.DOTALL)
+
+DANGEROUS_STRIPPER = PatternStripper([
+    r'<script[^>]*>.*?</script>',
+    r'<iframe[^>]*>.*?</iframe>',
+    r'<object[^>]*>.*?</object>',
+    r'<embed[^>]*>.*?</embed>',
+    r'javascript:',
+    r'vbscript:',
+    r'data:text/html',
+    r'on\w+\s*=',
+], re.IGNORECASE | re.DOTALL)
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _safe_html(text):
+    return html.escape(HTML_TAG_RE.sub('', text))
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _safe_text(text, max_length):
+    text = SAFE_TEXT_STRIPPER.strip(text)
+    if max_length and len(text) > max_length:
+        text = text[:max_length] + "..."
+    return html.escape(text)
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _strip_dangerous(text):
+    return html.escape(DANGEROUS_STRIPPER.strip(text))
+
 @app.template_filter('safe_html')
 def safe_html_filter(value):
     """Strip all HTML tags and escape content"""
     if not value:
         return ""
-    # Remove all HTML tags
-    clean_text = re.sub(r'<[^>]+>', '', str(value))
-    # HTML escape the result
-    return html.escape(clean_text)
+    return _safe_html(str(value))
 
 @app.template_filter('safe_url')
 def safe_url_filter(value):
@@ -338,47 +407,14 @@ def safe_text_filter(value, max_length=500):
     """Comprehensive text sanitization"""
     if not value:
         return ""
-    
-    text = str(value)
-    
-    # Remove potential script content
-    text = re.sub(r'<script[^>]*>.*?</script>', '', text, flags=re.IGNORECASE | re.DOTALL)
-    text = re.sub(r'javascript:', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'on\w+\s*=', '', text, flags=re.IGNORECASE)
-    
-    # Remove HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
-    
-    # Limit length
-    if max_length and len(text) > max_length:
-        text = text[:max_length] + "..."
-    
-    return html.escape(text)
+    return _safe_text(str(value), max_length)
 
 @app.template_filter('strip_dangerous')
 def strip_dangerous_filter(value):
     """Remove dangerous characters and patterns"""
     if not value:
         return ""
-    
-    text = str(value)
-    
-    # Remove dangerous patterns
-    dangerous_patterns = [
-        r'<script[^>]*>.*?</script>',
-        r'<iframe[^>]*>.*?</iframe>',
-        r'<object[^>]*>.*?</object>',
-        r'<embed[^>]*>.*?</embed>',
-        r'javascript:',
-        r'vbscript:',
-        r'data:text/html',
-        r'on\w+\s*=',
-    ]
-    
-    for pattern in dangerous_patterns:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    return html.escape(text)
+    return _strip_dangerous(str(value))
 
 # Security headers middleware
 @app.after_request
@@ -415,6 +451,11 @@ def add_security_headers(response):
     response.headers['Cross-Origin-Opener-Policy'] = 'same-origin'
     # response.headers['Cross-Origin-Resource-Policy'] = 'same-origin'  # Disabled for YouTube embeds
     
+    if asset_pipeline.is_immutable_request(response):
+        # Content-hashed asset: the URL changes whenever the bytes do
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+    
     # Cache-busting headers to force policy refresh
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
@@ -422,6 +463,287 @@ def add_security_headers(response):
     
     return response
 
+# Static asset bundles
+app.config['ASSET_BUNDLING'] = os.environ.get('EXAM_ASSET_BUNDLING', '1') != '0'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+ASSET_DIST_DIR = 'dist'  # generated bundles, relative to the static folder
+
+# Bundle name -> source files (relative to the static folder), in load order
+ASSET_BUNDLES = {
+    'base.css': [
+        'css/mobile-fallback.css',
+        'css/style.css',
+        'css/cyber-enhanced.css',
+        'css/cyber-colors.css',
+        'css/hero.css',
+        'css/main-content.css',
+        'css/cyber-forms.css',
+        'css/auth-portals.css',
+        'css/exam-form.css',
+        'css/system-info-enhanced.css',
+        'css/enhanced-theme.css',
+        'css/mobile-responsive.css',
+    ],
+    # Loaded after each page's extra_css so its rules keep precedence
+    'overrides.css': [
+        'css/critical-overrides.css',
+    ],
+    'base.js': [
+        'js/script.js',
+        'js/form-enhancements.js',
+        'js/mobile-nav.js',
+        'js/table-responsive.js',
+    ],
+}
+
+_CSS_TOKEN_RE = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/|\s*([{};,])\s*|\s+''', re.DOTALL)
+
+def minify_css(text):
+    """Strip comments and collapse whitespace, leaving string literals untouched"""
+    def replace(match):
+        if match.group(1):
+            return match.group(1)
+        if match.group(2):
+            return match.group(2)
+        return '' if match.group(0).startswith('/*') else ' '
+    return _CSS_TOKEN_RE.sub(replace, text).strip()
+
+def minify_js(text):
+    """Drop indentation, blank lines and whole-line // comments
+    
+    Anything smarter needs a real JS parser (regex literals, template strings),
+    so this stays line-based.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+class AssetPipeline:
+    """Builds content-hashed bundles of the shared CSS/JS and hands out their URLs
+    
+    Bundles are written to static/dist/<name>.<hash>.<ext> on first use (or via
+    `python new.py --build-assets`). With bundling disabled each source file is
+    linked individually with a ?v=<hash> fingerprint instead.
+    """
+    
+    def __init__(self, bundles):
+        self.bundles = bundles
+        self._lock = threading.Lock()
+        self._built = None
+        self._file_hashes = {}
+    
+    def _source_path(self, filename):
+        return os.path.join(app.static_folder, *filename.split('/'))
+    
+    def file_hash(self, filename):
+        """Short content hash of a static file, cached until its mtime changes"""
+        path = self._source_path(filename)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        cached = self._file_hashes.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        self._file_hashes[filename] = (mtime, digest)
+        return digest
+    
+    def build(self):
+        """Write every bundle to the dist folder; returns {bundle: dist filename}"""
+        dist_dir = os.path.join(app.static_folder, ASSET_DIST_DIR)
+        os.makedirs(dist_dir, exist_ok=True)
+        built = {}
+        for name, files in self.bundles.items():
+            stem, ext = os.path.splitext(name)
+            minify = minify_css if ext == '.css' else minify_js
+            parts = []
+            for filename in files:
+                with open(self._source_path(filename), encoding='utf-8') as f:
+                    parts.append(f'/* {filename} */\n' + minify(f.read()))
+            # Separate JS files so a missing trailing semicolon can't join statements
+            content = ('\n' if ext == '.css' else ';\n').join(parts) + '\n'
+            data = content.encode('utf-8')
+            dist_name = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+            path = os.path.join(dist_dir, dist_name)
+            if not os.path.exists(path):
+                write_file_atomic(path, data)
+            if not os.path.exists(path + '.gz'):
+                write_precompressed(path, data)
+            built[name] = f'{ASSET_DIST_DIR}/{dist_name}'
+        return built
+    
+    def _ensure_built(self):
+        if self._built is None:
+            with self._lock:
+                if self._built is None:
+                    try:
+                        self._built = self.build()
+                        print(f"📦 Built {len(self._built)} static asset bundles")
+                    except OSError as e:
+                        print(f"⚠️ Could not build static asset bundles, serving source files: {e}")
+                        self._built = {}
+        return self._built
+    
+    def urls(self, bundle):
+        """URLs to link for a bundle: one hashed file, or the fingerprinted sources"""
+        if app.config['ASSET_BUNDLING']:
+            dist_name = self._ensure_built().get(bundle)
+            if dist_name:
+                return [url_for('static', filename=dist_name)]
+        return [self.url(filename) for filename in self.bundles[bundle]]
+    
+    def url(self, filename):
+        """url_for('static') with a ?v=<content hash> fingerprint"""
+        digest = self.file_hash(filename)
+        if digest is None:
+            return url_for('static', filename=filename)
+        return url_for('static', filename=filename, v=digest)
+    
+    def is_immutable_request(self, response):
+        """True for successful static responses whose URL carries a content hash"""
+        if request.endpoint != 'static' or response.status_code not in (200, 304):
+            return False
+        filename = (request.view_args or {}).get('filename', '')
+        if filename.startswith(ASSET_DIST_DIR + '/'):
+            return True
+        version = request.args.get('v')
+        return bool(version) and version == self.file_hash(filename)
+
+asset_pipeline = AssetPipeline(ASSET_BUNDLES)
+app.jinja_env.globals['asset_urls'] = asset_pipeline.urls
+app.jinja_env.globals['asset_url'] = asset_pipeline.url
+
+# Response compression
+app.config['COMPRESSION_ENABLED'] = os.environ.get('EXAM_COMPRESSION', '1') != '0'
+app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('EXAM_COMPRESSION_MIN_SIZE', '1024'))  # bytes
+app.config['COMPRESSION_LEVEL'] = int(os.environ.get('EXAM_COMPRESSION_LEVEL', '6'))  # gzip 1-9
+app.config['COMPRESSION_BROTLI_QUALITY'] = int(os.environ.get('EXAM_COMPRESSION_BROTLI_QUALITY', '4'))  # 0-11
+# Static files without a pre-built sibling are compressed on the fly up to this size
+app.config['COMPRESSION_STATIC_MAX_SIZE'] = int(os.environ.get('EXAM_COMPRESSION_STATIC_MAX_SIZE', str(512 * 1024)))  # bytes
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+}
+# Content-Encoding -> pre-built sibling suffix, in order of preference
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+def write_file_atomic(path, data):
+    """Write bytes via a temp file so concurrent readers never see a partial file"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def write_precompressed(path, data):
+    """Write .gz (and .br when brotli is installed) siblings at maximum compression"""
+    write_file_atomic(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        write_file_atomic(path + '.br', brotli.compress(data, quality=11))
+
+def accepted_encodings():
+    """Encodings this server can produce that the client accepts, best first"""
+    available = ['br', 'gzip'] if brotli is not None else ['gzip']
+    accepted = [(request.accept_encodings.quality(name), -i, name) for i, name in enumerate(available)]
+    return [name for quality, _, name in sorted(accepted, reverse=True) if quality > 0]
+
+@app.before_request
+def serve_precompressed_static():
+    """Answer static requests from a pre-built .br/.gz sibling when one exists"""
+    if request.endpoint != 'static' or not app.config['COMPRESSION_ENABLED']:
+        return None
+    filename = (request.view_args or {}).get('filename')
+    if not filename or request.headers.get('Range'):
+        return None
+    for encoding in accepted_encodings():
+        path = safe_join(app.static_folder, filename + PRECOMPRESSED_SUFFIXES[encoding])
+        if path and os.path.isfile(path):
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(app.static_folder, filename + PRECOMPRESSED_SUFFIXES[encoding],
+                                           mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+    return None
+
+def compress_bytes(data, encoding, static=False):
+    """gzip/brotli-compress data; static files get the highest settings"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if static else app.config['COMPRESSION_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=9 if static else app.config['COMPRESSION_LEVEL'], mtime=0)
+
+@functools.lru_cache(maxsize=128)
+def _compressed_static_file(path, mtime, encoding):
+    with open(path, 'rb') as f:
+        return compress_bytes(f.read(), encoding, static=True)
+
+def compress_static_file(response):
+    """Compress a static file response that had no pre-built .br/.gz sibling
+    
+    Page-specific stylesheets and scripts are linked individually rather than
+    bundled, so they are compressed here (once per file version) up to
+    COMPRESSION_STATIC_MAX_SIZE.
+    """
+    filename = (request.view_args or {}).get('filename')
+    path = safe_join(app.static_folder, filename) if filename else None
+    if not path or request.headers.get('Range') or response.status_code != 200:
+        return response
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return response
+    if not app.config['COMPRESSION_MIN_SIZE'] <= stat.st_size <= app.config['COMPRESSION_STATIC_MAX_SIZE']:
+        return response
+    encodings = accepted_encodings()
+    if not encodings:
+        return response
+    data = _compressed_static_file(path, stat.st_mtime, encodings[0])
+    response.close()
+    response.direct_passthrough = False
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encodings[0]
+    # Same content, different bytes: the validator must only match weakly
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def carries_csrf_token():
+    """True once this request has rendered a CSRF token into its response"""
+    return app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token') in g
+
+@app.after_request
+def compress_response(response):
+    """Compress buffered text responses above COMPRESSION_MIN_SIZE
+    
+    Streamed responses (the CSV/NDJSON exports) pass through untouched;
+    exports handle their own gzip option. Pages that embed a CSRF token are
+    sent uncompressed: compressing a secret next to attacker-influenced text
+    (search terms, names) leaks it through the response size (BREACH).
+    """
+    if not app.config['COMPRESSION_ENABLED'] or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    # Static files may have been answered from a compressed sibling for other clients
+    response.vary.add('Accept-Encoding')
+    if response.is_streamed and not response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if response.direct_passthrough:
+        return compress_static_file(response) if request.endpoint == 'static' else response
+    if carries_csrf_token():
+        return response
+    data = response.get_data()
+    if len(data) < app.config['COMPRESSION_MIN_SIZE']:
+        return response
+    encodings = accepted_encodings()
+    if not encodings:
+        return response
+    response.set_data(compress_bytes(data, encodings[0]))
+    response.headers['Content-Encoding'] = encodings[0]
+    return response
+
 # Helper functions for form data
 def get_divisions():
     """Get all divisions from database"""
@@ -462,303 +784,781 @@ def bad_request_error(error):
     return redirect(url_for('index'))
 
 # Database configuration
-DATABASE = 'exam_system.db'
-
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE, detect_types=sqlite3.PARSE_DECLTYPES)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def migrate_passwords_to_bcrypt():
-    """Migrate existing SHA-256 passwords to bcrypt"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Add password_change_required column to admins table if it doesn't exist
-    cursor.execute("PRAGMA table_info(admins)")
-    admin_columns = [col['name'] for col in cursor.fetchall()]
-    if 'password_change_required' not in admin_columns:
-        cursor.execute("ALTER TABLE admins ADD COLUMN password_change_required INTEGER DEFAULT 0")
-        conn.commit()
-        print("Added 'password_change_required' column to admins table")
-    
-    # Check if admin password is still SHA-256 (64 characters)
-    admin = cursor.execute('SELECT id, password_hash FROM admins WHERE username = ?', ('admin',)).fetchone()
-    if admin and len(admin['password_hash']) == 64:  # SHA-256 hash length
-        print("Migrating admin password from SHA-256 to bcrypt...")
-        new_hash = hash_password('admin123')
-        cursor.execute('UPDATE admins SET password_hash = ?, password_change_required = 1 WHERE id = ?', 
-                      (new_hash, admin['id']))
-        print("Admin password migrated to bcrypt and marked for password change")
-    
-    # Check user passwords and show summary
-    users = cursor.execute('SELECT id, password_hash FROM users').fetchall()
-    sha256_users = [user for user in users if len(user['password_hash']) == 64]
-    
-    if sha256_users:
-        print(f"⚠️  Found {len(sha256_users)} users with old SHA-256 passwords")
-        print("💡 Run 'python migrate_user_passwords.py' to migrate them to bcrypt format")
-    else:
-        print("✅ All user passwords are in bcrypt format")
+DATABASE = os.environ.get('EXAM_DATABASE', 'exam_system.db')
+
+# SQLite tuning - override through the environment on production servers
+app.config['DB_SYNCHRONOUS'] = os.environ.get('EXAM_DB_SYNCHRONOUS', 'NORMAL')
+app.config['DB_CACHE_SIZE'] = int(os.environ.get('EXAM_DB_CACHE_SIZE', '-20000'))  # negative = KiB
+app.config['DB_MMAP_SIZE'] = int(os.environ.get('EXAM_DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+app.config['DB_BUSY_TIMEOUT'] = int(os.environ.get('EXAM_DB_BUSY_TIMEOUT', '5000'))  # milliseconds
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+# SQL instrumentation
+app.config['SQL_INSTRUMENTATION'] = os.environ.get('EXAM_SQL_INSTRUMENTATION', '1') != '0'
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('EXAM_SLOW_QUERY_MS', '100'))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('EXAM_SLOW_QUERY_LOG', 'slow_queries.log')  # empty = stdout
+SQL_SLOWEST_PER_REQUEST = 3
+
+_sql_local = threading.local()  # .stats is the RequestSqlStats of the request on this thread
+_slow_log_lock = threading.Lock()
+
+def normalize_sql(sql):
+    """Collapse whitespace so the same statement groups together"""
+    return ' '.join(sql.split())
+
+def log_slow_query(sql, elapsed, endpoint):
+    """Append a statement that crossed SLOW_QUERY_MS to the slow-query log"""
+    line = f"{datetime.now().isoformat(timespec='seconds')} {elapsed * 1000:.1f}ms [{endpoint}] {normalize_sql(sql)}"
+    path = app.config['SLOW_QUERY_LOG']
+    if not path:
+        print(f"🐢 Slow query: {line}")
+        return
+    try:
+        with _slow_log_lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        print(f"🐢 Slow query (log unavailable: {e}): {line}")
+
+class RequestSqlStats:
+    """Query count, SQL time and per-statement totals for one request"""
+    
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.count = 0
+        self.total = 0.0
+        self.statements = {}  # sql -> [executions, seconds]
+    
+    def add(self, sql, elapsed, new_statement):
+        self.total += elapsed
+        entry = self.statements.get(sql)
+        if entry is None:
+            entry = self.statements[sql] = [0, 0.0]
+        if new_statement:
+            self.count += 1
+            entry[0] += 1
+        entry[1] += elapsed
+    
+    def slowest(self, limit=SQL_SLOWEST_PER_REQUEST):
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [(normalize_sql(sql), executions, seconds) for sql, (executions, seconds) in ranked[:limit]]
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports execute/fetch time to the current request's stats
+    
+    SQLite does most of a SELECT's work while rows are fetched, so fetch time
+    is charged to the statement that produced the rows.
+    """
+    
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._sql = None
+        self._elapsed = 0.0
+        self._logged = False
+    
+    def _track(self, started, sql=None):
+        stats = getattr(_sql_local, 'stats', None)
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - started
+        if sql is not None:
+            self._sql, self._elapsed, self._logged = sql, 0.0, False
+        if self._sql is None:
+            return
+        self._elapsed += elapsed
+        stats.add(self._sql, elapsed, sql is not None)
+        if not self._logged and self._elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+            self._logged = True
+            log_slow_query(self._sql, self._elapsed, stats.endpoint)
+    
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            count_sqlite_busy(e)
+            raise
+        finally:
+            self._track(started, sql)
     
-    conn.commit()
-    conn.close()
-
-def migrate_database():
-    """Handle database migrations"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        except sqlite3.OperationalError as e:
+            count_sqlite_busy(e)
+            raise
+        finally:
+            self._track(started, sql)
     
-    # Check if division_name column exists in users table
-    cursor.execute("PRAGMA table_info(users)")
-    columns = [column[1] for column in cursor.fetchall()]
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._track(started)
     
-    if 'division_name' not in columns:
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
         try:
-            cursor.execute("ALTER TABLE users ADD COLUMN division_name TEXT")
-            conn.commit()
-            print("Added division_name column to users table")
-        except sqlite3.Error as e:
-            print(f"Error adding division_name column: {e}")
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._track(started)
     
-    conn.close()
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._track(started)
 
-def init_database():
-    """Initialize database with tables and sample data"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection that survives close() while it belongs to the pool"""
+    pooled = False
 
-    # Create system_settings table if it doesn't exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS system_settings (
-            id INTEGER PRIMARY KEY,
-            registration_enabled INTEGER DEFAULT 1,
-            maintenance_mode INTEGER DEFAULT 0,
-            exams_enabled INTEGER DEFAULT 1,
-            exam_window_start TIMESTAMP,
-            exam_window_end TIMESTAMP,
-            last_backup_time TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Check if system_settings has at least one row
-    cursor.execute("SELECT COUNT(*) FROM system_settings")
-    if cursor.fetchone()[0] == 0:
-        # Insert default system settings
-        cursor.execute('''
-            INSERT INTO system_settings (
-                id, registration_enabled, maintenance_mode, exams_enabled,
-                created_at, updated_at
-            ) VALUES (
-                1, 1, 0, 1, datetime('now'), datetime('now')
-            )
-        ''')
-        conn.commit()
+    # Route every statement through InstrumentedCursor (the C-level
+    # Connection.execute would bypass an overridden cursor())
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
 
-    # Check and add category column to questions table
-    cursor.execute("PRAGMA table_info(questions)")
-    columns = [col['name'] for col in cursor.fetchall()]
-    if 'category' not in columns:
-        try:
-            cursor.execute("ALTER TABLE questions ADD COLUMN category TEXT")
-            # Update existing questions with categories based on their properties
-            cursor.execute("""
-                UPDATE questions 
-                SET category = CASE
-                    WHEN question_image IS NOT NULL THEN 'image'
-                    WHEN question_youtube IS NOT NULL THEN 'video'
-                    ELSE difficulty
-                END
-            """)
-            conn.commit()
-            print("Added 'category' column to questions table")
-        except sqlite3.OperationalError as e:
-            print(f"Error adding category column: {e}")
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
 
-    # Check and add new columns to exams table
-    cursor.execute("PRAGMA table_info(exams)")
-    columns = [col['name'] for col in cursor.fetchall()]
-    if 'category_config' not in columns:
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
         try:
-            cursor.execute("ALTER TABLE exams ADD COLUMN category_config TEXT")
-            conn.commit()
-            print("Added 'category_config' column to exams table")
+            super().commit()
         except sqlite3.OperationalError as e:
-            print(f"Error adding category_config column: {e}")
+            count_sqlite_busy(e)
+            raise
+
+    def close(self):
+        """Discard uncommitted work; only really close when not pooled"""
+        if self.pooled:
+            if self.in_transaction:
+                self.rollback()
+            return
+        super().close()
+
+    def force_close(self):
+        """Close the underlying connection even if it is pooled"""
+        self.pooled = False
+        super().close()
+
+def open_db_connection(database=None):
+    """Open a new SQLite connection in WAL mode with the configured pragmas"""
+    busy_timeout = int(app.config['DB_BUSY_TIMEOUT'])
+    conn = sqlite3.connect(database or DATABASE, detect_types=sqlite3.PARSE_DECLTYPES,
+                           timeout=busy_timeout / 1000, factory=PooledConnection)
+    conn.row_factory = sqlite3.Row
+    
+    synchronous = str(app.config['DB_SYNCHRONOUS']).upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        synchronous = 'NORMAL'
+    
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f'PRAGMA synchronous = {synchronous}')
+    conn.execute(f'PRAGMA cache_size = {int(app.config["DB_CACHE_SIZE"])}')
+    conn.execute(f'PRAGMA mmap_size = {int(app.config["DB_MMAP_SIZE"])}')
+    conn.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
 
-    # Add scheduled_start and scheduled_end columns for exam scheduling
-    if 'scheduled_start' not in columns:
+class ConnectionPool:
+    """Per-thread pool of long-lived SQLite connections
+    
+    Waitress serves requests from a fixed set of worker threads, so one
+    connection per thread gives a bounded pool with no locking on the hot path.
+    """
+    
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self.opened = 0
+    
+    def acquire(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.database != DATABASE:
+            # DATABASE was repointed (tests, tools) - drop the stale handle
+            self.discard(conn)
+            conn = None
+        if conn is None:
+            conn = open_db_connection()
+            conn.pooled = True
+            self._local.conn = conn
+            self._local.database = DATABASE
+            with self._lock:
+                self._connections.add(conn)
+                self.opened += 1
+        return conn
+    
+    def release(self, conn):
+        """Hand a connection back to the pool, rolling back anything left open"""
         try:
-            cursor.execute("ALTER TABLE exams ADD COLUMN scheduled_start TIMESTAMP")
-            conn.commit()
-            print("Added 'scheduled_start' column to exams table")
-        except sqlite3.OperationalError as e:
-            print(f"Error adding scheduled_start column: {e}")
-    if 'scheduled_end' not in columns:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+    
+    def discard(self, conn):
+        """Close a connection and forget about it"""
+        with self._lock:
+            self._connections.discard(conn)
+        if getattr(self._local, 'conn', None) is conn:
+            self._local.conn = None
         try:
-            cursor.execute("ALTER TABLE exams ADD COLUMN scheduled_end TIMESTAMP")
-            conn.commit()
-            print("Added 'scheduled_end' column to exams table")
-        except sqlite3.OperationalError as e:
-            print(f"Error adding scheduled_end column: {e}")
-
-    # Check and add exam_controls table
-    cursor.execute("PRAGMA table_info(exam_controls)")
-    columns = [col['name'] for col in cursor.fetchall()]
-    if not columns:
-        cursor.executescript('''
-            -- Exam controls table
-            CREATE TABLE IF NOT EXISTS exam_controls (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                show_result_immediately BOOLEAN DEFAULT 1,
-                show_result_history BOOLEAN DEFAULT 1,
-                show_rankings BOOLEAN DEFAULT 1,
-                enable_copy_protection BOOLEAN DEFAULT 1,
-                enable_screenshot_block BOOLEAN DEFAULT 1,
-                enable_tab_switch_detect BOOLEAN DEFAULT 1,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
-        # Initialize default exam controls
-        controls_count = conn.execute('SELECT COUNT(*) FROM exam_controls').fetchone()[0]
-        if controls_count == 0:
-            conn.execute('''
-                INSERT INTO exam_controls 
-                (show_result_immediately, show_result_history, show_rankings, enable_copy_protection, enable_screenshot_block, enable_tab_switch_detect) 
-                VALUES (1, 1, 1, 1, 1, 1)
-            ''')
-            print("Initialized exam_controls with default values")
-        conn.commit()
-    else:
-        # Check if show_rankings column exists and add it if missing
-        if 'show_rankings' not in columns:
-            try:
-                cursor.execute("ALTER TABLE exam_controls ADD COLUMN show_rankings BOOLEAN DEFAULT 1")
-                conn.commit()
-                print("Added 'show_rankings' column to exam_controls table")
-            except sqlite3.OperationalError:
-                pass
-        
-        # Check if allow_answer_review column exists and add it if missing
-        if 'allow_answer_review' not in columns:
+            conn.force_close()
+        except sqlite3.Error:
+            pass
+    
+    def close_all(self):
+        """Close every pooled connection (process shutdown)"""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
             try:
-                cursor.execute("ALTER TABLE exam_controls ADD COLUMN allow_answer_review BOOLEAN DEFAULT 1")
-                conn.commit()
-                print("Added 'allow_answer_review' column to exam_controls table")
-            except sqlite3.OperationalError:
+                conn.force_close()
+            except sqlite3.Error:
                 pass
-        
-    # Check and add system_settings table
-    cursor.execute("PRAGMA table_info(system_settings)")
-    columns = [col['name'] for col in cursor.fetchall()]
-    if not columns:
-        cursor.executescript('''
-            -- System settings table
-            CREATE TABLE IF NOT EXISTS system_settings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                registration_enabled INTEGER DEFAULT 1,
-                maintenance_mode INTEGER DEFAULT 0,
-                db_backup_path TEXT DEFAULT 'backups/',
-                last_backup_time TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
-        # Initialize default system settings
-        settings_count = conn.execute('SELECT COUNT(*) FROM system_settings').fetchone()[0]
-        if settings_count == 0:
-            conn.execute('''
-                INSERT INTO system_settings 
-                (registration_enabled, maintenance_mode, updated_at) 
-                VALUES (1, 0, ?)
-            ''', (datetime.now(),))
-            print("Initialized system_settings with default values")
-        conn.commit()
+        self._local = threading.local()
+    
+    def stats(self):
+        """Basic pool statistics for diagnostics"""
+        with self._lock:
+            return {'open_connections': len(self._connections), 'total_opened': self.opened}
 
-    # Check and add missing columns to system_settings
-    cursor.execute("PRAGMA table_info(system_settings)")
-    columns = [col['name'] for col in cursor.fetchall()]
-    if 'exams_enabled' not in columns:
-        try:
-            cursor.execute("ALTER TABLE system_settings ADD COLUMN exams_enabled INTEGER DEFAULT 1")
-            conn.commit()
-            print("Added 'exams_enabled' column to system_settings table")
-            # Update existing row
-            cursor.execute("UPDATE system_settings SET exams_enabled = 1 WHERE id = 1")
-            conn.commit()
-        except sqlite3.OperationalError as e:
-            print(f"Error adding exams_enabled column: {e}")
-    if 'exam_window_start' not in columns:
-        try:
-            cursor.execute("ALTER TABLE system_settings ADD COLUMN exam_window_start TIMESTAMP")
-            conn.commit()
-            print("Added 'exam_window_start' column to system_settings table")
-        except sqlite3.OperationalError as e:
-            print(f"Error adding exam_window_start column: {e}")
-    if 'exam_window_end' not in columns:
-        try:
-            cursor.execute("ALTER TABLE system_settings ADD COLUMN exam_window_end TIMESTAMP")
-            conn.commit()
-            print("Added 'exam_window_end' column to system_settings table")
-        except sqlite3.OperationalError as e:
-            print(f"Error adding exam_window_end column: {e}")
+db_pool = ConnectionPool()
+atexit.register(db_pool.close_all)
 
-    # Check if answers_detail column exists in exam_sessions
-    cursor.execute("PRAGMA table_info(exam_sessions)")
-    columns = [col['name'] for col in cursor.fetchall()]
-    
-    # Add answers_detail column if it doesn't exist
-    if 'answers_detail' not in columns:
+def get_db_connection():
+    """Get the request-scoped database connection
+    
+    Inside a request every call returns the same pooled connection; calling
+    close() on it only rolls back uncommitted work. Outside an app context
+    (scripts, CLI helpers) a private connection is returned instead.
+    """
+    if not has_app_context():
+        return open_db_connection()
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+class SqlStatsSummary:
+    """Process-wide SQL totals per endpoint and per statement, for the admin summary"""
+    
+    def __init__(self, max_statements=500):
+        self._lock = threading.Lock()
+        self.max_statements = max_statements
+        self._clear()
+    
+    def _clear(self):
+        self.since = datetime.now()
+        self.endpoints = {}   # endpoint -> [requests, queries, seconds, max queries]
+        self.statements = {}  # sql -> [executions, seconds, max seconds]
+    
+    def reset(self):
+        """Drop everything recorded so far"""
+        with self._lock:
+            self._clear()
+    
+    def record(self, stats):
+        with self._lock:
+            entry = self.endpoints.setdefault(stats.endpoint, [0, 0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += stats.count
+            entry[2] += stats.total
+            entry[3] = max(entry[3], stats.count)
+            for sql, (executions, seconds) in stats.statements.items():
+                sql = normalize_sql(sql)
+                statement = self.statements.get(sql)
+                if statement is None:
+                    if len(self.statements) >= self.max_statements:
+                        continue  # Bounded: new statements are dropped once full
+                    statement = self.statements[sql] = [0, 0.0, 0.0]
+                statement[0] += executions
+                statement[1] += seconds
+                statement[2] = max(statement[2], seconds / max(executions, 1))
+    
+    def summary(self, limit=20):
+        with self._lock:
+            endpoints = [{
+                'endpoint': endpoint,
+                'requests': requests,
+                'queries': queries,
+                'avg_queries': round(queries / requests, 1),
+                'max_queries': max_queries,
+                'sql_ms': round(seconds * 1000, 1),
+                'avg_sql_ms': round(seconds * 1000 / requests, 2),
+            } for endpoint, (requests, queries, seconds, max_queries) in self.endpoints.items()]
+            statements = [{
+                'sql': sql,
+                'executions': executions,
+                'total_ms': round(seconds * 1000, 1),
+                'avg_ms': round(seconds * 1000 / executions, 2) if executions else 0.0,
+                'max_ms': round(max_seconds * 1000, 1),
+            } for sql, (executions, seconds, max_seconds) in self.statements.items()]
+        endpoints.sort(key=lambda e: e['avg_queries'], reverse=True)
+        statements.sort(key=lambda s: s['total_ms'], reverse=True)
+        return {'since': self.since.isoformat(timespec='seconds'),
+                'endpoints': endpoints, 'statements': statements[:limit]}
+
+sql_stats = SqlStatsSummary()
+
+@app.before_request
+def start_sql_instrumentation():
+    """Start counting this request's queries"""
+    # Static files run no SQL; a header on them would only defeat shared caches
+    if app.config['SQL_INSTRUMENTATION'] and request.endpoint != 'static':
+        _sql_local.stats = RequestSqlStats(request.endpoint or request.path)
+
+@app.after_request
+def report_sql_instrumentation(response):
+    """Add a Server-Timing header and fold the request into the summary"""
+    stats = getattr(_sql_local, 'stats', None)
+    if stats is None:
+        return response
+    _sql_local.stats = None
+    elapsed = time.perf_counter() - stats.started
+    timings = [
+        f'sql;dur={stats.total * 1000:.1f};desc="{stats.count} queries"',
+        f'app;dur={elapsed * 1000:.1f}',
+    ]
+    # Statement text is only for admins and debug runs; everyone sees the totals.
+    # The session is only read when there is something to show (it adds Vary: Cookie)
+    statements = stats.slowest() if stats.count and (app.debug or is_admin_logged_in()) else []
+    for i, (sql, executions, seconds) in enumerate(statements, 1):
+        label = sql[:60].replace('"', "'").replace('\\', '/').encode('ascii', 'replace').decode()
+        timings.append(f'sql-{i};dur={seconds * 1000:.1f};desc="{executions}x {label}"')
+    response.headers['Server-Timing'] = ', '.join(timings)
+    sql_stats.record(stats)
+    return response
+
+@app.teardown_request
+def clear_sql_instrumentation(exception=None):
+    """Stop counting even if the request failed before after_request ran"""
+    _sql_local.stats = None
+
+@app.route('/admin/sql-stats', methods=['GET', 'POST'])
+@csrf.exempt
+def admin_sql_stats():
+    """Per-endpoint query counts and the most expensive statements since startup"""
+    if not is_admin_logged_in():
+        return jsonify({'success': False, 'message': 'Admin authentication required'}), 401
+    if request.method == 'POST' and request.args.get('reset') == '1':
+        sql_stats.reset()
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 200))
+    except ValueError:
+        limit = 20
+    return jsonify({'success': True, **sql_stats.summary(limit)})
+
+# Metrics
+# Each process keeps its counters in memory (one lock, a dict update per
+# request) and a background thread writes their absolute values to a small
+# side database every few seconds. /metrics sums the rows of all processes,
+# so any worker can answer a scrape.
+app.config['METRICS_ENABLED'] = os.environ.get('EXAM_METRICS', '1') != '0'
+app.config['METRICS_DB'] = os.environ.get('EXAM_METRICS_DB', '')  # default: <database>_metrics.db
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('EXAM_METRICS_FLUSH_INTERVAL', '5'))  # seconds
+app.config['METRICS_TOKEN'] = os.environ.get('EXAM_METRICS_TOKEN', '')  # Bearer token for scrapers
+# Processes silent for this many flush intervals are retired: their counters
+# are folded into one row per series and their own rows deleted
+app.config['METRICS_RETIRE_AFTER'] = int(os.environ.get('EXAM_METRICS_RETIRE_AFTER', '12'))  # flush intervals
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Instance holding the summed counters of retired processes
+RETIRED_METRICS_INSTANCE = 'retired'
+
+# name -> (type, help); gauges of processes that stopped flushing are dropped
+METRIC_FAMILIES = {
+    'exam_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status'),
+    'exam_http_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+    'exam_http_requests_in_flight': ('gauge', 'Requests currently being handled'),
+    'exam_password_queue_depth': ('gauge', 'Password hashing calls waiting for a worker'),
+    'exam_password_running': ('gauge', 'Password hashing calls running'),
+    'exam_password_rejected_total': ('counter', 'Password hashing calls rejected because the pool was full'),
+    'exam_sqlite_busy_errors_total': ('counter', 'Statements that failed with SQLITE_BUSY/LOCKED after busy_timeout retries'),
+    'exam_sessions_started_total': ('counter', 'Exam sessions started'),
+    'exam_sessions_submitted_total': ('counter', 'Exam sessions submitted'),
+    'exam_sessions_expired_total': ('counter', 'Expired sessions finalized by the sweeper'),
+    'exam_sessions_abandoned': ('gauge', 'Unsubmitted sessions past their exam duration'),
+    'exam_admission_active': ('gauge', 'start_exam/submit_exam requests holding a writer slot'),
+    'exam_admission_queue_depth': ('gauge', 'Examinees waiting for a writer slot'),
+    'exam_admission_admitted_total': ('counter', 'Requests admitted by the admission controller'),
+    'exam_admission_queued_total': ('counter', 'Queue pages served instead of running the request'),
+    'exam_admission_wait_seconds_total': ('counter', 'Time admitted requests spent queued'),
+    'exam_group_commit_batches_total': ('counter', 'Transactions written by the submission group commit'),
+    'exam_group_commit_submissions_total': ('counter', 'Submissions written by the submission group commit'),
+    'exam_group_commit_pending': ('gauge', 'Graded submissions waiting for the group commit'),
+    'exam_autosave_requests_total': ('counter', 'Autosave requests accepted'),
+    'exam_autosave_rows_written_total': ('counter', 'Session rows written by autosave flushes'),
+    'exam_autosave_pending_sessions': ('gauge', 'Sessions with autosaved answers not yet written'),
+}
+
+def metric_labels(**labels):
+    """Render keyword labels in exposition format (key="value",...)"""
+    return ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for key, value in labels.items())
+
+class MetricsRegistry:
+    """In-process counters and histograms, aggregated across processes via SQLite"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._flusher = None
+        self._reset()
+    
+    def _reset(self):
+        self._pid = os.getpid()
+        self.instance = f'{self._pid}-{secrets.token_hex(4)}'
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self.in_flight = 0
+        self._flushed = False
+    
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Forked worker: start clean under a new instance id
+            self._reset()
+            self._flusher = None
+    
+    def inc(self, name, labels='', value=1):
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, labels, seconds):
+        with self._lock:
+            self._check_fork()
+            buckets = self.histograms.get(labels)
+            if buckets is None:
+                buckets = self.histograms[labels] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[len(LATENCY_BUCKETS)] += 1
+            buckets[-1] += seconds
+    
+    def request_started(self):
+        with self._lock:
+            self._check_fork()
+            self.in_flight += 1
+            if self._flusher is None:
+                self._start_flusher()
+    
+    def request_finished(self):
+        with self._lock:
+            self.in_flight -= 1
+    
+    def snapshot(self):
+        """This process's series as (name, labels, kind, value) rows"""
+        hasher = password_hasher.stats()
+        with self._lock:
+            rows = [(name, labels, METRIC_FAMILIES[name][0], value)
+                    for (name, labels), value in self.counters.items()]
+            for labels, buckets in self.histograms.items():
+                cumulative = 0
+                prefix = f'{labels},' if labels else ''
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets[:-1]):
+                    cumulative += count
+                    rows.append(('exam_http_request_duration_seconds_bucket', f'{prefix}le="{bound}"', 'counter', cumulative))
+                rows.append(('exam_http_request_duration_seconds_sum', labels, 'counter', buckets[-1]))
+                rows.append(('exam_http_request_duration_seconds_count', labels, 'counter', cumulative))
+            rows.append(('exam_http_requests_in_flight', '', 'gauge', self.in_flight))
+        rows.append(('exam_password_queue_depth', '', 'gauge', hasher['queue_depth']))
+        rows.append(('exam_password_running', '', 'gauge', hasher['running']))
+        rows.append(('exam_password_rejected_total', '', 'counter', hasher['rejected'] + hasher['timed_out']))
+        rows.append(('exam_autosave_pending_sessions', '', 'gauge', autosave_buffer.stats()['pending_sessions']))
+        admission = admission_controller.stats()
+        rows.append(('exam_admission_active', '', 'gauge', admission['active']))
+        rows.append(('exam_admission_queue_depth', '', 'gauge', admission['queue_depth']))
+        rows.append(('exam_admission_admitted_total', '', 'counter', admission['admitted']))
+        rows.append(('exam_admission_queued_total', '', 'counter', admission['queued']))
+        rows.append(('exam_admission_wait_seconds_total', '', 'counter', admission['total_wait_seconds']))
+        rows.append(('exam_group_commit_pending', '', 'gauge', group_commit_writer.stats()['pending']))
+        return rows
+    
+    def _database(self):
+        if app.config['METRICS_DB']:
+            return app.config['METRICS_DB']
+        return os.path.splitext(DATABASE)[0] + '_metrics.db'
+    
+    def _connect(self):
+        conn = sqlite3.connect(self._database(), timeout=5)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = OFF')  # Lost metrics on power failure are acceptable
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS metric_instances (
+                instance TEXT PRIMARY KEY,
+                pid INTEGER,
+                heartbeat REAL NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS metric_values (
+                instance TEXT NOT NULL,
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (instance, name, labels)
+            ) WITHOUT ROWID
+        ''')
+        return conn
+    
+    def _restart_counts(self):
+        """Continue under a new instance id with empty counters (in_flight is kept)"""
+        with self._lock:
+            self.instance = f'{self._pid}-{secrets.token_hex(4)}'
+            self.counters = {}
+            self.histograms = {}
+            self._flushed = False
+    
+    def flush(self):
+        """Write this process's absolute values and retire processes that went silent"""
+        rows = self.snapshot()
+        conn = self._connect()
         try:
-            cursor.execute("ALTER TABLE exam_sessions ADD COLUMN answers_detail TEXT")
-            conn.commit()
-            print("Added 'answers_detail' column to exam_sessions table")
-        except sqlite3.OperationalError:
-            pass  # Column might have been added by another process
+            with conn:
+                now = time.time()
+                known = conn.execute('SELECT 1 FROM metric_instances WHERE instance = ?', (self.instance,)).fetchone()
+                if known is None and self._flushed:
+                    # Stalled long enough to be retired: the counters flushed so far are
+                    # already summed into the retired rows (the last interval is lost)
+                    self._restart_counts()
+                    rows = self.snapshot()
+                conn.execute('INSERT OR REPLACE INTO metric_instances (instance, pid, heartbeat) VALUES (?, ?, ?)',
+                             (self.instance, self._pid, now))
+                conn.executemany('''
+                    INSERT INTO metric_values (instance, name, labels, kind, value) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (instance, name, labels) DO UPDATE SET value = excluded.value
+                ''', [(self.instance, name, labels, kind, value) for name, labels, kind, value in rows])
+                self.retire_instances(conn, now - app.config['METRICS_RETIRE_AFTER'] * app.config['METRICS_FLUSH_INTERVAL'])
+            self._flushed = True
+        finally:
+            conn.close()
     
-    # Check if answers_detail column exists in exam_sessions
-    cursor.execute("PRAGMA table_info(exam_sessions)")
-    columns = [col['name'] for col in cursor.fetchall()]
+    def retire_instances(self, conn, heartbeat_before):
+        """Fold the counters of processes silent since heartbeat_before into the retired rows
+        
+        Keeps the summed counters monotonic across worker restarts while the
+        tables stay bounded by the number of live processes.
+        """
+        dead = [row[0] for row in conn.execute(
+            'SELECT instance FROM metric_instances WHERE heartbeat < ? AND instance != ?',
+            (heartbeat_before, RETIRED_METRICS_INSTANCE))]
+        if not dead:
+            return 0
+        placeholders = ','.join('?' * len(dead))
+        conn.execute('INSERT OR IGNORE INTO metric_instances (instance, pid, heartbeat) VALUES (?, NULL, 0)',
+                     (RETIRED_METRICS_INSTANCE,))
+        conn.execute(f'''
+            INSERT INTO metric_values (instance, name, labels, kind, value)
+            SELECT ?, name, labels, kind, SUM(value) FROM metric_values
+            WHERE kind = 'counter' AND instance IN ({placeholders})
+            GROUP BY name, labels
+            ON CONFLICT (instance, name, labels) DO UPDATE SET value = value + excluded.value
+        ''', [RETIRED_METRICS_INSTANCE] + dead)
+        conn.execute(f'DELETE FROM metric_values WHERE instance IN ({placeholders})', dead)
+        conn.execute(f'DELETE FROM metric_instances WHERE instance IN ({placeholders})', dead)
+        return len(dead)
+    
+    def _start_flusher(self):
+        interval = app.config['METRICS_FLUSH_INTERVAL']
+        
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Metrics flush failed: {e}")
+        
+        self._flusher = threading.Thread(target=loop, name='metrics-flush', daemon=True)
+        self._flusher.start()
     
-    # Add answers_detail column if it doesn't exist
-    if 'answers_detail' not in columns:
+    def collect(self):
+        """Sum every process's series; gauges only from processes that are still flushing"""
         try:
-            cursor.execute("ALTER TABLE exam_sessions ADD COLUMN answers_detail TEXT")
-            conn.commit()
-            print("Added 'answers_detail' column to exam_sessions table")
-        except sqlite3.OperationalError:
-            pass  # Column might have been added by another process
+            self.flush()
+            conn = self._connect()
+            try:
+                stale_before = time.time() - 3 * app.config['METRICS_FLUSH_INTERVAL']
+                return conn.execute('''
+                    SELECT v.name, v.labels, SUM(v.value)
+                    FROM metric_values v
+                    JOIN metric_instances i ON i.instance = v.instance
+                    WHERE v.kind = 'counter' OR i.heartbeat >= ?
+                    GROUP BY v.name, v.labels
+                ''', (stale_before,)).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Metrics aggregation unavailable, serving this process only: {e}")
+            return [(name, labels, value) for name, labels, kind, value in self.snapshot()]
+
+metrics = MetricsRegistry()
+
+@atexit.register
+def flush_metrics_at_exit():
+    """Keep the counters of a worker that is shutting down"""
+    if metrics.counters:
+        try:
+            metrics.flush()
+        except sqlite3.Error:
+            pass
+
+def count_sqlite_busy(error):
+    """Count SQLITE_BUSY/LOCKED failures (raised once busy_timeout has run out)"""
+    message = str(error)
+    if 'locked' in message or 'busy' in message:
+        metrics.inc('exam_sqlite_busy_errors_total')
+
+def abandoned_session_counts(conn):
+    """Unsubmitted sessions whose exam duration has run out, per exam"""
+    return conn.execute('''
+        SELECT es.exam_id, COUNT(*)
+        FROM exam_sessions es
+        JOIN exams e ON e.id = es.exam_id
+        WHERE es.is_completed = 0
+          AND julianday(es.start_time) + e.duration_minutes / 1440.0 < julianday('now', 'localtime')
+        GROUP BY es.exam_id
+    ''').fetchall()
+
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_ENABLED'] and request.endpoint != 'static':
+        g.metrics_started = time.perf_counter()
+        metrics.request_started()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.observe(metric_labels(endpoint=endpoint), time.perf_counter() - started)
+        metrics.inc('exam_http_requests_total',
+                    metric_labels(endpoint=endpoint, method=request.method, status=response.status_code))
+        g.metrics_finished = True
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exception=None):
+    if g.pop('metrics_finished', False) or g.pop('metrics_started', None) is not None:
+        metrics.request_finished()
+
+def metric_sort_key(row):
+    """Order series by name and labels, with histogram buckets in ascending le order"""
+    name, labels, _ = row
+    base, _, le = labels.partition('le="')
+    return (name, base, float(le.rstrip('"')) if le else 0.0)
+
+@app.route('/metrics')
+@csrf.exempt
+def metrics_endpoint():
+    """Prometheus text-format metrics for all worker processes"""
+    token = app.config['METRICS_TOKEN']
+    # Without a token only direct local scrapes are trusted: a reverse proxy on
+    # the same host also connects from loopback but adds forwarding headers
+    proxied = any(header in request.headers for header in ('X-Forwarded-For', 'X-Real-IP', 'Forwarded'))
+    authorized = (is_admin_logged_in()
+                  or (token and secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'))
+                  or (not token and not proxied and request.remote_addr in ('127.0.0.1', '::1')))
+    if not authorized:
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    
+    series = {}
+    for name, labels, value in metrics.collect():
+        family = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRIC_FAMILIES:
+                family = name[:-len(suffix)]
+        series.setdefault(family, []).append((name, labels, value))
+    try:
+        series['exam_sessions_abandoned'] = [
+            ('exam_sessions_abandoned', metric_labels(exam_id=exam_id), count)
+            for exam_id, count in abandoned_session_counts(get_db_connection())
+        ]
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not count abandoned sessions: {e}")
+    
+    lines = []
+    for family, (kind, help_text) in METRIC_FAMILIES.items():
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for name, labels, value in sorted(series.get(family, []), key=metric_sort_key):
+            value = int(value) if float(value).is_integer() else round(value, 6)
+            lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+    response = Response('\n'.join(lines) + '\n', mimetype='text/plain')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+# Schema migrations
+# Each step is numbered and idempotent; PRAGMA user_version records the last
+# step applied so a fully migrated database only costs one PRAGMA read at boot.
+MIGRATIONS = []
+
+def migration(version, description):
+    """Register a numbered schema migration step"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+def table_columns(conn, table):
+    """Return the column names of a table (empty list if it does not exist)"""
+    return [col[1] for col in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+
+def add_column(conn, table, column, definition):
+    """Add a column if it is missing; returns True when the column was added"""
+    if column in table_columns(conn, table):
+        return False
+    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    print(f"Added '{column}' column to {table} table")
+    return True
 
-    conn.executescript('''
-        -- Users table
+@migration(1, 'Create base tables')
+def migration_001_base_tables(conn):
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             nsi_id TEXT UNIQUE NOT NULL,
             name TEXT NOT NULL,
             wing_name TEXT,
-            internal_type TEXT,
-            border_type TEXT,
-            external_type TEXT,
-            country_name TEXT,
-            division_name TEXT,
             district_name TEXT,
             section_name TEXT,
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        
-        -- Admin table
+        )
+    ''')
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS admins (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        
-        -- Questions table
+        )
+    ''')
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS questions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             question_text TEXT NOT NULL,
@@ -772,9 +1572,9 @@ def init_database():
             difficulty TEXT DEFAULT 'medium',
             subject TEXT DEFAULT 'general',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        
-        -- Exams table
+        )
+    ''')
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS exams (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
@@ -785,9 +1585,9 @@ def init_database():
             max_attempts INTEGER DEFAULT 1,
             is_active BOOLEAN DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        
-        -- Exam sessions table
+        )
+    ''')
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS exam_sessions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -796,45 +1596,122 @@ def init_database():
             end_time TIMESTAMP,
             score INTEGER,
             answers TEXT,
-            answers_detail TEXT,
             is_completed BOOLEAN DEFAULT 0,
-            questions_json TEXT,
             FOREIGN KEY (user_id) REFERENCES users (id),
             FOREIGN KEY (exam_id) REFERENCES exams (id)
-        );
+        )
     ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS exam_controls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            show_result_immediately BOOLEAN DEFAULT 1,
+            enable_copy_protection BOOLEAN DEFAULT 1,
+            enable_screenshot_block BOOLEAN DEFAULT 1,
+            enable_tab_switch_detect BOOLEAN DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS system_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            registration_enabled INTEGER DEFAULT 1,
+            maintenance_mode INTEGER DEFAULT 0,
+            db_backup_path TEXT DEFAULT 'backups/',
+            last_backup_time TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+@migration(2, 'Add wing location columns to users')
+def migration_002_user_locations(conn):
+    for column in ['division_name', 'internal_type', 'border_type', 'external_type', 'country_name']:
+        add_column(conn, 'users', column, 'TEXT')
+
+@migration(3, 'Add profile completion tracking to users')
+def migration_003_profile_completed(conn):
+    # Formerly migrate_profile_completion.py: users registered before the
+    # two-step signup already have their wing details, so mark them complete
+    if add_column(conn, 'users', 'profile_completed', 'INTEGER DEFAULT 0'):
+        updated = conn.execute('UPDATE users SET profile_completed = 1 WHERE wing_name IS NOT NULL').rowcount
+        print(f"Marked {updated} existing users as profile_completed = 1")
+
+@migration(4, 'Add media and category columns to questions')
+def migration_004_question_media(conn):
+    add_column(conn, 'questions', 'question_image', 'TEXT')
+    add_column(conn, 'questions', 'question_youtube', 'TEXT')
+    for opt in 'abcdef':
+        add_column(conn, 'questions', f'option_{opt}_image', 'TEXT')
+    add_column(conn, 'questions', 'category', 'TEXT')
+    
+    # Formerly migrate_question_categories.py; empty strings are stored for
+    # missing media by the admin forms, so they do not count as media
+    updated = conn.execute('''
+        UPDATE questions 
+        SET category = CASE
+            WHEN NULLIF(question_image, '') IS NOT NULL OR 
+                 NULLIF(option_a_image, '') IS NOT NULL OR 
+                 NULLIF(option_b_image, '') IS NOT NULL OR 
+                 NULLIF(option_c_image, '') IS NOT NULL OR 
+                 NULLIF(option_d_image, '') IS NOT NULL OR 
+                 NULLIF(option_e_image, '') IS NOT NULL OR 
+                 NULLIF(option_f_image, '') IS NOT NULL THEN 'image'
+            WHEN NULLIF(question_youtube, '') IS NOT NULL THEN 'video'
+            WHEN difficulty IS NOT NULL THEN difficulty
+            ELSE 'medium'
+        END
+        WHERE category IS NULL
+    ''').rowcount
+    if updated:
+        print(f"Assigned categories to {updated} questions")
+
+@migration(5, 'Add scheduling and category config to exams')
+def migration_005_exam_scheduling(conn):
+    add_column(conn, 'exams', 'category_config', 'TEXT')
+    add_column(conn, 'exams', 'scheduled_start', 'TIMESTAMP')
+    add_column(conn, 'exams', 'scheduled_end', 'TIMESTAMP')
+
+@migration(6, 'Add question snapshot, answer detail and duration to exam_sessions')
+def migration_006_session_details(conn):
+    add_column(conn, 'exam_sessions', 'questions_json', 'TEXT')
+    add_column(conn, 'exam_sessions', 'answers_detail', 'TEXT')
+    if add_column(conn, 'exam_sessions', 'duration_minutes', 'REAL'):
+        conn.execute('''
+            UPDATE exam_sessions 
+            SET duration_minutes = ROUND((julianday(end_time) - julianday(start_time)) * 24 * 60, 2)
+            WHERE is_completed = 1 AND start_time IS NOT NULL AND end_time IS NOT NULL
+        ''')
+        print("Updated existing exam sessions with calculated durations")
+
+@migration(7, 'Add exam control and system setting columns with defaults')
+def migration_007_controls_and_settings(conn):
+    add_column(conn, 'exam_controls', 'show_result_history', 'BOOLEAN DEFAULT 1')
+    add_column(conn, 'exam_controls', 'show_rankings', 'BOOLEAN DEFAULT 1')
+    add_column(conn, 'exam_controls', 'allow_answer_review', 'BOOLEAN DEFAULT 1')
+    if conn.execute('SELECT COUNT(*) FROM exam_controls').fetchone()[0] == 0:
+        conn.execute('''
+            INSERT INTO exam_controls 
+            (id, show_result_immediately, show_result_history, show_rankings, allow_answer_review,
+             enable_copy_protection, enable_screenshot_block, enable_tab_switch_detect) 
+            VALUES (1, 1, 1, 1, 1, 1, 1, 1)
+        ''')
+        print("Initialized exam_controls with default values")
     
-    # Check if required columns exist in questions table
-    cursor = conn.cursor()
-    cursor.execute("PRAGMA table_info(questions)")
-    columns = [col['name'] for col in cursor.fetchall()]
-    
-    required_columns = {
-        'question_text': {'type': 'TEXT', 'not_null': True, 'default': "''"},
-        'option_a': {'type': 'TEXT', 'not_null': True, 'default': "''"},
-        'option_b': {'type': 'TEXT', 'not_null': True, 'default': "''"},
-        'option_c': {'type': 'TEXT', 'not_null': True, 'default': "''"},
-        'option_d': {'type': 'TEXT', 'not_null': True, 'default': "''"},
-        'option_e': {'type': 'TEXT', 'not_null': False, 'default': None},
-        'option_f': {'type': 'TEXT', 'not_null': False, 'default': None},
-        'correct_option': {'type': 'TEXT', 'not_null': True, 'default': "'A'"},
-        'difficulty': {'type': 'TEXT', 'not_null': False, 'default': "'medium'"},
-        'subject': {'type': 'TEXT', 'not_null': False, 'default': "'general'"}
-    }
-    
-    for col_name, col_info in required_columns.items():
-        if col_name not in columns:
-            col_def = f"{col_info['type']}"
-            if col_info['not_null']:
-                col_def += f" NOT NULL DEFAULT {col_info['default']}"
-            elif col_info['default']:
-                col_def += f" DEFAULT {col_info['default']}"
-            cursor.execute(f"ALTER TABLE questions ADD COLUMN {col_name} {col_def}")
-            conn.commit()
-            print(f"Added '{col_name}' column to questions table")
-    
-    # Ensure no NULL values in required columns
-    cursor.execute('''
+    add_column(conn, 'system_settings', 'exams_enabled', 'INTEGER DEFAULT 1')
+    add_column(conn, 'system_settings', 'exam_window_start', 'TIMESTAMP')
+    add_column(conn, 'system_settings', 'exam_window_end', 'TIMESTAMP')
+    add_column(conn, 'system_settings', 'last_backup_time', 'TIMESTAMP')
+    if conn.execute('SELECT COUNT(*) FROM system_settings').fetchone()[0] == 0:
+        conn.execute('''
+            INSERT INTO system_settings 
+            (id, registration_enabled, maintenance_mode, exams_enabled, created_at, updated_at) 
+            VALUES (1, 1, 0, 1, ?, ?)
+        ''', (datetime.now(), datetime.now()))
+        print("Initialized system_settings with default values")
+
+@migration(8, 'Normalize question data')
+def migration_008_normalize_questions(conn):
+    conn.execute('''
         UPDATE questions 
         SET 
             question_text = COALESCE(question_text, ''),
@@ -855,82 +1732,33 @@ def init_database():
             difficulty IS NULL OR 
             subject IS NULL
     ''')
-    conn.commit()
-    
     # Normalize correct_option to uppercase string
-    cursor.execute("UPDATE questions SET correct_option = UPPER(correct_option)")
-    conn.commit()
-    
-    # Check for questions_json in exam_sessions
-    cursor.execute("PRAGMA table_info(exam_sessions)")
-    es_columns = [col['name'] for col in cursor.fetchall()]
-    if 'questions_json' not in es_columns:
-        cursor.execute("ALTER TABLE exam_sessions ADD COLUMN questions_json TEXT")
-        conn.commit()
-        print("Added 'questions_json' column to exam_sessions table")
-    
-    # Check for duration_minutes in exam_sessions
-    if 'duration_minutes' not in es_columns:
-        cursor.execute("ALTER TABLE exam_sessions ADD COLUMN duration_minutes REAL")
-        conn.commit()
-        print("Added 'duration_minutes' column to exam_sessions table")
-        
-        # Update existing records with calculated duration
-        cursor.execute('''
-            UPDATE exam_sessions 
-            SET duration_minutes = CASE 
-                WHEN start_time IS NOT NULL AND end_time IS NOT NULL 
-                THEN ROUND((julianday(end_time) - julianday(start_time)) * 24 * 60, 2)
-                ELSE NULL 
-            END
-            WHERE is_completed = 1
-        ''')
-        conn.commit()
-        print("Updated existing exam sessions with calculated durations")
-    
-    # Check if internal_type column exists in users table
-    cursor.execute("PRAGMA table_info(users)")
-    user_columns = [col['name'] for col in cursor.fetchall()]
-    if 'internal_type' not in user_columns:
-        cursor.execute("ALTER TABLE users ADD COLUMN internal_type TEXT")
-        conn.commit()
-        print("Added 'internal_type' column to users table")
-    
-    # Check if border_type column exists in users table
-    cursor.execute("PRAGMA table_info(users)")
-    user_columns = [col['name'] for col in cursor.fetchall()]
-    if 'border_type' not in user_columns:
-        cursor.execute("ALTER TABLE users ADD COLUMN border_type TEXT")
-        conn.commit()
-        print("Added 'border_type' column to users table")
-    
-    # Check if external_type column exists in users table
-    cursor.execute("PRAGMA table_info(users)")
-    user_columns = [col['name'] for col in cursor.fetchall()]
-    if 'external_type' not in user_columns:
-        cursor.execute("ALTER TABLE users ADD COLUMN external_type TEXT")
-        conn.commit()
-        print("Added 'external_type' column to users table")
+    conn.execute('UPDATE questions SET correct_option = UPPER(correct_option) WHERE correct_option != UPPER(correct_option)')
+
+@migration(9, 'Migrate admin passwords to bcrypt')
+def migration_009_bcrypt_admins(conn):
+    add_column(conn, 'admins', 'password_change_required', 'INTEGER DEFAULT 0')
     
-    # Check if country_name column exists in users table
-    cursor.execute("PRAGMA table_info(users)")
-    user_columns = [col['name'] for col in cursor.fetchall()]
-    if 'country_name' not in user_columns:
-        cursor.execute("ALTER TABLE users ADD COLUMN country_name TEXT")
-        conn.commit()
-        print("Added 'country_name' column to users table")
+    # SHA-256 hashes are 64 hex characters; reset to the default and force a change
+    admin = conn.execute('SELECT id, password_hash FROM admins WHERE username = ?', ('admin',)).fetchone()
+    if admin and len(admin['password_hash']) == 64:
+        conn.execute('UPDATE admins SET password_hash = ?, password_change_required = 1 WHERE id = ?', 
+                     (hash_password('admin123'), admin['id']))
+        print("Admin password migrated to bcrypt and marked for password change")
     
-    # Check if admin exists
-    admin_exists = conn.execute('SELECT COUNT(*) FROM admins').fetchone()[0]
-    if admin_exists == 0:
-        admin_password = hash_password('admin123')
+    sha256_users = conn.execute('SELECT COUNT(*) FROM users WHERE LENGTH(password_hash) = 64').fetchone()[0]
+    if sha256_users:
+        print(f"⚠️  Found {sha256_users} users with old SHA-256 passwords")
+        print("💡 Run 'python migrate_user_passwords.py' to migrate them to bcrypt format")
+
+@migration(10, 'Seed default admin, sample questions and sample exam')
+def migration_010_seed_data(conn):
+    if conn.execute('SELECT COUNT(*) FROM admins').fetchone()[0] == 0:
         conn.execute('INSERT INTO admins (username, password_hash) VALUES (?, ?)', 
-                    ('admin', admin_password))
+                     ('admin', hash_password('admin123')))
         print("Admin user created: admin / admin123")
     
-    # Check if questions exist
-    question_count = conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
-    if question_count == 0:
+    if conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0] == 0:
         sample_questions = [
             ("What is the capital of Bangladesh?", "Dhaka", "Chittagong", "Sylhet", "Rajshahi", "", "", "A", "easy", "geography"),
             ("Which programming language is known for web development?", "Python", "JavaScript", "C++", "Java", "PHP", "Ruby", "B", "medium", "programming"),
@@ -943,42 +1771,780 @@ def init_database():
             ("What does CPU stand for?", "Central Processing Unit", "Computer Personal Unit", "Central Program Unit", "Computer Processing Unit", "", "", "A", "medium", "technology"),
             ("Which country has the most time zones?", "USA", "Russia", "China", "Canada", "", "", "B", "hard", "geography")
         ]
-        
-        for q in sample_questions:
-            conn.execute('''INSERT INTO questions 
-                           (question_text, option_a, option_b, option_c, option_d, option_e, option_f, correct_option, difficulty, subject) 
-                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', q)
-        
+        conn.executemany('''INSERT INTO questions 
+                            (question_text, option_a, option_b, option_c, option_d, option_e, option_f, correct_option, difficulty, subject, category) 
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', [q + (q[8],) for q in sample_questions])
         print("Sample questions created")
     
-    # Check if exam exists
-    exam_count = conn.execute('SELECT COUNT(*) FROM exams').fetchone()[0]
-    if exam_count == 0:
+    if conn.execute('SELECT COUNT(*) FROM exams').fetchone()[0] == 0:
         conn.execute('''INSERT INTO exams 
-                       (title, description, duration_minutes, num_questions, passing_score, max_attempts, is_active) 
-                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                    ('General Knowledge Test', 'A comprehensive test covering various topics', 30, 10, 60, 1, 1))
+                        (title, description, duration_minutes, num_questions, passing_score, max_attempts, is_active) 
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     ('General Knowledge Test', 'A comprehensive test covering various topics', 30, 10, 60, 1, 1))
         print("Sample exam created")
+
+# Managed secondary indexes for the hot exam_sessions / questions / users queries
+MANAGED_INDEXES = {
+    'idx_exam_sessions_user_exam':
+        'CREATE INDEX IF NOT EXISTS idx_exam_sessions_user_exam ON exam_sessions (user_id, exam_id, is_completed)',
+    'idx_exam_sessions_exam_ranking':
+        'CREATE INDEX IF NOT EXISTS idx_exam_sessions_exam_ranking ON exam_sessions (exam_id, is_completed, score DESC, duration_minutes, end_time)',
+    'idx_exam_sessions_completed_ranking':
+        'CREATE INDEX IF NOT EXISTS idx_exam_sessions_completed_ranking ON exam_sessions (is_completed, score DESC, duration_minutes, end_time)',
+    'idx_exam_sessions_completed_end_time':
+        'CREATE INDEX IF NOT EXISTS idx_exam_sessions_completed_end_time ON exam_sessions (is_completed, end_time)',
+    'idx_exam_sessions_user_completed_end_time':
+        'CREATE INDEX IF NOT EXISTS idx_exam_sessions_user_completed_end_time ON exam_sessions (user_id, is_completed, end_time)',
+    'idx_questions_difficulty':
+        'CREATE INDEX IF NOT EXISTS idx_questions_difficulty ON questions (difficulty)',
+    'idx_questions_category':
+        'CREATE INDEX IF NOT EXISTS idx_questions_category ON questions (category)',
+    'idx_exams_is_active':
+        'CREATE INDEX IF NOT EXISTS idx_exams_is_active ON exams (is_active)',
+    'idx_exams_scheduled_start':
+        'CREATE INDEX IF NOT EXISTS idx_exams_scheduled_start ON exams (scheduled_start)',
+    'idx_users_created_at':
+        'CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)',
+}
+
+def ensure_managed_indexes(conn):
+    """Create any managed index that is missing"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    for name, sql in MANAGED_INDEXES.items():
+        if name not in existing:
+            conn.execute(sql)
+            print(f"Created index {name}")
+
+@migration(11, 'Create managed index set for hot queries')
+def migration_011_managed_indexes(conn):
+    # No ANALYZE here: on small databases the statistics make the planner prefer
+    # table scans, which would then look like regressions to check_query_plans()
+    ensure_managed_indexes(conn)
+
+@migration(12, 'Add cache version counters for the question bank')
+def migration_012_cache_versions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('questions', 0)")
+    # Triggers keep the counter right for every writer (other workers, scripts)
+    for event in ['INSERT', 'UPDATE', 'DELETE']:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_questions_version_{event.lower()}
+            AFTER {event} ON questions
+            BEGIN
+                UPDATE cache_versions SET version = version + 1 WHERE name = 'questions';
+            END
+        ''')
+
+# Question content columns captured in question_revisions snapshots
+QUESTION_CONTENT_COLUMNS = [
+    'question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'option_e', 'option_f',
+    'correct_option', 'difficulty', 'category', 'question_image', 'question_youtube',
+    'option_a_image', 'option_b_image', 'option_c_image', 'option_d_image', 'option_e_image', 'option_f_image',
+]
+
+@migration(13, 'Add question versions, revision history and compact session papers')
+def migration_013_question_versions(conn):
+    add_column(conn, 'questions', 'version', 'INTEGER NOT NULL DEFAULT 1')
+    add_column(conn, 'exam_sessions', 'paper', 'TEXT')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_revisions (
+            question_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            snapshot TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (question_id, version)
+        )
+    ''')
+    snapshot = 'json_object(' + ', '.join(f"'{col}', OLD.{col}" for col in QUESTION_CONTENT_COLUMNS) + ')'
+    # Papers reference (question id, version); keep the old content whenever a
+    # question is edited or deleted so earlier papers can still be rebuilt
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_questions_revision_update
+        BEFORE UPDATE ON questions WHEN NEW.version = OLD.version
+        BEGIN
+            INSERT OR IGNORE INTO question_revisions (question_id, version, snapshot)
+            VALUES (OLD.id, OLD.version, {snapshot});
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_questions_version_bump
+        AFTER UPDATE ON questions WHEN NEW.version = OLD.version
+        BEGIN
+            UPDATE questions SET version = OLD.version + 1 WHERE id = NEW.id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_questions_revision_delete
+        BEFORE DELETE ON questions
+        BEGIN
+            INSERT OR IGNORE INTO question_revisions (question_id, version, snapshot)
+            VALUES (OLD.id, OLD.version, {snapshot});
+        END
+    ''')
+
+@migration(14, 'Convert legacy questions_json papers to the compact format')
+def migration_014_compact_papers(conn):
+    converted, kept = convert_legacy_papers(conn)
+    print(f"Converted {converted} legacy exam papers ({kept} left in questions_json)")
+
+@migration(15, 'Normalize graded answers into session_answers')
+def migration_015_session_answers(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_answers (
+            session_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            selected TEXT,
+            correct TEXT,
+            is_correct INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (session_id, question_id),
+            FOREIGN KEY (session_id) REFERENCES exam_sessions (id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_session_answers_question ON session_answers (question_id, is_correct)')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_exam_sessions_delete_answers
+        AFTER DELETE ON exam_sessions
+        BEGIN
+            DELETE FROM session_answers WHERE session_id = OLD.id;
+        END
+    ''')
+    # Compatibility view with the shape of the old answers/answers_detail JSON columns
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS exam_session_answers_json AS
+        SELECT 
+            session_id,
+            COALESCE(json_group_object(CAST(question_id AS TEXT), selected) FILTER (WHERE selected IS NOT NULL), '{}') AS answers,
+            json_group_object(CAST(question_id AS TEXT), json_object(
+                'selected_answer', selected,
+                'correct_answer', correct,
+                'is_correct', json(CASE WHEN is_correct THEN 'true' ELSE 'false' END)
+            )) AS answers_detail
+        FROM session_answers
+        GROUP BY session_id
+    ''')
+    print(f"Backfilled answers of {backfill_session_answers(conn)} sessions into session_answers")
+
+@migration(16, 'Add materialized per-exam and global leaderboards')
+def migration_016_leaderboards(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS exam_leaderboard (
+            session_id INTEGER PRIMARY KEY,
+            exam_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            score_pct REAL NOT NULL DEFAULT 0,
+            duration_minutes REAL,
+            end_time TIMESTAMP,
+            rank INTEGER NOT NULL,
+            percentile INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_exam_leaderboard_exam_rank ON exam_leaderboard (exam_id, rank)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_exam_leaderboard_user ON exam_leaderboard (user_id, exam_id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS global_leaderboard (
+            user_id INTEGER PRIMARY KEY,
+            avg_score REAL NOT NULL DEFAULT 0,
+            avg_duration REAL,
+            completed_exams INTEGER NOT NULL DEFAULT 0,
+            earliest_submission TIMESTAMP,
+            rank INTEGER,
+            percentile INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_global_leaderboard_rank ON global_leaderboard (rank)')
+    update_leaderboards(conn)
+
+@migration(17, 'Add cache version counter for site settings')
+def migration_017_settings_version(conn):
+    conn.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('settings', 0)")
+    for table in ['exam_controls', 'system_settings']:
+        for event in ['INSERT', 'UPDATE', 'DELETE']:
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE cache_versions SET version = version + 1 WHERE name = 'settings';
+                END
+            ''')
+
+@migration(18, 'Add per-session autosave store')
+def migration_018_session_progress(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_progress (
+            session_id INTEGER PRIMARY KEY,
+            answers TEXT NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP
+        )
+    ''')
+    # Only ongoing sessions keep a row; whatever completes a session drops it
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_exam_sessions_completed_progress
+        AFTER UPDATE OF is_completed ON exam_sessions
+        WHEN NEW.is_completed = 1
+        BEGIN
+            DELETE FROM session_progress WHERE session_id = NEW.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_exam_sessions_delete_progress
+        AFTER DELETE ON exam_sessions
+        BEGIN
+            DELETE FROM session_progress WHERE session_id = OLD.id;
+        END
+    ''')
+
+@migration(19, 'Add partial index for expired session sweeps')
+def migration_019_open_sessions_index(conn):
+    # Superseded by the deadline index of migration 20, which drops it again
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_exam_sessions_open_start ON exam_sessions (exam_id, start_time) WHERE is_completed = 0')
+
+@migration(20, 'Add absolute deadlines to exam sessions')
+def migration_020_session_deadlines(conn):
+    add_column(conn, 'exam_sessions', 'deadline_at', 'TIMESTAMP')
+    conn.execute('''
+        UPDATE exam_sessions
+        SET deadline_at = (
+            SELECT strftime('%Y-%m-%dT%H:%M:%S', exam_sessions.start_time, '+' || e.duration_minutes || ' minutes')
+            FROM exams e WHERE e.id = exam_sessions.exam_id AND e.duration_minutes > 0
+        )
+        WHERE is_completed = 0 AND deadline_at IS NULL
+    ''')
+    conn.execute('DROP INDEX IF EXISTS idx_exam_sessions_open_start')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_exam_sessions_open_deadline ON exam_sessions (deadline_at) WHERE is_completed = 0')
+
+@migration(21, 'Add papers prepared ahead of scheduled exams')
+def migration_021_prepared_papers(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prepared_papers (
+            id INTEGER PRIMARY KEY,
+            exam_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            config TEXT NOT NULL,
+            paper TEXT NOT NULL,
+            created_at TIMESTAMP,
+            claimed_at TIMESTAMP
+        )
+    ''')
+    # One paper per examinee and exam: the claim lookup, and what keeps concurrent builders apart
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_prepared_papers_exam_user ON prepared_papers (exam_id, user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_prepared_papers_exam_claimed ON prepared_papers (exam_id, claimed_at)')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_exams_delete_prepared_papers
+        AFTER DELETE ON exams
+        BEGIN
+            DELETE FROM prepared_papers WHERE exam_id = OLD.id;
+        END
+    ''')
+
+@migration(22, 'Rank leaderboards incrementally')
+def migration_022_incremental_leaderboards(conn):
+    # Global ranks and all percentiles are computed on read now
+    conn.execute('DROP INDEX IF EXISTS idx_global_leaderboard_rank')
+    for table, column in [('exam_leaderboard', 'percentile'), ('global_leaderboard', 'rank'),
+                          ('global_leaderboard', 'percentile')]:
+        if column in table_columns(conn, table):
+            conn.execute(f'ALTER TABLE {table} DROP COLUMN {column}')
+    # Placing a session and counting a global rank walk these in leaderboard order
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_exam_leaderboard_exam_order
+        ON exam_leaderboard (exam_id, score_pct DESC, duration_minutes, end_time, session_id)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_global_leaderboard_order
+        ON global_leaderboard (avg_score DESC, avg_duration, earliest_submission, completed_exams DESC, user_id)
+    ''')
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    """Return the migration step recorded in PRAGMA user_version"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def run_migrations(dry_run=False, database=None):
+    """Apply pending schema migrations in order
     
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully")
+    Every step runs in its own BEGIN IMMEDIATE transaction together with the
+    user_version bump, so concurrent workers never apply a step twice.
+    Returns the list of (version, description) steps that were (or, with
+    dry_run=True, would be) applied.
+    """
+    conn = open_db_connection(database)
+    try:
+        current = get_schema_version(conn)
+        pending = [(version, description) for version, description, _ in MIGRATIONS if version > current]
+        if dry_run or not pending:
+            return pending
+        
+        applied = []
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Another worker may have migrated while we waited for the lock
+                if get_schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                step(conn)
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"Applied migration {version:03d}: {description}")
+            applied.append((version, description))
+        return applied
+    finally:
+        conn.close()
+
+def print_migration_plan(database=None):
+    """Print the pending migration steps without applying them"""
+    pending = run_migrations(dry_run=True, database=database)
+    if not pending:
+        print(f"Database schema is up to date (version {SCHEMA_VERSION})")
+        return pending
+    print(f"{len(pending)} pending migration(s):")
+    for version, description in pending:
+        print(f"  {version:03d}  {description}")
+    return pending
+
+# Hot query plan self-check
+# Queries registered here run on every exam start/submit or dashboard view.
+# At startup we EXPLAIN each one and warn when SQLite falls back to a scan.
+# Routes run the registered statement itself (a module constant next to the
+# route, or the query builder's unfiltered form), so the check cannot drift.
+HOT_QUERIES = {}
+
+def register_hot_query(name, sql, params=(), small_tables=()):
+    """Register a query whose plan must stay index-backed; returns sql
+    
+    Scans of small_tables (a handful of rows, where SQLite rightly prefers
+    a scan) are not reported.
+    """
+    HOT_QUERIES[name] = (sql, tuple(params), frozenset(small_tables))
+    return sql
+
+app.config['QUERY_PLAN_CHECK'] = os.environ.get('EXAM_QUERY_PLAN_CHECK', '1') != '0'
+
+def check_query_plans(conn=None):
+    """EXPLAIN every registered hot query; returns {name: [scan details]} for full scans"""
+    own_conn = conn is None
+    if own_conn:
+        conn = open_db_connection()
+    problems = {}
+    try:
+        for name, (sql, params, small_tables) in HOT_QUERIES.items():
+            try:
+                plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+            except sqlite3.Error as e:
+                problems[name] = [f'could not explain: {e}']
+                continue
+            # "SCAN <table>" without an index is a full table scan;
+            # "SCAN ... USING (COVERING) INDEX", "SEARCH" and scans of an
+            # already-reduced subquery result ("SCAN (subquery-N)") are fine
+            scans = [row[3] for row in plan
+                     if row[3].startswith('SCAN') and 'USING' not in row[3]
+                     and not row[3].startswith('SCAN (')
+                     and row[3].split()[1] not in small_tables]
+            if scans:
+                problems[name] = scans
+    finally:
+        if own_conn:
+            conn.close()
+    for name, scans in problems.items():
+        print(f"⚠️  Hot query '{name}' falls back to a full scan: {'; '.join(scans)}")
+    return problems
+
+_schema_checked_for = None
+_schema_lock = threading.Lock()
+
+@app.before_request
+def ensure_schema():
+    """Migrate the database once per process before serving the first request"""
+    global _schema_checked_for
+    if _schema_checked_for == DATABASE:
+        return
+    with _schema_lock:
+        if _schema_checked_for != DATABASE:
+            run_migrations()
+            if app.config['QUERY_PLAN_CHECK']:
+                check_query_plans()
+            _schema_checked_for = DATABASE
+
+# Password hashing
+app.config['BCRYPT_ROUNDS'] = int(os.environ.get('EXAM_BCRYPT_ROUNDS', '12'))
+app.config['PASSWORD_WORKERS'] = int(os.environ.get('EXAM_PASSWORD_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+# Request threads the server runs (waitress defaults to 4); password hashing
+# may occupy all but one of them
+app.config['SERVER_THREADS'] = int(os.environ.get('EXAM_SERVER_THREADS', '4'))
+app.config['PASSWORD_SLOTS'] = int(os.environ.get('EXAM_PASSWORD_SLOTS', str(max(1, app.config['SERVER_THREADS'] - 1))))  # queued + running calls
+app.config['PASSWORD_SLOT_WAIT'] = float(os.environ.get('EXAM_PASSWORD_SLOT_WAIT', '0.25'))  # seconds before a 503
+app.config['PASSWORD_TIMEOUT'] = float(os.environ.get('EXAM_PASSWORD_TIMEOUT', '3'))  # seconds
+
+class PasswordServiceBusy(Exception):
+    """The password hashing pool is saturated; the caller should retry later"""
+
+class PasswordHasher:
+    """Runs bcrypt on a small bounded thread pool
+    
+    bcrypt releases the GIL, so PASSWORD_WORKERS threads keep the spare cores
+    busy while request threads wait. At most PASSWORD_SLOTS request threads
+    (one less than the server has) may be queued or hashing at once; a call
+    that cannot get a slot within PASSWORD_SLOT_WAIT fails with
+    PasswordServiceBusy, so a login spike cannot tie up every request thread
+    (and with them submit_exam).
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self.pending = 0  # queued + running
+        self.running = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+    
+    def capacity(self):
+        return app.config['PASSWORD_SLOTS']
+    
+    def saturated(self):
+        """True while every worker is busy, i.e. new calls would queue"""
+        return self.pending >= app.config['PASSWORD_WORKERS']
+    
+    def _task_done(self, future):
+        with self._lock:
+            self.pending -= 1
+            if not future.cancelled():
+                self.completed += 1
+        # The slot is held until the hash is really done, even if the caller gave up
+        self._slots.release()
+    
+    def run(self, func, *args):
+        """Call func(*args) on the pool and wait for the result"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=app.config['PASSWORD_WORKERS'], thread_name_prefix='bcrypt')
+                self._slots = threading.BoundedSemaphore(self.capacity())
+            slots = self._slots
+        if not slots.acquire(timeout=app.config['PASSWORD_SLOT_WAIT']):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordServiceBusy('Password hashing queue is full')
+        with self._lock:
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+            executor = self._executor
+        queued_at = time.perf_counter()
+        
+        def task():
+            with self._lock:
+                self.running += 1
+                self.total_wait += time.perf_counter() - queued_at
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+        
+        future = executor.submit(task)
+        future.add_done_callback(self._task_done)
+        try:
+            return future.result(timeout=app.config['PASSWORD_TIMEOUT'])
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise PasswordServiceBusy('Timed out waiting for password hashing')
+    
+    def stats(self):
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                'workers': app.config['PASSWORD_WORKERS'],
+                'slots': self.capacity(),
+                'rounds': app.config['BCRYPT_ROUNDS'],
+                'queue_depth': self.pending - self.running,
+                'running': self.running,
+                'peak_pending': self.peak_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_wait_ms': round(self.total_wait * 1000 / started, 1) if started else 0.0,
+            }
+
+password_hasher = PasswordHasher()
 
 def hash_password(password):
-    """Hash password using bcrypt with salt"""
-    # Generate salt and hash password
-    salt = bcrypt.gensalt()
-    password_hash = bcrypt.hashpw(password.encode('utf-8'), salt)
+    """Hash password using bcrypt at the configured cost factor"""
+    salt = bcrypt.gensalt(rounds=app.config['BCRYPT_ROUNDS'])
+    password_hash = password_hasher.run(bcrypt.hashpw, password.encode('utf-8'), salt)
     return password_hash.decode('utf-8')
 
 def verify_password(password, hash_value):
     """Verify password against bcrypt hash"""
     try:
-        return bcrypt.checkpw(password.encode('utf-8'), hash_value.encode('utf-8'))
+        return password_hasher.run(bcrypt.checkpw, password.encode('utf-8'), hash_value.encode('utf-8'))
+    except PasswordServiceBusy:
+        raise
     except Exception as e:
         print(f"Password verification error: {e}")
         return False
 
+def password_needs_rehash(hash_value):
+    """True when a bcrypt hash was made with a different cost than BCRYPT_ROUNDS"""
+    try:
+        return int(hash_value.split('$')[2]) != app.config['BCRYPT_ROUNDS']
+    except (AttributeError, IndexError, ValueError):
+        return False
+
+def rehash_password(conn, table, row_id, password, hash_value):
+    """Upgrade a stored hash to the configured cost after a successful login
+    
+    Best effort: skipped while the hashing pool is busy, and the UPDATE only
+    applies if nobody changed the password in the meantime.
+    """
+    if not password_needs_rehash(hash_value) or password_hasher.saturated():
+        return
+    try:
+        new_hash = hash_password(password)
+        conn.execute(f'UPDATE {table} SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                     (new_hash, row_id, hash_value))
+        conn.commit()
+    except PasswordServiceBusy:
+        pass  # Picked up again on a later login
+    except sqlite3.Error as e:
+        print(f"Password rehash failed for {table} {row_id}: {e}")
+
+@app.errorhandler(PasswordServiceBusy)
+def password_service_busy(error):
+    """Fast rejection while the hashing pool is saturated: a 503 with Retry-After
+    
+    Browsers ignore Retry-After on redirects, so form posts get a small page
+    linking back to the form rather than a redirect with a flash message.
+    """
+    message = 'The server is busy right now. Please try again in a few seconds.'
+    retry_after = 5
+    if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        response = jsonify({'success': False, 'message': message})
+    else:
+        back_url = request.full_path if request.query_string else request.path
+        response = make_response(render_template('service_busy.html', message=message, retry_after=retry_after,
+                                                 method=request.method, back_url=back_url))
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# Admission control
+# start_exam and submit_exam each end in a SQLite write, and when an exam goes
+# live the whole cohort presses "Start" within seconds. At most
+# ADMISSION_WRITERS of these requests run at a time; the rest take a numbered
+# ticket and get a small "you're in the queue" page that retries after a
+# Retry-After estimate. Tickets are served strictly in issue order and a user
+# keeps one ticket across retries, so polling faster does not jump the queue.
+# Tickets that stop polling expire after ADMISSION_TICKET_TTL seconds. Keep
+# the writer cap below the waitress thread count so reads stay responsive.
+# A ticket remembers when its request first arrived, so time spent queued
+# does not count against a submit's deadline (as long as the retried request
+# is unchanged).
+app.config['ADMISSION_ENABLED'] = os.environ.get('EXAM_ADMISSION', '1') != '0'
+app.config['ADMISSION_WRITERS'] = int(os.environ.get('EXAM_ADMISSION_WRITERS', '4'))
+app.config['ADMISSION_WAIT'] = float(os.environ.get('EXAM_ADMISSION_WAIT', '1'))  # seconds held in-thread near the front
+app.config['ADMISSION_TICKET_TTL'] = float(os.environ.get('EXAM_ADMISSION_TICKET_TTL', '20'))  # seconds
+
+class AdmissionTicket:
+    __slots__ = ('user_id', 'issued', 'last_seen', 'waiting', 'requested_at', 'fingerprint')
+    
+    def __init__(self, user_id, now, fingerprint=None):
+        self.user_id = user_id
+        self.issued = now
+        self.last_seen = now
+        self.waiting = 0  # requests of this user blocked in admit() right now
+        self.requested_at = datetime.now()  # wall clock of the first attempt
+        self.fingerprint = fingerprint      # digest of that request
+
+class AdmissionController:
+    """FIFO admission of exam writers with a cap on concurrent requests
+    
+    Free slots go to the oldest ticket whose owner is waiting right now, so a
+    ticket holder between polls keeps its place without leaving slots idle;
+    once back it is served before everybody who queued after it.
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.queue = []    # AdmissionTicket, oldest first
+        self.tickets = {}  # user_id -> AdmissionTicket
+        self.active = 0
+        self.admitted = 0
+        self.queued = 0    # queue pages served
+        self.expired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.avg_hold = 0.0  # moving average of admitted request time
+        self._purged_at = 0.0
+    
+    def _purge(self, now):
+        """Drop tickets whose owner stopped polling (at most once a second)"""
+        if now - self._purged_at < 1:
+            return
+        self._purged_at = now
+        stale_before = now - app.config['ADMISSION_TICKET_TTL']
+        kept = [ticket for ticket in self.queue if ticket.waiting or ticket.last_seen >= stale_before]
+        if len(kept) != len(self.queue):
+            for ticket in self.queue:
+                if not ticket.waiting and ticket.last_seen < stale_before:
+                    self.tickets.pop(ticket.user_id, None)
+                    self.expired += 1
+            self.queue = kept
+    
+    def _admit(self, waited):
+        self.active += 1
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+    
+    def _waiting_ahead(self, ticket):
+        """Position among the waiting tickets, and in the whole queue"""
+        ahead = 0
+        for position, other in enumerate(self.queue):
+            if other is ticket:
+                return ahead, position
+            if other.waiting:
+                ahead += 1
+        raise ValueError('ticket is not queued')
+    
+    def admit(self, user_id, fingerprint=None):
+        """Take a writer slot for a request
+        
+        Returns (queued, requested_at): queued is None when admitted, else the
+        (position, retry_after) of the user's ticket. requested_at is when the
+        request first arrived: the ticket's first attempt if the fingerprint
+        matches, otherwise now.
+        """
+        limit = max(1, app.config['ADMISSION_WRITERS'])
+        with self._cond:
+            now = time.monotonic()
+            self._purge(now)
+            ticket = self.tickets.get(user_id)
+            if ticket is None:
+                if not any(other.waiting for other in self.queue) and self.active < limit:
+                    self._admit(0.0)
+                    return None, datetime.now()
+                ticket = self.tickets[user_id] = AdmissionTicket(user_id, now, fingerprint)
+                self.queue.append(ticket)
+            
+            give_up = now + app.config['ADMISSION_WAIT']
+            ticket.waiting += 1
+            try:
+                while True:
+                    ahead, position = self._waiting_ahead(ticket)
+                    if ahead < limit - self.active:
+                        self.queue.remove(ticket)
+                        del self.tickets[user_id]
+                        self._admit(now - ticket.issued)
+                        same_request = fingerprint is not None and fingerprint == ticket.fingerprint
+                        return None, ticket.requested_at if same_request else datetime.now()
+                    # Only the front of the queue waits in-thread for a slot to free up
+                    remaining = give_up - now
+                    if ahead >= limit or remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    now = time.monotonic()
+            finally:
+                ticket.waiting -= 1
+                ticket.last_seen = now
+            self.queued += 1
+            retry_after = min(10, max(1, round((position + 1) / limit * max(self.avg_hold, 0.05))))
+            return (position + 1, retry_after), None
+    
+    def release(self, held):
+        """Free a writer slot after a request that ran for held seconds"""
+        with self._cond:
+            self.active -= 1
+            self.avg_hold = held if not self.avg_hold else 0.9 * self.avg_hold + 0.1 * held
+            self._cond.notify_all()
+    
+    def stats(self):
+        with self._cond:
+            return {
+                'writers': app.config['ADMISSION_WRITERS'],
+                'active': self.active,
+                'queue_depth': len(self.queue),
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'expired': self.expired,
+                'avg_wait_ms': round(self.total_wait * 1000 / self.admitted, 1) if self.admitted else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 1),
+                'avg_hold_ms': round(self.avg_hold * 1000, 1),
+                'total_wait_seconds': self.total_wait,
+            }
+
+admission_controller = AdmissionController()
+
+def admission_queue_response(position, retry_after):
+    """The lightweight "you're in the queue" answer; the client retries the same request"""
+    message = f"You're in the queue (position {position}). Your exam continues automatically."
+    if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        response = jsonify({'success': False, 'queued': True, 'position': position,
+                            'retry_after': retry_after, 'message': message})
+    else:
+        fields = [(key, value) for key, value in request.form.items(multi=True)] if request.method == 'POST' else []
+        response = make_response(render_template('admission_queue.html', position=position,
+                                                 retry_after=retry_after, message=message,
+                                                 method=request.method, fields=fields))
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    response.headers['X-Queue-Position'] = str(position)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def request_fingerprint():
+    """Digest identifying a request and its payload across queue retries"""
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    if request.form:
+        # The queue page re-posts form fields, not necessarily in the original order
+        digest.update(json.dumps(sorted(request.form.items(multi=True))).encode())
+    else:
+        digest.update(request.get_data())
+    return digest.digest()
+
+def admission_controlled(view):
+    """Run the view only once admission_controller gives the user a writer slot
+    
+    The view finds the time the request first arrived (before any queueing)
+    in g.admission_requested_at, and may hand its slot back early with
+    release_admission_slot() once it stops writing itself.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not app.config['ADMISSION_ENABLED'] or not is_user_logged_in():
+            return view(*args, **kwargs)
+        queued, g.admission_requested_at = admission_controller.admit(session.get('user_id'), request_fingerprint())
+        if queued is not None:
+            return admission_queue_response(*queued)
+        g.admission_slot_started = time.perf_counter()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            release_admission_slot()
+    return wrapper
+
+def release_admission_slot():
+    """Give this request's writer slot back (no-op when it holds none)"""
+    started = g.pop('admission_slot_started', None)
+    if started is not None:
+        admission_controller.release(time.perf_counter() - started)
+
 def is_admin_logged_in():
     """Check if admin is logged in"""
     return session.get('admin_logged_in', False)
@@ -1000,14 +2566,1418 @@ def is_user_logged_in():
     return session.get('user_logged_in', False)
 
 def get_current_user():
-    """Get current logged in user"""
+    """Get current logged in user (looked up once per request)"""
     if is_user_logged_in():
-        conn = get_db_connection()
-        user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-        conn.close()
-        return user
+        if 'current_user' not in g:
+            conn = get_db_connection()
+            g.current_user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
+        return g.current_user
     return None
 
+# Question pool cache
+class QuestionPool:
+    """Process-wide cache of the question bank used to build exam papers
+    
+    Holds question rows by id plus id lists per difficulty and category, so
+    start_exam samples papers in memory instead of running ORDER BY RANDOM()
+    over the whole bank for every student. The cache is rebuilt when the
+    'questions' counter in cache_versions moves (bumped by triggers on every
+    write) or when invalidate() is called after an admin edit.
+    """
+    
+    # Exam categories that select by difficulty; everything else selects by category
+    DIFFICULTY_CATEGORIES = ('easy', 'medium', 'hard', 'unseen')
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+    
+    def invalidate(self):
+        """Drop the cached bank; the next caller reloads it"""
+        self._snapshot = None
+    
+    def _version(self, conn):
+        try:
+            row = conn.execute("SELECT version FROM cache_versions WHERE name = 'questions'").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+    
+    def _build(self, conn, version):
+        rows = {}
+        by_difficulty = {}
+        by_category = {}
+        for row in conn.execute('SELECT * FROM questions ORDER BY id'):
+            qd = dict(row)
+            rows[qd['id']] = qd
+            by_difficulty.setdefault(qd.get('difficulty'), []).append(qd['id'])
+            by_category.setdefault(qd.get('category'), []).append(qd['id'])
+        return {
+            'version': version,
+            'rows': rows,
+            'ids': list(rows),
+            'by_difficulty': by_difficulty,
+            'by_category': by_category,
+        }
+    
+    def snapshot(self, conn):
+        """Return the current cached bank, reloading it if it is stale"""
+        version = self._version(conn)
+        snap = self._snapshot
+        if snap is None or version is None or snap['version'] != version:
+            with self._lock:
+                snap = self._snapshot
+                if snap is None or version is None or snap['version'] != version:
+                    snap = self._build(conn, version)
+                    self._snapshot = snap
+        return snap
+    
+    def get_many(self, conn, question_ids):
+        """Return cached rows for the given ids (missing ids are skipped)"""
+        rows = self.snapshot(conn)['rows']
+        return [rows[qid] for qid in question_ids if qid in rows]
+    
+    def sample(self, conn, category_config=None, num_questions=0):
+        """Pick a random paper without replacement
+        
+        With a category_config ({'easy': 3, 'image': 2, ...}) each category is
+        sampled from its own id list; otherwise num_questions are drawn from the
+        whole bank. Returns shuffled question rows (dicts).
+        """
+        snap = self.snapshot(conn)
+        chosen = []
+        seen = set()
+        
+        if category_config is None:
+            chosen = random.sample(snap['ids'], min(num_questions, len(snap['ids'])))
+        else:
+            for category, num_q in category_config.items():
+                if num_q <= 0:
+                    continue
+                if category in self.DIFFICULTY_CATEGORIES:
+                    pool = snap['by_difficulty'].get(category, [])
+                else:
+                    pool = snap['by_category'].get(category, [])
+                picked = [qid for qid in random.sample(pool, min(num_q, len(pool))) if qid not in seen]
+                if len(picked) < num_q and len(pool) > len(picked):
+                    # Rare: overlap with an earlier category - top up from what is left
+                    remaining = [qid for qid in pool if qid not in seen and qid not in picked]
+                    picked += random.sample(remaining, min(num_q - len(picked), len(remaining)))
+                seen.update(picked)
+                chosen.extend(picked)
+            random.shuffle(chosen)
+        
+        return [snap['rows'][qid] for qid in chosen]
+
+question_pool = QuestionPool()
+
+# Settings cache
+CONTROL_DEFAULTS = {
+    'show_result_immediately': 1,
+    'enable_copy_protection': 1,
+    'enable_screenshot_block': 1,
+    'enable_tab_switch_detect': 1,
+    'show_result_history': 1,
+    'show_rankings': 1,
+    'allow_answer_review': 1,
+    'updated_at': None,
+}
+SYSTEM_DEFAULTS = {
+    'registration_enabled': 1,
+    'maintenance_mode': 0,
+    'exams_enabled': 1,
+    'exam_window_start': None,
+    'exam_window_end': None,
+    'db_backup_path': 'backups/',
+    'last_backup_time': None,
+    'updated_at': None,
+}
+
+class Settings:
+    """Typed snapshot of the exam_controls and system_settings rows
+    
+    `controls` and `system` keep the raw column values for templates that
+    read them directly.
+    """
+    
+    def __init__(self, controls, system, version):
+        self.controls = controls
+        self.system = system
+        self.version = version
+        self.show_result_immediately = bool(controls['show_result_immediately'])
+        self.enable_copy_protection = bool(controls['enable_copy_protection'])
+        self.enable_screenshot_block = bool(controls['enable_screenshot_block'])
+        self.enable_tab_switch_detect = bool(controls['enable_tab_switch_detect'])
+        self.show_result_history = bool(controls['show_result_history'])
+        self.show_rankings = bool(controls['show_rankings'])
+        self.allow_answer_review = bool(controls['allow_answer_review'])
+        self.registration_enabled = bool(system['registration_enabled'])
+        self.maintenance_mode = bool(system['maintenance_mode'])
+        self.exams_enabled = bool(system['exams_enabled'])
+        self.exam_window_start = system['exam_window_start']
+        self.exam_window_end = system['exam_window_end']
+        self.last_backup_time = system['last_backup_time']
+    
+    @property
+    def toggles(self):
+        """Exam page toggles in the shape take_exam.html/exam_results.html expect"""
+        return {
+            'show_result_immediately': self.controls['show_result_immediately'],
+            'enable_copy_protection': self.controls['enable_copy_protection'],
+            'enable_screenshot_block': self.controls['enable_screenshot_block'],
+            'enable_tab_switch_detect': self.controls['enable_tab_switch_detect']
+        }
+
+class SettingsCache:
+    """Process-wide cache of the site settings
+    
+    Triggers bump the 'settings' counter in cache_versions on every write to
+    exam_controls/system_settings, so other worker processes notice changes.
+    Each connection also remembers the PRAGMA data_version it last validated
+    at; while nobody else has committed, even the counter read is skipped.
+    Writers in this process call invalidate() after committing.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+    
+    def invalidate(self):
+        """Drop the cached settings; the next caller reloads them"""
+        self._snapshot = None
+    
+    def _version(self, conn):
+        try:
+            row = conn.execute("SELECT version FROM cache_versions WHERE name = 'settings'").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+    
+    def _load(self, conn, version):
+        controls = dict(CONTROL_DEFAULTS)
+        system = dict(SYSTEM_DEFAULTS)
+        try:
+            row = conn.execute('SELECT * FROM exam_controls WHERE id = 1').fetchone()
+            if row:
+                controls.update({key: row[key] for key in row.keys() if row[key] is not None or key not in controls})
+            row = conn.execute('SELECT * FROM system_settings WHERE id = 1').fetchone()
+            if row:
+                system.update({key: row[key] for key in row.keys() if row[key] is not None or key not in system})
+        except sqlite3.OperationalError:
+            pass  # Tables not created yet; fall back to the defaults
+        return Settings(controls, system, version)
+    
+    def get(self, conn):
+        """Return the current settings, reloading them if another writer changed them"""
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        snap = self._snapshot
+        if snap is not None and snap.version is not None and \
+                getattr(conn, 'settings_checked', None) == (data_version, snap):
+            return snap
+        
+        version = self._version(conn)
+        if snap is None or version is None or snap.version != version:
+            with self._lock:
+                snap = self._snapshot
+                if snap is None or version is None or snap.version != version:
+                    snap = self._load(conn, version)
+                    self._snapshot = snap
+        conn.settings_checked = (data_version, snap)
+        return snap
+
+settings_cache = SettingsCache()
+
+# Compact exam papers
+# A session stores {"v": 1, "q": [[question_id, question_version, "CADB"], ...]}
+# where the string lists the original option letters in display order. The
+# full paper (texts, shuffled options, images) is rebuilt from the question
+# pool on demand instead of being copied into every exam_sessions row.
+PAPER_FORMAT_VERSION = 1
+OPTION_LETTERS = ['A', 'B', 'C', 'D', 'E', 'F']
+
+def build_paper_question(qd, permutation):
+    """Render a question row as a paper entry with options in the given order"""
+    options = []
+    option_images = {}
+    for i, original_letter in enumerate(permutation):
+        new_letter = OPTION_LETTERS[i]
+        options.append((new_letter, qd.get(f'option_{original_letter.lower()}') or ''))
+        image = qd.get(f'option_{original_letter.lower()}_image')
+        if image:
+            option_images[new_letter] = image.replace('\\', '/')
+    
+    correct_letter = str(qd.get('correct_option', '')).upper()
+    return {
+        'id': qd.get('id'),
+        'question_text': qd.get('question_text', ''),
+        'options': options,
+        'correct_option': OPTION_LETTERS[permutation.index(correct_letter)] if correct_letter in permutation else None,
+        'difficulty': qd.get('difficulty', 'medium') or 'medium',
+        'question_image': (qd.get('question_image', '') or '').replace('\\', '/'),
+        'question_youtube': qd.get('question_youtube', '') or '',
+        'option_images': option_images
+    }
+
+def new_paper_entry(qd):
+    """Validate a question row and pick a random option order
+    
+    Returns [question_id, question_version, permutation] or None when the
+    question cannot be used.
+    """
+    required_fields = ['question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_option']
+    if not all(qd.get(field) is not None for field in required_fields):
+        print(f"Skipping invalid question ID {qd.get('id')}: missing required fields")
+        return None
+    
+    letters = ['A', 'B', 'C', 'D']
+    if qd.get('option_e'):
+        letters.append('E')
+    if qd.get('option_f'):
+        letters.append('F')
+    
+    correct_opt_letter = str(qd.get('correct_option', '')).upper()
+    if correct_opt_letter not in letters:
+        print(f"Skipping question ID {qd.get('id')}: invalid correct_option {qd.get('correct_option')}")
+        return None
+    
+    random.shuffle(letters)
+    return [qd['id'], qd.get('version') or 1, ''.join(letters)]
+
+def get_question_version(conn, question_id, version, rows=None):
+    """Return the question row a paper was built from (current row or revision)
+    
+    rows is an already fetched question_pool snapshot, for callers that look
+    up a whole paper.
+    """
+    if rows is None:
+        rows = question_pool.snapshot(conn)['rows']
+    current = rows.get(question_id)
+    if current is not None and (current.get('version') or 1) == version:
+        return current
+    revision = conn.execute('SELECT snapshot FROM question_revisions WHERE question_id = ? AND version = ?',
+                            (question_id, version)).fetchone()
+    if revision:
+        qd = json.loads(revision['snapshot'])
+        qd['id'] = question_id
+        qd['version'] = version
+        return qd
+    # Revision history predates this paper - fall back to the current content
+    return current
+
+def render_paper(conn, paper):
+    """Rebuild the full list of paper questions from a compact paper"""
+    questions = []
+    rows = question_pool.snapshot(conn)['rows']
+    for question_id, version, permutation in paper.get('q', []):
+        qd = get_question_version(conn, question_id, version, rows)
+        if qd is None:
+            questions.append({'id': question_id, 'question_text': 'Question not found', 'options': [],
+                              'correct_option': None, 'difficulty': 'medium', 'question_image': '',
+                              'question_youtube': '', 'option_images': {}})
+            continue
+        questions.append(build_paper_question(qd, permutation))
+    return questions
+
+def load_session_questions(conn, exam_session):
+    """Return the questions of a session's paper (compact or legacy questions_json)"""
+    keys = exam_session.keys()
+    paper = exam_session['paper'] if 'paper' in keys else None
+    if paper:
+        try:
+            return render_paper(conn, json.loads(paper))
+        except (TypeError, ValueError):
+            return []
+    try:
+        return json.loads(exam_session['questions_json'] or '[]') if 'questions_json' in keys else []
+    except (TypeError, json.JSONDecodeError):
+        return []
+
+def dump_paper(entries):
+    """Serialize compact paper entries for storage"""
+    return json.dumps({'v': PAPER_FORMAT_VERSION, 'q': entries}, separators=(',', ':'))
+
+def legacy_paper_entry(qd, legacy_question):
+    """Find the compact entry that rebuilds a legacy questions_json question exactly"""
+    available = {letter: qd.get(f'option_{letter.lower()}') or '' for letter in OPTION_LETTERS}
+    permutation = ''
+    for _, text in legacy_question.get('options', []):
+        match = next((letter for letter, value in available.items()
+                      if value == text and letter not in permutation), None)
+        if match is None:
+            return None
+        permutation += match
+    if not permutation:
+        return None
+    
+    rebuilt = json.loads(json.dumps(build_paper_question(qd, permutation)))
+    expected = json.loads(json.dumps(legacy_question))
+    expected['option_images'] = {k: v for k, v in (expected.get('option_images') or {}).items() if v}
+    for key in ['id', 'question_text', 'options', 'correct_option', 'question_image', 'question_youtube', 'option_images']:
+        if rebuilt.get(key) != expected.get(key):
+            return None
+    return [qd['id'], qd.get('version') or 1, permutation]
+
+def convert_legacy_papers(conn, batch_size=500):
+    """Streaming pass converting questions_json sessions into compact papers
+    
+    Only sessions whose every question can be rebuilt exactly from the
+    current bank are converted; the rest keep questions_json. Returns
+    (converted, kept).
+    """
+    questions = {row['id']: dict(row) for row in conn.execute('SELECT * FROM questions')}
+    converted = kept = 0
+    last_id = 0
+    while True:
+        batch = conn.execute('''
+            SELECT id, questions_json, answers_detail FROM exam_sessions 
+            WHERE id > ? AND paper IS NULL AND questions_json IS NOT NULL
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not batch:
+            break
+        updates = []
+        for row in batch:
+            last_id = row['id']
+            try:
+                legacy_questions = json.loads(row['questions_json'])
+            except (TypeError, json.JSONDecodeError):
+                kept += 1
+                continue
+            entries = []
+            for legacy_question in legacy_questions if isinstance(legacy_questions, list) else []:
+                qd = questions.get(legacy_question.get('id')) if isinstance(legacy_question, dict) else None
+                entry = legacy_paper_entry(qd, legacy_question) if qd else None
+                if entry is None:
+                    break
+                entries.append(entry)
+            if not entries or len(entries) != len(legacy_questions):
+                kept += 1
+                continue
+            
+            # The question text is rebuilt from the paper now, so drop the copy
+            answers_detail = row['answers_detail']
+            try:
+                detail = json.loads(answers_detail) if answers_detail else None
+            except (TypeError, json.JSONDecodeError):
+                detail = None
+            if isinstance(detail, dict):
+                for value in detail.values():
+                    if isinstance(value, dict):
+                        value.pop('question', None)
+                answers_detail = json.dumps(detail)
+            updates.append((dump_paper(entries), answers_detail, row['id']))
+        conn.executemany('UPDATE exam_sessions SET paper = ?, questions_json = NULL, answers_detail = ? WHERE id = ?',
+                         updates)
+        converted += len(updates)
+    return converted, kept
+
+# Session answers
+# Graded answers live in session_answers, one row per (session, question).
+# The answers/answers_detail JSON columns are only read for sessions that
+# predate the table; exam_session_answers_json rebuilds them for old tools.
+def grade_answers(questions, answers):
+    """Grade submitted answers against paper questions
+    
+    Returns (score, rows) where rows are (question_id, selected, correct,
+    is_correct) tuples ready for record_session_answers().
+    """
+    score = 0
+    rows = []
+    for question in questions:
+        q_id = str(question['id'])
+        user_answer = answers.get(q_id)
+        correct_option = question.get('correct_option')
+
+        # Determine correctness: allow comparison by letter OR by exact text
+        is_correct = False
+        if user_answer is not None and correct_option is not None:
+            # If correct_option stored as letter, simple compare
+            if user_answer == correct_option:
+                is_correct = True
+            else:
+                # If user_answer is text and correct_option is a letter, try map letter->text
+                # question may include options as list of tuples [('A','TextA'), ...]
+                opts = question.get('options', [])
+                if isinstance(opts, list) and opts:
+                    # find text for correct option letter
+                    correct_text = None
+                    for opt in opts:
+                        if opt[0] == correct_option:
+                            correct_text = opt[1]
+                            break
+                    # compare user_answer to correct_text if available
+                    if correct_text and user_answer == correct_text:
+                        is_correct = True
+
+        if is_correct:
+            score += 1
+        selected = str(user_answer) if user_answer is not None else None
+        rows.append((question['id'], selected, correct_option, 1 if is_correct else 0))
+    return score, rows
+
+def record_session_answers(conn, session_id, rows):
+    """Write graded answers of a session in a single executemany"""
+    conn.executemany('''
+        INSERT OR REPLACE INTO session_answers (session_id, question_id, selected, correct, is_correct)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(session_id,) + tuple(row) for row in rows])
+
+# Prepared papers
+# Sampling and shuffling a paper is the expensive part of start_exam. For a
+# scheduled exam, PaperBuilder builds one paper per eligible examinee
+# (profile completed, attempts left) before scheduled_start, in bulk
+# transactions, and start_exam then claims it with a single indexed UPDATE.
+# A paper is only claimed while the exam's question settings still match
+# the ones it was built for.
+app.config['PAPER_BUILD_BATCH_SIZE'] = int(os.environ.get('EXAM_PAPER_BUILD_BATCH_SIZE', '500'))  # users per transaction
+
+def exam_starts_later(exam):
+    """True while a scheduled exam's start time is still ahead"""
+    scheduled_start = exam['scheduled_start']
+    if not scheduled_start:
+        return False
+    if isinstance(scheduled_start, str):
+        try:
+            scheduled_start = datetime.fromisoformat(scheduled_start)
+        except ValueError:
+            return False
+    return scheduled_start > datetime.now()
+
+def paper_config_key(exam):
+    """Question settings a prepared paper was built for"""
+    return f"{exam['num_questions']}:{exam['category_config'] or ''}"
+
+def exam_category_config(exam):
+    """The exam's category config as a dict, or None when unset or invalid"""
+    if not exam['category_config']:
+        return None
+    try:
+        category_config = json.loads(exam['category_config'])
+    except (json.JSONDecodeError, TypeError):
+        return None
+    return category_config if isinstance(category_config, dict) else None
+
+def sample_paper(conn, exam):
+    """Sample a new paper for an exam: (compact entries, paper questions)"""
+    entries = []
+    questions = []
+    for qd in question_pool.sample(conn, exam_category_config(exam), exam['num_questions']):
+        entry = new_paper_entry(qd)
+        if entry is None:
+            continue
+        entries.append(entry)
+        questions.append(build_paper_question(qd, entry[2]))
+    return entries, questions
+
+CLAIM_PREPARED_PAPER_SQL = register_hot_query('start_exam.claim_prepared_paper', '''
+    UPDATE prepared_papers SET claimed_at = ?
+    WHERE exam_id = ? AND user_id = ? AND config = ? AND claimed_at IS NULL
+    RETURNING paper
+''', ('2000-01-01', 1, 1, '10:'))
+
+def claim_prepared_paper(conn, exam, user_id):
+    """Take the user's prepared paper for an exam, or None; commits with the caller's transaction"""
+    row = conn.execute(CLAIM_PREPARED_PAPER_SQL,
+                       (datetime.now(), exam['id'], user_id, paper_config_key(exam))).fetchone()
+    return row['paper'] if row else None
+
+def eligible_users_sql(extra=''):
+    """FROM/WHERE selecting examinees who may still take :exam_id (at most :max_attempts)"""
+    return f'''
+        FROM users u
+        WHERE u.profile_completed = 1 {extra}
+          AND (SELECT COUNT(*) FROM exam_sessions es
+               WHERE es.user_id = u.id AND es.exam_id = :exam_id AND es.is_completed = 1) < :max_attempts
+    '''
+
+def prepared_paper_report(conn, exam):
+    """Eligible examinees and prepared/claimed paper counts of one exam"""
+    params = {'exam_id': exam['id'], 'max_attempts': exam['max_attempts']}
+    eligible = conn.execute('SELECT COUNT(*) ' + eligible_users_sql(), params).fetchone()[0]
+    counts = conn.execute('''
+        SELECT COALESCE(SUM(claimed_at IS NULL AND config = ?), 0),
+               COALESCE(SUM(claimed_at IS NOT NULL), 0),
+               COALESCE(SUM(claimed_at IS NULL AND config != ?), 0)
+        FROM prepared_papers WHERE exam_id = ?
+    ''', (paper_config_key(exam), paper_config_key(exam), exam['id'])).fetchone()
+    return {
+        'exam_id': exam['id'],
+        'scheduled_start': str(exam['scheduled_start']) if exam['scheduled_start'] else None,
+        'eligible': eligible,
+        'ready': counts[0],
+        'claimed': counts[1],
+        'stale': counts[2],
+        'percent_ready': round(100 * min(counts[0] + counts[1], eligible) / eligible, 1) if eligible else 100.0,
+        'job': paper_builder.status(exam['id'])
+    }
+
+class PaperBuilder:
+    """Builds prepared papers for scheduled exams on a background thread per exam"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = {}  # exam_id -> {'state', 'built', 'started_at', 'finished_at', 'error'}
+        self._rerun = set()
+    
+    def status(self, exam_id):
+        with self._lock:
+            job = self.jobs.get(exam_id)
+            return dict(job) if job else None
+    
+    def schedule(self, exam_id):
+        """Build papers for an exam in the background; a running job picks up the change afterwards"""
+        with self._lock:
+            job = self.jobs.get(exam_id)
+            if job and job['state'] == 'running':
+                self._rerun.add(exam_id)
+                return
+            self.jobs[exam_id] = {'state': 'running', 'built': 0, 'started_at': datetime.now().isoformat(),
+                                  'finished_at': None, 'error': None}
+        threading.Thread(target=self._run, args=(exam_id,), name=f'paper-builder-{exam_id}', daemon=True).start()
+    
+    def _run(self, exam_id):
+        while True:
+            try:
+                built = self.build(exam_id)
+                state, error = 'done', None
+            except Exception as e:
+                print(f"⚠️ Preparing papers for exam {exam_id} failed: {e}")
+                built, state, error = 0, 'failed', str(e)
+            with self._lock:
+                if exam_id in self._rerun and state == 'done':
+                    self._rerun.discard(exam_id)
+                    continue
+                self._rerun.discard(exam_id)
+                self.jobs[exam_id].update(state=state, error=error, finished_at=datetime.now().isoformat())
+                return
+    
+    def _progress(self, exam_id, built):
+        with self._lock:
+            if exam_id in self.jobs:
+                self.jobs[exam_id]['built'] += built
+    
+    def build(self, exam_id, database=None):
+        """Prepare papers for every eligible examinee still missing one; returns how many were built
+        
+        Only exams that have not started yet are prepared. Papers of another
+        worker (or an earlier run) are kept: the unique (exam_id, user_id)
+        index makes concurrent builders skip each other's rows.
+        """
+        batch_size = app.config['PAPER_BUILD_BATCH_SIZE']
+        conn = open_db_connection(database)
+        total = 0
+        try:
+            exam = conn.execute('SELECT * FROM exams WHERE id = ?', (exam_id,)).fetchone()
+            if not exam or not exam_starts_later(exam):
+                return 0
+            config = paper_config_key(exam)
+            # Papers built for earlier question settings can never be claimed
+            conn.execute('DELETE FROM prepared_papers WHERE exam_id = ? AND config != ? AND claimed_at IS NULL',
+                         (exam_id, config))
+            conn.commit()
+            
+            last_user_id = 0
+            while True:
+                user_ids = [row[0] for row in conn.execute(
+                    'SELECT u.id ' + eligible_users_sql('''
+                        AND u.id > :after
+                        AND NOT EXISTS (SELECT 1 FROM prepared_papers p WHERE p.exam_id = :exam_id AND p.user_id = u.id)
+                    ''') + ' ORDER BY u.id LIMIT :limit',
+                    {'exam_id': exam_id, 'max_attempts': exam['max_attempts'], 'after': last_user_id,
+                     'limit': batch_size}).fetchall()]
+                if not user_ids:
+                    break
+                last_user_id = user_ids[-1]
+                now = datetime.now()
+                rows = []
+                for user_id in user_ids:
+                    entries, _ = sample_paper(conn, exam)
+                    if not entries:
+                        raise ValueError('no valid questions available for this exam')
+                    rows.append((exam_id, user_id, config, dump_paper(entries), now))
+                # Sampling happens above, so the write lock is held only for the inserts
+                conn.executemany('''
+                    INSERT OR IGNORE INTO prepared_papers (exam_id, user_id, config, paper, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+                total += len(rows)
+                self._progress(exam_id, len(rows))
+        finally:
+            conn.force_close()
+        if total:
+            print(f"📝 Prepared {total} paper(s) for exam {exam_id}")
+        return total
+
+paper_builder = PaperBuilder()
+
+def prepare_scheduled_exams(database=None):
+    """Build papers for every exam scheduled to start in the future (CLI and cron)"""
+    conn = open_db_connection(database)
+    try:
+        exams = conn.execute('SELECT id, scheduled_start FROM exams WHERE scheduled_start IS NOT NULL').fetchall()
+    finally:
+        conn.force_close()
+    exam_ids = [exam['id'] for exam in exams if exam_starts_later(exam)]
+    return {exam_id: paper_builder.build(exam_id, database) for exam_id in exam_ids}
+
+class GradedSubmission:
+    """A graded exam session waiting to be written by store_graded_session()"""
+    __slots__ = ('session_id', 'exam_id', 'user_id', 'end_time', 'score', 'duration_minutes',
+                 'answer_rows', 'done', 'result', 'error')
+    
+    def __init__(self, exam_session, end_time, score, duration_minutes, answer_rows):
+        self.session_id = exam_session['id']
+        self.exam_id = exam_session['exam_id']
+        self.user_id = exam_session['user_id']
+        self.end_time = end_time
+        self.score = score
+        self.duration_minutes = duration_minutes
+        self.answer_rows = answer_rows
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def grade_session(exam_session, questions, answers, end_time):
+    """Grade a session's answers without touching the database"""
+    score, answer_rows = grade_answers(questions, answers)
+    start_time = exam_session['start_time']
+    if isinstance(start_time, str):
+        start_time = datetime.fromisoformat(start_time)
+    duration_minutes = round((end_time - start_time).total_seconds() / 60, 2)
+    return GradedSubmission(exam_session, end_time, score, duration_minutes, answer_rows)
+
+def store_graded_session(conn, graded):
+    """Mark a graded session completed and record its answers; the caller commits
+    
+    The UPDATE only matches a session that is still open, so whichever of
+    submit_exam and the sweeper gets there first finalizes it. Returns the
+    score, or None when the session had already been completed.
+    """
+    cursor = conn.execute('''
+        UPDATE exam_sessions 
+        SET end_time = ?, score = ?, is_completed = 1, duration_minutes = ?
+        WHERE id = ? AND is_completed = 0
+    ''', (graded.end_time, graded.score, graded.duration_minutes, graded.session_id))
+    if cursor.rowcount == 0:
+        return None
+    record_session_answers(conn, graded.session_id, graded.answer_rows)
+    return graded.score
+
+def finalize_session(conn, exam_session, questions, answers, end_time):
+    """Grade a session's answers and mark it completed; the caller commits"""
+    return store_graded_session(conn, grade_session(exam_session, questions, answers, end_time))
+
+# Group commit
+# With one SQLite writer, a cohort submitting at the bell queues up behind one
+# commit (and one WAL sync) per submission. With GROUP_COMMIT_ENABLED,
+# submit_exam grades in the request thread and hands the result to
+# GroupCommitWriter, whose thread writes everything queued within
+# GROUP_COMMIT_WINDOW in one transaction, leaderboards included. The request
+# blocks until that transaction has committed, so a success response still
+# means the submission is on disk.
+app.config['GROUP_COMMIT_ENABLED'] = os.environ.get('EXAM_GROUP_COMMIT', '0') != '0'
+app.config['GROUP_COMMIT_WINDOW'] = float(os.environ.get('EXAM_GROUP_COMMIT_WINDOW', '0.005'))  # seconds to gather a batch
+app.config['GROUP_COMMIT_MAX_BATCH'] = int(os.environ.get('EXAM_GROUP_COMMIT_MAX_BATCH', '256'))  # submissions per transaction
+app.config['GROUP_COMMIT_TIMEOUT'] = float(os.environ.get('EXAM_GROUP_COMMIT_TIMEOUT', '30'))  # seconds before giving up on a queued write
+
+class GroupCommitTimeout(sqlite3.OperationalError):
+    """A submission was not written within GROUP_COMMIT_TIMEOUT (and never will be)"""
+
+class GroupCommitWriter:
+    """Writes graded submissions of this process in shared transactions"""
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._writer = None
+        self.pending = []  # GradedSubmission, oldest first
+        self.batches = 0
+        self.batched = 0    # submissions that went through a committed batch
+        self.committed = 0  # ...and were stored by it
+        self.failed = 0
+        self.largest_batch = 0
+        self.commit_seconds = 0.0
+    
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Forked worker: the parent's writer thread does not exist here
+            self._pid = os.getpid()
+            self.pending = []
+            self._writer = None
+    
+    def submit(self, graded):
+        """Queue a graded submission and wait until its batch commits
+        
+        Returns what store_graded_session() returned for it; database errors
+        of the batch are raised in every request that was part of it.
+        """
+        with self._cond:
+            self._check_fork()
+            if self._writer is None:
+                self._start_writer()
+            self.pending.append(graded)
+            self._cond.notify_all()
+        if not graded.done.wait(app.config['GROUP_COMMIT_TIMEOUT']):
+            with self._cond:
+                if graded in self.pending:
+                    self.pending.remove(graded)
+                    raise GroupCommitTimeout('Submission was not written in time')
+            # Already part of a transaction: its outcome is coming
+            graded.done.wait()
+        if graded.error is not None:
+            raise graded.error
+        return graded.result
+    
+    def _start_writer(self):
+        self._writer = threading.Thread(target=self._loop, name='group-commit', daemon=True)
+        self._writer.start()
+    
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self.pending:
+                    self._cond.wait()
+                max_batch = max(1, app.config['GROUP_COMMIT_MAX_BATCH'])
+                if len(self.pending) < max_batch:
+                    # Give the rest of the cohort a moment to join this transaction
+                    self._cond.wait_for(lambda: len(self.pending) >= max_batch,
+                                        app.config['GROUP_COMMIT_WINDOW'])
+                batch, self.pending = self.pending[:max_batch], self.pending[max_batch:]
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                print(f"⚠️ Group commit of {len(batch)} submission(s) failed: {e}")
+            finally:
+                for graded in batch:
+                    graded.done.set()
+    
+    def write_batch(self, batch):
+        """Store a batch in one transaction; each submission gets its result or error"""
+        started = time.perf_counter()
+        conn = open_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            stored = []
+            for graded in batch:
+                # One bad submission must not take the rest of the batch down with it
+                conn.execute('SAVEPOINT submission')
+                try:
+                    graded.result = store_graded_session(conn, graded)
+                except sqlite3.Error as e:
+                    conn.execute('ROLLBACK TO submission')
+                    graded.error = e
+                conn.execute('RELEASE submission')
+                if graded.result is not None:
+                    stored.append(graded)
+            if stored:
+                update_session_leaderboards(conn, [graded.session_id for graded in stored],
+                                            [graded.user_id for graded in stored])
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for graded in batch:
+                graded.result = None
+                graded.error = e
+            with self._cond:
+                self.failed += len(batch)
+            raise
+        finally:
+            conn.force_close()
+        elapsed = time.perf_counter() - started
+        with self._cond:
+            self.batches += 1
+            self.batched += len(batch)
+            # Submissions rolled back to their savepoint, or finalized meanwhile, were not stored
+            self.committed += len(stored)
+            self.failed += sum(1 for graded in batch if graded.error is not None)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.commit_seconds += elapsed
+        metrics.inc('exam_group_commit_batches_total')
+        metrics.inc('exam_group_commit_submissions_total', value=len(stored))
+    
+    def stats(self):
+        with self._cond:
+            return {
+                'enabled': app.config['GROUP_COMMIT_ENABLED'],
+                'pending': len(self.pending),
+                'batches': self.batches,
+                'committed': self.committed,
+                'failed': self.failed,
+                'avg_batch': round(self.batched / self.batches, 1) if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'avg_commit_ms': round(self.commit_seconds * 1000 / self.batches, 2) if self.batches else 0.0,
+            }
+
+group_commit_writer = GroupCommitWriter()
+
+# Autosave
+# The exam page posts only the answers that changed since its last save. Each
+# process merges those deltas in memory per session and a background thread
+# writes them every AUTOSAVE_FLUSH_INTERVAL seconds: one upsert per session,
+# all in a single transaction. A cohort autosaving every 10 seconds therefore
+# costs one commit per interval per worker rather than one per request.
+# Restores merge this process's pending deltas over the stored row.
+app.config['AUTOSAVE_FLUSH_INTERVAL'] = float(os.environ.get('EXAM_AUTOSAVE_FLUSH_INTERVAL', '2'))  # seconds; 0 = write through
+app.config['AUTOSAVE_MAX_ANSWERS'] = int(os.environ.get('EXAM_AUTOSAVE_MAX_ANSWERS', '500'))  # per request
+
+class AutosaveBuffer:
+    """Unsaved answer deltas of this process, keyed by session id"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._flusher = None
+        self.pending = {}  # session_id -> {question_id: letter or None}
+        self.flushes = 0
+        self.rows_written = 0
+    
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Forked worker: the parent's deltas are the parent's to write
+            self._pid = os.getpid()
+            self.pending = {}
+            self._flusher = None
+    
+    def add(self, session_id, delta):
+        """Merge a delta; a None answer clears the question"""
+        with self._lock:
+            self._check_fork()
+            self.pending.setdefault(session_id, {}).update(delta)
+            write_through = app.config['AUTOSAVE_FLUSH_INTERVAL'] <= 0
+            if not write_through and self._flusher is None:
+                self._start_flusher()
+        if write_through:
+            self.flush()
+    
+    def discard(self, session_id):
+        with self._lock:
+            self.pending.pop(session_id, None)
+    
+    def flush(self):
+        """Write every pending delta in one transaction; returns the number of sessions written"""
+        with self._flush_lock:
+            with self._lock:
+                self._check_fork()
+                batch, self.pending = self.pending, {}
+            if not batch:
+                return 0
+            now = datetime.now()
+            conn = open_db_connection()
+            try:
+                with conn:
+                    # Completed sessions are skipped: a late delta must not resurrect their row
+                    conn.executemany('''
+                        INSERT INTO session_progress (session_id, answers, updated_at)
+                        SELECT id, json_patch('{}', ?), ? FROM exam_sessions WHERE id = ? AND is_completed = 0
+                        ON CONFLICT (session_id) DO UPDATE
+                        SET answers = json_patch(answers, ?), updated_at = excluded.updated_at
+                    ''', [(json.dumps(delta), now, session_id, json.dumps(delta))
+                          for session_id, delta in batch.items()])
+            except sqlite3.Error:
+                with self._lock:
+                    # Keep the batch, with anything that arrived meanwhile on top
+                    for session_id, delta in batch.items():
+                        self.pending[session_id] = {**delta, **self.pending.get(session_id, {})}
+                raise
+            finally:
+                conn.force_close()
+            self.flushes += 1
+            self.rows_written += len(batch)
+        metrics.inc('exam_autosave_rows_written_total', value=len(batch))
+        return len(batch)
+    
+    def _start_flusher(self):
+        interval = app.config['AUTOSAVE_FLUSH_INTERVAL']
+        
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Autosave flush failed, retrying next interval: {e}")
+        
+        self._flusher = threading.Thread(target=loop, name='autosave-flush', daemon=True)
+        self._flusher.start()
+    
+    def load(self, conn, session_id):
+        """Saved answers of a session as {question_id: letter}, pending deltas included"""
+        row = conn.execute('SELECT answers FROM session_progress WHERE session_id = ?', (session_id,)).fetchone()
+        try:
+            answers = json.loads(row['answers']) if row else {}
+        except (TypeError, json.JSONDecodeError):
+            answers = {}
+        with self._lock:
+            answers.update(self.pending.get(session_id, {}))
+        return {qid: letter for qid, letter in answers.items() if letter in OPTION_LETTERS}
+    
+    def stats(self):
+        with self._lock:
+            return {'pending_sessions': len(self.pending), 'flushes': self.flushes,
+                    'rows_written': self.rows_written}
+
+autosave_buffer = AutosaveBuffer()
+
+@atexit.register
+def flush_autosave_at_exit():
+    """Write the deltas of a worker that is shutting down"""
+    try:
+        autosave_buffer.flush()
+    except sqlite3.Error as e:
+        print(f"⚠️ Autosave flush at exit failed: {e}")
+
+# Exam deadlines
+# start_exam stores an absolute deadline_at on every session. The timer page
+# polls /exam/<id>/time and autosave checks the deadline on every request, so
+# (user_id, deadline_at) of open sessions is cached per process: a deadline
+# never changes once set, and submit_exam and the sweeper evict sessions they
+# complete. Answers arriving more than DEADLINE_GRACE_SECONDS after the
+# deadline are refused; the session is then finalized with what the server
+# already holds.
+app.config['DEADLINE_GRACE_SECONDS'] = float(os.environ.get('EXAM_DEADLINE_GRACE_SECONDS', '60'))  # network and clock slack
+app.config['DEADLINE_CACHE_SIZE'] = int(os.environ.get('EXAM_DEADLINE_CACHE_SIZE', '50000'))  # sessions
+
+def session_deadline(start_time, duration_minutes):
+    """Deadline of an attempt started at start_time, or None for untimed exams"""
+    if not duration_minutes or duration_minutes <= 0:
+        return None
+    if isinstance(start_time, str):
+        start_time = datetime.fromisoformat(start_time)
+    return start_time + timedelta(minutes=duration_minutes)
+
+def deadline_passed(deadline, now=None):
+    """True once the deadline plus the configured grace is behind us"""
+    if deadline is None:
+        return False
+    return (now or datetime.now()) > deadline + timedelta(seconds=app.config['DEADLINE_GRACE_SECONDS'])
+
+class DeadlineCache:
+    """Bounded LRU of open sessions: session_id -> (user_id, deadline_at)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def put(self, session_id, user_id, deadline):
+        with self._lock:
+            self._entries[session_id] = (user_id, deadline)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > app.config['DEADLINE_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+    
+    def discard(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+    
+    def get(self, conn, session_id):
+        """(user_id, deadline_at, is_completed) of a session, or None if it does not exist"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return entry + (False,)
+            self.misses += 1
+        row = conn.execute('''
+            SELECT es.user_id, es.is_completed, es.deadline_at, es.start_time, e.duration_minutes
+            FROM exam_sessions es
+            JOIN exams e ON e.id = es.exam_id
+            WHERE es.id = ?
+        ''', (session_id,)).fetchone()
+        if not row:
+            return None
+        deadline = row['deadline_at'] or session_deadline(row['start_time'], row['duration_minutes'])
+        if not row['is_completed']:
+            self.put(session_id, row['user_id'], deadline)
+        return row['user_id'], deadline, bool(row['is_completed'])
+    
+    def stats(self):
+        with self._lock:
+            return {'sessions': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+deadline_cache = DeadlineCache()
+
+def finalize_expired_session(conn, exam_session, deadline):
+    """Finalize a session whose time ran out with the answers the server holds; the caller commits
+    
+    Returns the score, or None when the session had already been completed.
+    """
+    questions = load_session_questions(conn, exam_session)
+    answers = autosave_buffer.load(conn, exam_session['id'])
+    # The attempt ended when its time ran out, not when it was noticed
+    score = finalize_session(conn, exam_session, questions, answers, min(deadline, datetime.now()))
+    if score is not None:
+        autosave_buffer.discard(exam_session['id'])
+        deadline_cache.discard(exam_session['id'])
+    return score
+
+# Expired session sweeper
+# Sessions are normally completed by submit_exam. Ones whose browser never
+# submitted are finalized here once deadline_at + grace has passed, graded
+# from their autosaved answers (or a blank sheet) by the same code as
+# submit_exam. Every worker may run the sweeper thread, and
+# `python new.py --sweep` runs one pass from cron; the guarded UPDATE in
+# finalize_session is the claim, so no session is finalized twice.
+app.config['SWEEPER_ENABLED'] = os.environ.get('EXAM_SWEEPER', '1') != '0'
+app.config['SWEEPER_INTERVAL'] = float(os.environ.get('EXAM_SWEEPER_INTERVAL', '60'))  # seconds
+app.config['SWEEPER_GRACE_MINUTES'] = float(os.environ.get('EXAM_SWEEPER_GRACE_MINUTES', '5'))
+app.config['SWEEPER_BATCH_SIZE'] = int(os.environ.get('EXAM_SWEEPER_BATCH_SIZE', '200'))
+
+EXPIRED_SESSIONS_BATCH_SQL = register_hot_query('session_sweeper.expired_batch', '''
+    SELECT * FROM exam_sessions
+    WHERE is_completed = 0 AND deadline_at < ?
+    ORDER BY deadline_at
+    LIMIT ?
+''', ('2000-01-01', 200))
+
+class SessionSweeper:
+    """Finalizes open sessions whose time (plus grace) has run out"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self.finalized = 0
+        self.last_sweep = None
+    
+    def ensure_running(self):
+        """Start this process's sweeper thread (again after a fork)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, name='session-sweeper', daemon=True)
+                self._thread.start()
+    
+    def _loop(self):
+        while True:
+            time.sleep(app.config['SWEEPER_INTERVAL'])
+            try:
+                total = self.sweep()
+                if total:
+                    print(f"🧹 Finalized {total} expired exam session(s)")
+            except sqlite3.Error as e:
+                print(f"⚠️ Session sweep failed, retrying next interval: {e}")
+    
+    def expired_batch(self, conn, now, limit):
+        """Up to limit expired open sessions, earliest deadline first"""
+        # Never cut into the window in which submit_exam still accepts answers
+        grace = max(app.config['SWEEPER_GRACE_MINUTES'] * 60, app.config['DEADLINE_GRACE_SECONDS'])
+        return conn.execute(EXPIRED_SESSIONS_BATCH_SQL, (now - timedelta(seconds=grace), limit)).fetchall()
+    
+    def finalize_batch(self, conn, batch):
+        """Grade and complete a batch in one transaction; returns the sessions finalized"""
+        finalized = []
+        try:
+            for exam_session in batch:
+                if finalize_expired_session(conn, exam_session, exam_session['deadline_at']) is not None:
+                    finalized.append(exam_session)
+            if finalized:
+                update_session_leaderboards(conn, [row['id'] for row in finalized],
+                                            [row['user_id'] for row in finalized])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        for exam_session in finalized:
+            metrics.inc('exam_sessions_expired_total', metric_labels(exam_id=exam_session['exam_id']))
+        return finalized
+    
+    def sweep(self, database=None):
+        """Finalize expired sessions batch by batch until none are left; returns how many"""
+        batch_size = app.config['SWEEPER_BATCH_SIZE']
+        total = 0
+        conn = open_db_connection(database)
+        try:
+            while True:
+                batch = self.expired_batch(conn, datetime.now(), batch_size)
+                if not batch:
+                    break
+                finalized = self.finalize_batch(conn, batch)
+                total += len(finalized)
+                # Sessions another worker claimed drop out of the next query anyway
+                if len(batch) < batch_size:
+                    break
+        finally:
+            conn.force_close()
+        with self._lock:
+            self.finalized += total
+            self.last_sweep = datetime.now()
+        return total
+
+session_sweeper = SessionSweeper()
+
+@app.before_request
+def start_session_sweeper():
+    if app.config['SWEEPER_ENABLED']:
+        session_sweeper.ensure_running()
+
+def legacy_session_answers(exam_session, questions):
+    """Read answers from the pre-session_answers JSON columns, keyed by question id"""
+    try:
+        answers = json.loads(exam_session['answers'] or '{}')
+    except (TypeError, json.JSONDecodeError):
+        answers = {}
+    try:
+        answers_detail = json.loads(exam_session['answers_detail'] or '{}')
+    except (TypeError, json.JSONDecodeError):
+        answers_detail = {}
+    if not isinstance(answers, dict):
+        answers = {}
+    
+    result = {}
+    for i, question in enumerate(questions):
+        q_id = str(question.get('id'))
+        # answers_detail comes in two shapes: dict keyed by question id or list in paper order
+        if isinstance(answers_detail, dict):
+            ad = answers_detail.get(q_id)
+        else:
+            ad = answers_detail[i] if i < len(answers_detail) else None
+        if ad is None and q_id not in answers:
+            continue
+        if not isinstance(ad, dict):
+            ad = {'selected_answer': str(ad) if ad else None}
+        selected = ad.get('selected_answer') or ad.get('user_answer') or answers.get(q_id)
+        result[q_id] = {
+            'selected': selected,
+            'correct': ad.get('correct_answer', question.get('correct_option')),
+            'is_correct': bool(ad.get('is_correct'))
+        }
+    return result
+
+SESSION_ANSWERS_SQL = register_hot_query('session_answers.by_session', '''
+    SELECT question_id, selected, correct, is_correct FROM session_answers WHERE session_id = ?
+''', (1,))
+
+def load_session_answers(conn, exam_session, questions=None):
+    """Return the answers of a session keyed by question id (as string)"""
+    rows = conn.execute(SESSION_ANSWERS_SQL, (exam_session['id'],)).fetchall()
+    if rows:
+        return {str(row['question_id']): {'selected': row['selected'], 'correct': row['correct'],
+                                          'is_correct': bool(row['is_correct'])} for row in rows}
+    if questions is None:
+        questions = load_session_questions(conn, exam_session)
+    return legacy_session_answers(exam_session, questions)
+
+def session_answer_details(conn, exam_session):
+    """Return per-question answer details of a completed session in paper order"""
+    questions = load_session_questions(conn, exam_session)
+    answers = load_session_answers(conn, exam_session, questions)
+    
+    details = []
+    for question in questions:
+        answer = answers.get(str(question.get('id')), {})
+        details.append({
+            'question_id': question.get('id'),
+            'question': question.get('question_text', ''),
+            'selected_answer': answer.get('selected'),
+            'correct_answer': answer.get('correct', question.get('correct_option')),
+            'is_correct': bool(answer.get('is_correct'))
+        })
+    return details
+
+def backfill_session_answers(conn, batch_size=500):
+    """Streaming pass copying legacy JSON answers into session_answers
+    
+    The JSON columns of a backfilled session are cleared; their content is
+    still available through the exam_session_answers_json view. Returns the
+    number of sessions backfilled.
+    """
+    backfilled = 0
+    last_id = 0
+    while True:
+        batch = conn.execute('''
+            SELECT * FROM exam_sessions
+            WHERE id > ? AND is_completed = 1 AND (answers IS NOT NULL OR answers_detail IS NOT NULL)
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not batch:
+            break
+        rows = []
+        cleared = []
+        for session in batch:
+            last_id = session['id']
+            questions = load_session_questions(conn, session)
+            answers = legacy_session_answers(session, questions)
+            if not questions:
+                continue  # Paper is gone; keep the JSON as the only record
+            for question in questions:
+                answer = answers.get(str(question.get('id')))
+                if answer is None:
+                    rows.append((session['id'], question['id'], None, question.get('correct_option'), 0))
+                else:
+                    rows.append((session['id'], question['id'], answer['selected'], answer['correct'],
+                                 1 if answer['is_correct'] else 0))
+            cleared.append((session['id'],))
+        conn.executemany('''
+            INSERT OR REPLACE INTO session_answers (session_id, question_id, selected, correct, is_correct)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        conn.executemany('UPDATE exam_sessions SET answers = NULL, answers_detail = NULL WHERE id = ?', cleared)
+        backfilled += len(cleared)
+    return backfilled
+
+# Leaderboards
+# exam_leaderboard holds one ranked row per completed session and
+# global_leaderboard one row of averages per user. A submission only touches
+# its own rows: update_session_leaderboards() puts the session in its place
+# in the exam ranking, shifting the sessions below it down by one, and
+# recomputes the user's averages. Global ranks are not stored but counted on
+# read over the ordered index, so a new user never re-ranks everybody else.
+# update_leaderboards() rebuilds whole exams for bulk changes.
+EXAM_LEADERBOARD_KEY = (('score_pct', 'DESC', False), ('duration_minutes', 'ASC', True),
+                        ('end_time', 'ASC', True), ('session_id', 'ASC', False))
+GLOBAL_LEADERBOARD_KEY = (('avg_score', 'DESC', False), ('avg_duration', 'ASC', True),
+                          ('earliest_submission', 'ASC', True), ('completed_exams', 'DESC', False),
+                          ('user_id', 'ASC', False))
+
+def leaderboard_order_sql(key, alias=''):
+    """ORDER BY list of a leaderboard key"""
+    prefix = f'{alias}.' if alias else ''
+    return ', '.join(f'{prefix}{column} {direction}' for column, direction, _nullable in key)
+
+EXAM_LEADERBOARD_ORDER = leaderboard_order_sql(EXAM_LEADERBOARD_KEY)
+GLOBAL_LEADERBOARD_ORDER = leaderboard_order_sql(GLOBAL_LEADERBOARD_KEY)
+
+def ranked_before_sql(key, row, other):
+    """SQL condition: leaderboard row `other` sorts before row `row` (NULLs placed like ORDER BY)"""
+    condition = None
+    for column, direction, nullable in reversed(key):
+        mine, theirs = f'{row}.{column}', f'{other}.{column}'
+        before = f"{theirs} {'>' if direction == 'DESC' else '<'} {mine}"
+        if nullable:
+            # NULLs sort first ascending and last descending
+            null_first = f'{theirs} IS NULL AND {mine} IS NOT NULL'
+            null_last = f'{theirs} IS NOT NULL AND {mine} IS NULL'
+            before = f"({before} OR ({null_first if direction == 'ASC' else null_last}))"
+        condition = before if condition is None else f'({before} OR ({theirs} IS {mine} AND {condition}))'
+    return condition
+
+def global_rank_sql(row):
+    """SQL expression for the global rank of leaderboard row `row` (NULL when there is none)"""
+    return f'''CASE WHEN {row}.user_id IS NULL THEN NULL ELSE 1 + (
+        SELECT COUNT(*) FROM global_leaderboard better
+        WHERE {ranked_before_sql(GLOBAL_LEADERBOARD_KEY, row, 'better')}
+    ) END'''
+
+def percentile_sql(rank, total):
+    """SQL expression for the share of participants ranked below"""
+    return f'''CASE WHEN {total} > 1 THEN CAST(ROUND((({total} - {rank}) * 100.0) / ({total} - 1)) AS INTEGER)
+                    WHEN {total} = 1 THEN 100 ELSE 0 END'''
+
+EXAM_LEADERBOARD_ROWS_SQL = '''
+    SELECT es.id AS session_id, es.exam_id, es.user_id,
+           CASE WHEN e.num_questions > 0
+                THEN ROUND(CAST(COALESCE(es.score, 0) AS FLOAT) / e.num_questions * 100, 2)
+                ELSE 0 END AS score_pct,
+           es.duration_minutes, es.end_time
+    FROM exam_sessions es
+    JOIN users u ON es.user_id = u.id
+    JOIN exams e ON es.exam_id = e.id
+'''
+
+def refresh_exam_leaderboard(conn, exam_id):
+    """Re-rank every completed session of one exam"""
+    conn.execute('DELETE FROM exam_leaderboard WHERE exam_id = ?', (exam_id,))
+    conn.execute(f'''
+        INSERT INTO exam_leaderboard (session_id, exam_id, user_id, score_pct, duration_minutes, end_time, rank)
+        SELECT session_id, exam_id, user_id, score_pct, duration_minutes, end_time,
+               ROW_NUMBER() OVER (ORDER BY {EXAM_LEADERBOARD_ORDER})
+        FROM ({EXAM_LEADERBOARD_ROWS_SQL} WHERE es.exam_id = ? AND es.is_completed = 1)
+    ''', (exam_id,))
+
+def place_exam_leaderboard_session(conn, session_id):
+    """Move one session to its place in its exam's ranking; returns the rank (None if not completed)"""
+    removed = conn.execute('DELETE FROM exam_leaderboard WHERE session_id = ? RETURNING exam_id, rank',
+                           (session_id,)).fetchone()
+    if removed:
+        conn.execute('UPDATE exam_leaderboard SET rank = rank - 1 WHERE exam_id = ? AND rank > ?',
+                     (removed['exam_id'], removed['rank']))
+    # The SELECT reads exam_leaderboard before the row goes in, so the count is of the others
+    placed = conn.execute(f'''
+        INSERT INTO exam_leaderboard (session_id, exam_id, user_id, score_pct, duration_minutes, end_time, rank)
+        SELECT lb.*, 1 + (
+            SELECT COUNT(*) FROM exam_leaderboard better
+            WHERE better.exam_id = lb.exam_id AND {ranked_before_sql(EXAM_LEADERBOARD_KEY, 'lb', 'better')}
+        )
+        FROM ({EXAM_LEADERBOARD_ROWS_SQL} WHERE es.id = ? AND es.is_completed = 1) lb
+        RETURNING exam_id, rank
+    ''', (session_id,)).fetchone()
+    if placed is None:
+        return None
+    conn.execute('UPDATE exam_leaderboard SET rank = rank + 1 WHERE exam_id = ? AND rank >= ? AND session_id != ?',
+                 (placed['exam_id'], placed['rank'], session_id))
+    return placed['rank']
+
+def refresh_global_leaderboard(conn, user_ids=None):
+    """Recompute the averages of the given users (all when None)"""
+    user_filter = ''
+    params = []
+    if user_ids is None:
+        conn.execute('DELETE FROM global_leaderboard')
+    else:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        placeholders = ','.join(['?'] * len(user_ids))
+        conn.execute(f'DELETE FROM global_leaderboard WHERE user_id IN ({placeholders})', user_ids)
+        user_filter = f' AND es.user_id IN ({placeholders})'
+        params = user_ids
+    conn.execute(f'''
+        INSERT INTO global_leaderboard (user_id, avg_score, avg_duration, completed_exams, earliest_submission)
+        SELECT 
+            es.user_id,
+            COALESCE(AVG(
+                CASE 
+                    WHEN es.score > 0 AND e.num_questions > 0 
+                    THEN (CAST(es.score AS FLOAT) / CAST(e.num_questions AS FLOAT)) * 100
+                    ELSE 0
+                END
+            ), 0),
+            AVG(CASE WHEN es.duration_minutes > 0 THEN es.duration_minutes END),
+            COUNT(*),
+            MIN(es.end_time)
+        FROM exam_sessions es
+        JOIN users u ON es.user_id = u.id
+        JOIN exams e ON es.exam_id = e.id
+        WHERE es.is_completed = 1{user_filter}
+        GROUP BY es.user_id
+    ''', params)
+
+def update_leaderboards(conn, exam_ids=None, user_ids=None):
+    """Rebuild leaderboards after bulk changes to sessions
+    
+    exam_ids/user_ids name the exams and users whose sessions changed;
+    None rebuilds everything. Runs inside the caller's transaction.
+    """
+    if exam_ids is None:
+        conn.execute('DELETE FROM exam_leaderboard')
+        exam_ids = [row[0] for row in conn.execute('SELECT DISTINCT exam_id FROM exam_sessions WHERE is_completed = 1')]
+    for exam_id in set(exam_ids):
+        refresh_exam_leaderboard(conn, exam_id)
+    refresh_global_leaderboard(conn, None if user_ids is None else set(user_ids))
+
+def update_session_leaderboards(conn, session_ids, user_ids):
+    """Bring leaderboards up to date after a few sessions were completed; runs in the caller's transaction"""
+    for session_id in session_ids:
+        place_exam_leaderboard_session(conn, session_id)
+    refresh_global_leaderboard(conn, set(user_ids))
+
+def leaderboard_scope(conn, user_ids):
+    """Exams touched by the sessions of the given users"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return []
+    placeholders = ','.join(['?'] * len(user_ids))
+    return [row[0] for row in conn.execute(
+        f'SELECT DISTINCT exam_id FROM exam_sessions WHERE user_id IN ({placeholders})', user_ids)]
+
 # Routes
 @app.route('/')
 def index():
@@ -1019,14 +3989,8 @@ def index():
 def register():
     """Simplified user registration - only basic information (NSI ID, Name, Password)"""
     # Check system settings for registration flag
-    conn_check = get_db_connection()
-    try:
-        sys_row = conn_check.execute('SELECT registration_enabled FROM system_settings WHERE id = 1').fetchone()
-        registration_open = True if (sys_row and sys_row['registration_enabled']) else False
-    except Exception:
-        registration_open = True
-    finally:
-        conn_check.close()
+    conn = get_db_connection()
+    registration_open = settings_cache.get(conn).registration_enabled
 
     # If registration is disabled, show a clear message to users
     if not registration_open:
@@ -1088,13 +4052,11 @@ def register():
             flash('Password must be at least 6 characters long', 'error')
             return render_template('register.html')
         
-        # Check if user already exists
-        conn = get_db_connection()
+        # Check if user already exists (same request-scoped connection)
         existing_user = conn.execute('SELECT id FROM users WHERE nsi_id = ?', (nsi_id,)).fetchone()
         
         if existing_user:
             flash('This NSI ID is already registered', 'error')
-            conn.close()
             return render_template('register.html')
         
         # Create user with basic info only, profile_completed = 0
@@ -1148,9 +4110,11 @@ def login():
         
         conn = get_db_connection()
         user = conn.execute('SELECT * FROM users WHERE nsi_id = ?', (nsi_id,)).fetchone()
-        conn.close()
         
         if user and verify_password(password, user['password_hash']):
+            rehash_password(conn, 'users', user['id'], password, user['password_hash'])
+            conn.close()
+            
             # Regenerate session to prevent session fixation
             session.clear()
             session['user_logged_in'] = True
@@ -1166,6 +4130,7 @@ def login():
             flash(f'Welcome, {InputValidator.sanitize_string(user["name"])}!', 'success')
             return redirect(url_for('student_dashboard'))
         else:
+            conn.close()
             flash('Invalid NSI ID or password', 'error')
     
     return render_template('login.html')
@@ -1203,9 +4168,11 @@ def admin_login():
         
         conn = get_db_connection()
         admin = conn.execute('SELECT * FROM admins WHERE username = ?', (username,)).fetchone()
-        conn.close()
         
         if admin and verify_password(password, admin['password_hash']):
+            rehash_password(conn, 'admins', admin['id'], password, admin['password_hash'])
+            conn.close()
+            
             # Regenerate session to prevent session fixation
             session.clear()
             session['admin_logged_in'] = True
@@ -1221,6 +4188,7 @@ def admin_login():
             flash(f'Welcome, Admin {admin["username"]}!', 'success')
             return redirect(url_for('admin_dashboard'))
         else:
+            conn.close()
             flash('Invalid username or password', 'error')
     
     return render_template('admin_login.html')
@@ -1447,6 +4415,54 @@ def profile_complete_success():
     return render_template('profile_complete_success.html', user=user)
 
 
+def format_history_duration(duration_minutes):
+    """"1h 2m 3s" / "2m 3s" / "3s" for the dashboard history and ranking cards"""
+    if not duration_minutes:
+        return ''
+    total_seconds = int(duration_minutes * 60)
+    hours, minutes, seconds = total_seconds // 3600, total_seconds % 3600 // 60, total_seconds % 60
+    if hours > 0:
+        return f"{hours}h {minutes}m {seconds}s"
+    if minutes > 0:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
+
+DASHBOARD_EXAMS_SQL = register_hot_query('student_dashboard.exams', '''
+    SELECT *, scheduled_start > ? AS upcoming FROM exams
+    WHERE is_active = 1 OR scheduled_start > ?
+    ORDER BY scheduled_start IS NULL, scheduled_start
+''', ('2000-01-01', '2000-01-01'), small_tables=('exams',))
+DASHBOARD_EXAM_HISTORY_SQL = register_hot_query('student_dashboard.exam_history', '''
+    SELECT es.*, e.title, e.passing_score, e.num_questions, e.duration_minutes as exam_duration, es.duration_minutes
+    FROM exam_sessions es
+    JOIN exams e ON es.exam_id = e.id
+    WHERE es.user_id = ? AND (es.is_completed = 1 OR (es.is_completed = 0 AND es.exam_id = ?))
+    ORDER BY es.end_time DESC
+''', (1, 1))
+# A user with several attempts is ranked by their best session (the session
+# shown is the one of the MIN(rank) row). Ranks are dense, so the last rank
+# is the participant count.
+DASHBOARD_LEADERBOARD_SQL = register_hot_query('student_dashboard.leaderboard_ranks', f'''
+    SELECT *, {percentile_sql('rank', 'total_participants')} as percentile
+    FROM (
+        SELECT lb.exam_id, MIN(lb.rank) as rank, lb.session_id,
+               (SELECT MAX(t.rank) FROM exam_leaderboard t WHERE t.exam_id = lb.exam_id) as total_participants
+        FROM exam_leaderboard lb
+        WHERE lb.user_id = ?
+        GROUP BY lb.exam_id
+    )
+''', (1,))
+DASHBOARD_TOP_PERFORMERS_SQL = register_hot_query('student_dashboard.top_performers', f'''
+    SELECT u.id, u.name, u.nsi_id, u.wing_name,
+           gl.avg_score as average_score,
+           gl.completed_exams as exams_taken,
+           ROUND(gl.avg_duration, 2) as average_duration
+    FROM global_leaderboard gl
+    JOIN users u ON gl.user_id = u.id
+    ORDER BY {leaderboard_order_sql(GLOBAL_LEADERBOARD_KEY, 'gl')}
+    LIMIT 10
+''')
+
 @app.route('/student/dashboard')
 def student_dashboard():
     """Student dashboard"""
@@ -1468,25 +4484,28 @@ def student_dashboard():
     
     conn = get_db_connection()
     
-    # Get active exam
-    active_exam = conn.execute('SELECT * FROM exams WHERE is_active = 1').fetchone()
-
-    # Get next scheduled exam
+    # Active exam and next scheduled exam in one pass over the (small) exams table
     now = datetime.now()
-    next_exam = conn.execute('SELECT * FROM exams WHERE scheduled_start IS NOT NULL AND scheduled_start > ? ORDER BY scheduled_start ASC LIMIT 1', (now,)).fetchone()
-
-    # Get user's exam history with calculated percentages
-    exam_history_raw = conn.execute('''
-        SELECT es.*, e.title, e.passing_score, e.num_questions, e.duration_minutes as exam_duration, es.duration_minutes
-        FROM exam_sessions es
-        JOIN exams e ON es.exam_id = e.id
-        WHERE es.user_id = ? AND es.is_completed = 1
-        ORDER BY es.end_time DESC
-    ''', (user['id'],)).fetchall()
+    active_exam = None
+    next_exam = None
+    for exam in conn.execute(DASHBOARD_EXAMS_SQL, (now, now)):
+        if exam['is_active'] and (active_exam is None or exam['id'] < active_exam['id']):
+            active_exam = exam
+        if exam['upcoming'] and next_exam is None:
+            next_exam = exam
+
+    # User's exam history with calculated percentages; the ongoing session of
+    # the active exam (if any) comes back in the same query
+    exam_history_raw = conn.execute(DASHBOARD_EXAM_HISTORY_SQL,
+                                    (user['id'], active_exam['id'] if active_exam else None)).fetchall()
     
     # Convert to list of dicts and calculate percentage scores
     exam_history = []
+    ongoing_session = None
     for exam in exam_history_raw:
+        if not exam['is_completed']:
+            ongoing_session = ongoing_session or exam
+            continue
         exam_dict = dict(exam)
         # Calculate percentage: (correct_count / total_questions) * 100
         correct_count = exam_dict['score'] if exam_dict['score'] else 0
@@ -1494,109 +4513,36 @@ def student_dashboard():
         percentage = round((correct_count / total_questions) * 100, 2) if total_questions > 0 else 0
         exam_dict['score'] = percentage  # Replace raw score with percentage
         exam_dict['correct_count'] = correct_count  # Keep raw count for reference
+        exam_dict['duration_text'] = format_history_duration(exam_dict['duration_minutes'])
         exam_history.append(exam_dict)
 
-    # Check if user has ongoing session
-    ongoing_session = None
-    if active_exam:
-        ongoing_session = conn.execute('''
-            SELECT * FROM exam_sessions 
-            WHERE user_id = ? AND exam_id = ? AND is_completed = 0
-        ''', (user['id'], active_exam['id'])).fetchone()
-
     # Get global controls
-    controls = conn.execute('SELECT * FROM exam_controls WHERE id = 1').fetchone()
-    show_result_history = bool(controls['show_result_history']) if controls and 'show_result_history' in controls.keys() else True
-    show_rankings = bool(controls['show_rankings']) if controls and 'show_rankings' in controls.keys() else True
-    
-    # More conservative approach for answer review - default to False if column doesn't exist
-    allow_answer_review = False
-    if controls and 'allow_answer_review' in controls.keys():
-        allow_answer_review = bool(controls['allow_answer_review'])
-    else:
-        # If column doesn't exist, check if it exists in the table structure
-        try:
-            test_query = conn.execute('SELECT allow_answer_review FROM exam_controls WHERE id = 1').fetchone()
-            allow_answer_review = bool(test_query['allow_answer_review']) if test_query else False
-        except:
-            # Column doesn't exist, default to False for security
-            allow_answer_review = False
+    settings = settings_cache.get(conn)
+    show_result_history = settings.show_result_history
+    show_rankings = settings.show_rankings
+    allow_answer_review = settings.allow_answer_review
     
     # Calculate user rankings for each completed exam
     rankings = {}
+    ranked_history = []
     top_performers = []
     
     if show_rankings:
-        # Get exams with rankings data - for exams user has completed
-        for exam in exam_history:
-            exam_id = exam['exam_id']
-            # Get all results for this exam with percentage scores, ordered by percentage DESC then by duration ASC
-            # Note: exam_history already has percentage in 'score' field after our conversion above
-            all_results_raw = conn.execute('''
-                SELECT es.user_id, es.score as raw_score, e.num_questions, u.name, u.nsi_id, u.wing_name, es.end_time, es.duration_minutes
-                FROM exam_sessions es
-                JOIN users u ON es.user_id = u.id
-                JOIN exams e ON es.exam_id = e.id
-                WHERE es.exam_id = ? AND es.is_completed = 1
-                ORDER BY es.score DESC, es.duration_minutes ASC, es.end_time ASC
-            ''', (exam_id,)).fetchall()
-            
-            # Calculate percentage for each result for proper ranking
-            all_results = []
-            for result in all_results_raw:
-                result_dict = dict(result)
-                total_q = result_dict['num_questions'] if result_dict['num_questions'] else 1
-                percentage = round((result_dict['raw_score'] / total_q) * 100, 2) if total_q > 0 else 0
-                result_dict['score'] = percentage
-                all_results.append(result_dict)
-            
-            # Re-sort by percentage
-            all_results.sort(key=lambda x: (-x['score'], x['duration_minutes'], x['end_time']))
-            
-            # Find user's rank with percentage and duration-based tiebreaker
-            user_rank = 1
-            for idx, result in enumerate(all_results):
-                if result['user_id'] == user['id']:
-                    user_rank = idx + 1
-                    break
-            
-            total_participants = len(all_results)
-            # Calculate percentile: if you're rank 1 out of 12, you're better than 11 others (11/11 = 100%)
-            # Formula: ((total - rank) / (total - 1)) * 100
-            if total_participants > 1:
-                percentile = round(((total_participants - user_rank) / (total_participants - 1)) * 100)
-            elif total_participants == 1:
-                percentile = 100  # Only participant gets 100th percentile
-            else:
-                percentile = 0
-            
-            rankings[exam_id] = {
-                'rank': user_rank,
-                'total_participants': total_participants,
-                'percentile': percentile
+        # Per-exam ranks come from the materialized leaderboard
+        leaderboard_rows = conn.execute(DASHBOARD_LEADERBOARD_SQL, (user['id'],)).fetchall()
+        for row in leaderboard_rows:
+            rankings[row['exam_id']] = {
+                'session_id': row['session_id'],
+                'rank': row['rank'],
+                'total_participants': row['total_participants'],
+                'percentile': row['percentile']
             }
+        # One ranking card per exam: the session the rank belongs to
+        ranked_sessions = {ranking['session_id'] for ranking in rankings.values()}
+        ranked_history = [exam for exam in exam_history if exam['id'] in ranked_sessions]
         
         # Get top 10 performers across all exams (based on average percentage scores with duration tiebreaker)
-        # Calculate percentage: (score / num_questions) * 100 for each session, then average
-        top_performers_raw = conn.execute('''
-            SELECT u.id, u.name, u.nsi_id, u.wing_name, 
-                   AVG(
-                       CASE 
-                           WHEN e.num_questions > 0 THEN (CAST(es.score AS FLOAT) / CAST(e.num_questions AS FLOAT)) * 100
-                           ELSE 0
-                       END
-                   ) as average_score,
-                   COUNT(es.id) as exams_taken,
-                   ROUND(AVG(es.duration_minutes), 2) as average_duration
-            FROM exam_sessions es
-            JOIN users u ON es.user_id = u.id
-            JOIN exams e ON es.exam_id = e.id
-            WHERE es.is_completed = 1 AND e.num_questions > 0
-            GROUP BY u.id
-            HAVING exams_taken > 0
-            ORDER BY average_score DESC, average_duration ASC, MIN(es.end_time) ASC
-            LIMIT 10
-        ''').fetchall()
+        top_performers_raw = conn.execute(DASHBOARD_TOP_PERFORMERS_SQL).fetchall()
         
         # Round the average_score to 1 decimal place and cap at 100%
         top_performers = []
@@ -1621,6 +4567,7 @@ def student_dashboard():
                          show_rankings=show_rankings,
                          allow_answer_review=allow_answer_review,
                          rankings=rankings,
+                         ranked_history=ranked_history,
                          top_performers=top_performers)
 
 @app.route('/admin/exam_controls', methods=['GET', 'POST'])
@@ -1713,6 +4660,10 @@ def admin_exam_controls():
                 ''').fetchone()
                 stats['avg_score'] = avg_score_result['avg_score']
                 
+                stats['password_hashing'] = password_hasher.stats()
+                stats['admission'] = admission_controller.stats()
+                stats['group_commit'] = group_commit_writer.stats()
+                
                 # Add timestamp
                 stats['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 
@@ -1747,9 +4698,13 @@ def admin_exam_controls():
                 backup_name = f"backup_{timestamp}.db"
                 backup_path = os.path.join(backup_dir, backup_name)
                 
-                # Create a copy of the database file
+                # Use SQLite's online backup so pages still in the WAL are included
                 try:
-                    shutil.copy2('exam_system.db', backup_path)
+                    backup_conn = sqlite3.connect(backup_path)
+                    try:
+                        conn.backup(backup_conn)
+                    finally:
+                        backup_conn.close()
                     
                     # Update last backup time in system_settings
                     conn.execute(
@@ -1772,6 +4727,7 @@ def admin_exam_controls():
             elif action == 'reset_results':
                 # Delete all exam results
                 conn.execute("DELETE FROM exam_sessions")
+                update_leaderboards(conn)
                 conn.execute("UPDATE system_settings SET updated_at = ? WHERE id = 1", (datetime.now(),))
                 conn.commit()
                 return jsonify({
@@ -1783,6 +4739,7 @@ def admin_exam_controls():
                 # Delete users (except admin) and all exam results
                 conn.execute("DELETE FROM users WHERE nsi_id != 'admin'")
                 conn.execute("DELETE FROM exam_sessions")
+                update_leaderboards(conn)
                 conn.execute("UPDATE system_settings SET updated_at = ? WHERE id = 1", (datetime.now(),))
                 conn.commit()
                 return jsonify({
@@ -1793,6 +4750,7 @@ def admin_exam_controls():
             elif action == 'reset_all_attempts':
                 # Delete all exam sessions
                 conn.execute("DELETE FROM exam_sessions")
+                update_leaderboards(conn)
                 conn.commit()
                 return jsonify({
                     'success': True,
@@ -1850,7 +4808,7 @@ def admin_exam_controls():
                 # Get database size (approximate)
                 import os
                 try:
-                    stats['db_size'] = f"{os.path.getsize('exam_system.db') / (1024 * 1024):.2f} MB"
+                    stats['db_size'] = f"{os.path.getsize(DATABASE) / (1024 * 1024):.2f} MB"
                 except:
                     stats['db_size'] = 'Unknown'
                     
@@ -1918,6 +4876,8 @@ def admin_exam_controls():
                 'message': str(e)
             })
         finally:
+            # Any action above may have written exam_controls/system_settings
+            settings_cache.invalidate()
             conn.close()
     
     # Handle regular form submissions
@@ -1939,10 +4899,12 @@ def admin_exam_controls():
         ''', (show_result_immediately, show_result_history, show_rankings, allow_answer_review, 
               enable_copy_protection, enable_screenshot_block, enable_tab_switch_detect, datetime.now()))
         conn.commit()
+        settings_cache.invalidate()
         flash('Exam controls updated successfully!', 'success')
     
-    controls = conn.execute('SELECT * FROM exam_controls WHERE id = 1').fetchone()
-    system_settings = conn.execute('SELECT * FROM system_settings WHERE id = 1').fetchone()
+    current_settings = settings_cache.get(conn)
+    controls = current_settings.controls
+    system_settings = current_settings.system
     
     # Get system statistics
     stats = {}
@@ -1999,7 +4961,17 @@ def admin_exam_controls():
     
     return render_template('admin_exam_controls.html', controls=controls, settings=settings, system_settings=system_settings, stats=stats)
 
+START_EXAM_COMPLETED_ATTEMPTS_SQL = register_hot_query('start_exam.completed_attempts', '''
+    SELECT COUNT(*) FROM exam_sessions 
+    WHERE user_id = ? AND exam_id = ? AND is_completed = 1
+''', (1, 1))
+START_EXAM_ONGOING_SESSION_SQL = register_hot_query('start_exam.ongoing_session', '''
+    SELECT * FROM exam_sessions 
+    WHERE user_id = ? AND exam_id = ? AND is_completed = 0
+''', (1, 1))
+
 @app.route('/exam/<int:exam_id>/start')
+@admission_controlled
 def start_exam(exam_id):
     """Start exam"""
     if not is_user_logged_in():
@@ -2038,10 +5010,7 @@ def start_exam(exam_id):
                 return redirect(url_for('student_dashboard'))
     
     # Check if user already has completed sessions
-    completed_sessions = conn.execute('''
-        SELECT COUNT(*) FROM exam_sessions 
-        WHERE user_id = ? AND exam_id = ? AND is_completed = 1
-    ''', (user['id'], exam_id)).fetchone()[0]
+    completed_sessions = conn.execute(START_EXAM_COMPLETED_ATTEMPTS_SQL, (user['id'], exam_id)).fetchone()[0]
     
     if completed_sessions >= exam['max_attempts']:
         flash(f'You have already completed this exam {exam["max_attempts"]} time(s)', 'error')
@@ -2049,186 +5018,93 @@ def start_exam(exam_id):
         return redirect(url_for('student_dashboard'))
     
     # Check for ongoing session
-    ongoing_session = conn.execute('''
-        SELECT * FROM exam_sessions 
-        WHERE user_id = ? AND exam_id = ? AND is_completed = 0
-    ''', (user['id'], exam_id)).fetchone()
+    ongoing_session = conn.execute(START_EXAM_ONGOING_SESSION_SQL, (user['id'], exam_id)).fetchone()
     
-    shuffled_questions = None
     processed_questions = []
+    saved_answers = {}
+    
+    deadline = None
+    if ongoing_session:
+        deadline = ongoing_session['deadline_at'] or \
+            session_deadline(ongoing_session['start_time'], exam['duration_minutes'])
+        if deadline_passed(deadline):
+            # Time ran out while the student was away: submit what the server holds
+            if finalize_expired_session(conn, ongoing_session, deadline) is not None:
+                update_session_leaderboards(conn, [ongoing_session['id']], [user['id']])
+                conn.commit()
+            conn.close()
+            flash('Time is up for this exam. It was submitted with your saved answers.', 'warning')
+            return redirect(url_for('exam_results', session_id=ongoing_session['id']))
     
-    if ongoing_session and ongoing_session['questions_json']:
-        try:
-            processed_questions = json.loads(ongoing_session['questions_json'])
-            session_id = ongoing_session['id']
-        except (TypeError, json.JSONDecodeError):
-            processed_questions = []
-            session_id = ongoing_session['id']
+    if ongoing_session and (ongoing_session['paper'] or ongoing_session['questions_json']):
+        processed_questions = load_session_questions(conn, ongoing_session)
+        session_id = ongoing_session['id']
+        saved_answers = autosave_buffer.load(conn, session_id)
     else:
         session_id = None  # Will be set below
     
     # If we don't have questions yet (new session or corrupted session), generate them
     if not processed_questions:
-        shuffled_questions = []
-        
-        # New logic for category-based question selection
-        category_config_json = exam['category_config']
-        if category_config_json:
-            try:
-                category_config = json.loads(category_config_json)
-                
-                # Fetch questions based on category config
-                for category, num_q in category_config.items():
-                    if num_q > 0:
-                        # For easy/medium/hard: select by difficulty (includes text, video, and image questions)
-                        # For image/video: select by category specifically
-                        if category in ['easy', 'medium', 'hard', 'unseen']:
-                            cat_questions = conn.execute('''
-                                SELECT * FROM questions 
-                                WHERE difficulty = ? 
-                                ORDER BY RANDOM() 
-                                LIMIT ?
-                            ''', (category, num_q)).fetchall()
-                        else:
-                            # For image/video categories
-                            cat_questions = conn.execute('''
-                                SELECT * FROM questions 
-                                WHERE category = ? 
-                                ORDER BY RANDOM() 
-                                LIMIT ?
-                            ''', (category, num_q)).fetchall()
-                        shuffled_questions.extend(cat_questions)
-                
-                # Shuffle the combined list of questions
-                random.shuffle(shuffled_questions)
-
-            except (json.JSONDecodeError, TypeError):
-                # Fallback if config is invalid
-                shuffled_questions = conn.execute('''
-                    SELECT * FROM questions ORDER BY RANDOM() LIMIT ?
-                ''', (exam['num_questions'],)).fetchall()
-        else:
-            # Fallback for exams without category config
-            shuffled_questions = conn.execute('''
-                SELECT * FROM questions ORDER BY RANDOM() LIMIT ?
-            ''', (exam['num_questions'],)).fetchall()
-
-        processed_questions = []
-        for q in shuffled_questions:
-            qd = dict(q)
-            
-            required_fields = ['question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_option']
-            if not all(qd.get(field) is not None for field in required_fields):
-                print(f"Skipping invalid question ID {qd.get('id')}: missing required fields")
-                continue
-            
-            options = [
-                ('A', qd.get('option_a', '')),
-                ('B', qd.get('option_b', '')),
-                ('C', qd.get('option_c', '')),
-                ('D', qd.get('option_d', ''))
-            ]
-            if qd.get('option_e'):
-                options.append(('E', qd.get('option_e')))
-            if qd.get('option_f'):
-                options.append(('F', qd.get('option_f')))
-            
-            correct_opt_letter = str(qd.get('correct_option', '')).upper()
-            if correct_opt_letter not in ['A','B','C','D','E','F']:
-                print(f"Skipping question ID {qd.get('id')}: invalid correct_option {qd.get('correct_option')}")
-                continue
-            
-            # Find the text of the correct option before shuffling
-            correct_text = None
-            for opt_letter, opt_text in [('A', 'option_a'), ('B', 'option_b'), ('C', 'option_c'), ('D', 'option_d'), ('E', 'option_e'), ('F', 'option_f')]:
-                if opt_letter == correct_opt_letter:
-                    correct_text = qd.get(opt_text)
-                    break
-
-            if correct_text is None:
-                print(f"Skipping question ID {qd.get('id')}: correct option text missing")
-                continue
-            
-            random.shuffle(options)
-            
-            new_correct_option = None
-            # Find the new letter of the correct option after shuffling
-            for i, (original_letter, text) in enumerate(options):
-                if text == correct_text:
-                    new_correct_option = chr(ord('A') + i)
-                    break
-            
-            if new_correct_option is None:
-                print(f"Skipping question ID {qd.get('id')}: could not determine new correct option")
-                continue
-
-            # Re-assign options with new letters and preserve image mappings
-            final_options = []
-            option_images_shuffled = {}
-            
-            for i, (original_letter, text) in enumerate(options):
-                new_letter = chr(ord('A') + i)
-                final_options.append((new_letter, text))
-                
-                # Map the shuffled option letter to the original image
-                original_image_key = f'option_{original_letter.lower()}_image'
-                if qd.get(original_image_key):
-                    option_images_shuffled[new_letter] = (qd.get(original_image_key, '') or '').replace('\\', '/')
-
-            processed_questions.append({
-                'id': qd.get('id'),
-                'question_text': qd.get('question_text', ''),
-                'options': final_options,
-                'correct_option': new_correct_option,
-                'difficulty': qd.get('difficulty', 'medium') or 'medium',
-                'question_image': (qd.get('question_image', '') or '').replace('\\', '/'),
-                'question_youtube': qd.get('question_youtube', '') or '',
-                'option_images': option_images_shuffled
-            })
-        
-        if not processed_questions:
-            flash('No valid questions available for this exam. Please contact the administrator.', 'error')
-            conn.close()
-            return redirect(url_for('student_dashboard'))
+        paper = None
+        if session_id is None and exam['scheduled_start']:
+            # Built ahead of scheduled_start: claiming it is a single indexed UPDATE
+            paper = claim_prepared_paper(conn, exam, user['id'])
+            if paper:
+                processed_questions = render_paper(conn, json.loads(paper))
         
-        questions_json = json.dumps(processed_questions)
+        if not processed_questions:
+            # Sample the paper in memory from the cached question pool;
+            # only the question ids, versions and option orders are stored
+            paper_entries, processed_questions = sample_paper(conn, exam)
+            if not processed_questions:
+                flash('No valid questions available for this exam. Please contact the administrator.', 'error')
+                conn.close()
+                return redirect(url_for('student_dashboard'))
+            paper = dump_paper(paper_entries)
         
         cursor = conn.cursor()
         if session_id is None:  # New session
+            start_time = datetime.now()
+            deadline = session_deadline(start_time, exam['duration_minutes'])
             cursor.execute('''
-                INSERT INTO exam_sessions (user_id, exam_id, start_time, questions_json) 
-                VALUES (?, ?, ?, ?)
-            ''', (user['id'], exam_id, datetime.now(), questions_json))
+                INSERT INTO exam_sessions (user_id, exam_id, start_time, paper, deadline_at) 
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user['id'], exam_id, start_time, paper, deadline))
             session_id = cursor.lastrowid
+            conn.commit()
+            metrics.inc('exam_sessions_started_total', metric_labels(exam_id=exam_id))
         else:  # Update existing session with new questions
             cursor.execute('''
                 UPDATE exam_sessions 
-                SET questions_json = ? 
+                SET paper = ?, questions_json = NULL 
                 WHERE id = ?
-            ''', (questions_json, session_id))
-        
-        conn.commit()
+            ''', (paper, session_id))
+            conn.commit()
     
     # Get global exam controls
-    controls = conn.execute('SELECT * FROM exam_controls WHERE id = 1').fetchone()
-    toggles = {
-        'show_result_immediately': controls['show_result_immediately'] if controls else 1,
-        'enable_copy_protection': controls['enable_copy_protection'] if controls else 1,
-        'enable_screenshot_block': controls['enable_screenshot_block'] if controls else 1,
-        'enable_tab_switch_detect': controls['enable_tab_switch_detect'] if controls else 1
-    }
+    toggles = settings_cache.get(conn).toggles
     
     conn.close()
     
+    # A reload continues the clock instead of restarting it
+    deadline_cache.put(session_id, user['id'], deadline)
+    if deadline is not None:
+        remaining_seconds = max(0, int((deadline - datetime.now()).total_seconds()))
+    else:
+        remaining_seconds = int((exam['duration_minutes'] or 0) * 60)
+    
     return render_template('take_exam.html', 
                          exam=exam, 
                          questions=processed_questions,
                          session_id=session_id,
+                         saved_answers=saved_answers,
+                         remaining_seconds=remaining_seconds,
                          user=user,
                          toggles=toggles)
 
 @app.route('/exam/<int:session_id>/submit', methods=['POST'])
 @csrf.exempt
+@admission_controlled
 def submit_exam(session_id):
     """Submit exam"""
     if not is_user_logged_in():
@@ -2245,7 +5121,7 @@ def submit_exam(session_id):
     conn = get_db_connection()
     
     exam_session = conn.execute('''
-        SELECT es.*, e.num_questions, e.passing_score
+        SELECT es.*, e.num_questions, e.passing_score, e.duration_minutes AS exam_duration
         FROM exam_sessions es
         JOIN exams e ON es.exam_id = e.id
         WHERE es.id = ? AND es.user_id = ?
@@ -2264,6 +5140,30 @@ def submit_exam(session_id):
             return jsonify({'success': False, 'message': 'Exam already submitted.'}), 400
         flash('You have already submitted this exam.', 'warning')
         return redirect(url_for('exam_results', session_id=session_id))
+    
+    # A submit that waited in the admission queue counts from its first attempt
+    submitted_at = g.get('admission_requested_at') or datetime.now()
+    deadline = exam_session['deadline_at'] or \
+        session_deadline(exam_session['start_time'], exam_session['exam_duration'])
+    if deadline_passed(deadline, submitted_at):
+        # Too late for these answers: grade what was autosaved before the deadline
+        try:
+            if finalize_expired_session(conn, exam_session, deadline) is not None:
+                update_session_leaderboards(conn, [session_id], [user['id']])
+                conn.commit()
+                metrics.inc('exam_sessions_submitted_total', metric_labels(exam_id=exam_session['exam_id']))
+        finally:
+            conn.close()
+        message = 'Time was up. Your exam was submitted with the answers saved before the deadline.'
+        if request.is_json:
+            return jsonify({
+                'success': True,
+                'late': True,
+                'message': message,
+                'redirect_url': url_for('exam_results', session_id=session_id)
+            })
+        flash(message, 'warning')
+        return redirect(url_for('exam_results', session_id=session_id))
 
     try:
         # Debug: Print all form data for troubleshooting
@@ -2317,70 +5217,37 @@ def submit_exam(session_id):
         flash(f'Invalid request. Please try again. Error: {str(e)}', 'error')
         return redirect(url_for('student_dashboard'))
 
-    try:
-        questions = json.loads(exam_session['questions_json'])
-    except (TypeError, json.JSONDecodeError):
+    questions = load_session_questions(conn, exam_session)
+    if not questions:
         conn.close()
         if request.is_json:
             return jsonify({'success': False, 'message': 'Could not load exam questions.'}), 500
         flash('An error occurred while processing your submission.', 'error')
         return redirect(url_for('student_dashboard'))
 
-    score = 0
-    answers_detail = {}
-    
-    for question in questions:
-        q_id = str(question['id'])
-        user_answer = answers.get(q_id)
-        correct_option = question.get('correct_option')
-
-        # Determine correctness: allow comparison by letter OR by exact text
-        is_correct = False
-        if user_answer is not None and correct_option is not None:
-            # If correct_option stored as letter, simple compare
-            if user_answer == correct_option:
-                is_correct = True
-            else:
-                # If user_answer is text and correct_option is a letter, try map letter->text
-                # question may include options as list of tuples [('A','TextA'), ...]
-                opts = question.get('options', [])
-                if isinstance(opts, list) and opts:
-                    # find text for correct option letter
-                    correct_text = None
-                    for opt in opts:
-                        if opt[0] == correct_option:
-                            correct_text = opt[1]
-                            break
-                    # compare user_answer to correct_text if available
-                    if correct_text and user_answer == correct_text:
-                        is_correct = True
-
-        if is_correct:
-            score += 1
-
-        # Store richer answers_detail for later display
-        answers_detail[q_id] = {
-            'selected_answer': user_answer,
-            'correct_answer': correct_option,
-            'is_correct': is_correct,
-            'question': question.get('question_text', '')
-        }
-
-    end_time = datetime.now()
-    start_time = exam_session['start_time']
-    
-    if isinstance(start_time, str):
-        start_time = datetime.fromisoformat(start_time)
-        
-    duration_minutes = round((end_time - start_time).total_seconds() / 60, 2)
-
     try:
-        conn.execute('''
-            UPDATE exam_sessions 
-            SET end_time = ?, score = ?, answers = ?, answers_detail = ?, is_completed = 1, duration_minutes = ?
-            WHERE id = ?
-        ''', (end_time, score, json.dumps(answers), json.dumps(answers_detail), duration_minutes, session_id))
-        conn.commit()
+        end_time = submitted_at
+        if app.config['GROUP_COMMIT_ENABLED']:
+            # End the read transaction; the writer thread stores the graded session.
+            # Waiting for the batch needs no writer slot, and holding one would
+            # cap every batch at ADMISSION_WRITERS submissions.
+            conn.close()
+            release_admission_slot()
+            score = group_commit_writer.submit(grade_session(exam_session, questions, answers, end_time))
+        else:
+            score = finalize_session(conn, exam_session, questions, answers, end_time)
+            if score is not None:
+                update_session_leaderboards(conn, [session_id], [user['id']])
+                conn.commit()
+        if score is None:
+            # Finalized meanwhile by another request or the sweeper
+            if request.is_json:
+                return jsonify({'success': False, 'message': 'Exam already submitted.'}), 400
+            flash('You have already submitted this exam.', 'warning')
+            return redirect(url_for('exam_results', session_id=session_id))
+        autosave_buffer.discard(session_id)
+        deadline_cache.discard(session_id)
+        metrics.inc('exam_sessions_submitted_total', metric_labels(exam_id=exam_session['exam_id']))
     except Exception as e:
         conn.close()
         if request.is_json:
@@ -2400,6 +5267,68 @@ def submit_exam(session_id):
     flash('Exam submitted successfully!', 'success')
     return redirect(url_for('exam_results', session_id=session_id))
 
+@app.route('/exam/<int:session_id>/autosave', methods=['POST'])
+@csrf.exempt
+def autosave_exam(session_id):
+    """Save the answers that changed since the exam page's last autosave"""
+    if not is_user_logged_in():
+        return jsonify({'success': False, 'message': 'Authentication required.'}), 401
+    
+    data = request.get_json(silent=True)
+    answers = data.get('answers') if isinstance(data, dict) else None
+    if not isinstance(answers, dict) or len(answers) > app.config['AUTOSAVE_MAX_ANSWERS']:
+        return jsonify({'success': False, 'message': "Invalid 'answers' format"}), 400
+    
+    delta = {}
+    for question_id, letter in answers.items():
+        if not str(question_id).isdigit() or (letter is not None and letter not in OPTION_LETTERS):
+            return jsonify({'success': False, 'message': f'Invalid answer for question {question_id}'}), 400
+        delta[str(int(question_id))] = letter
+    
+    conn = get_db_connection()
+    entry = deadline_cache.get(conn, session_id)
+    conn.close()
+    if not entry or entry[0] != session.get('user_id'):
+        return jsonify({'success': False, 'message': 'Exam session not found.'}), 404
+    _, deadline, is_completed = entry
+    if is_completed:
+        return jsonify({'success': False, 'message': 'Exam already submitted.'}), 409
+    if deadline_passed(deadline):
+        return jsonify({'success': False, 'message': 'Time is up.'}), 409
+    
+    if delta:
+        try:
+            autosave_buffer.add(session_id, delta)
+        except sqlite3.Error:
+            return jsonify({'success': False, 'message': 'Could not save answers, please keep working.'}), 503
+    metrics.inc('exam_autosave_requests_total')
+    return jsonify({'success': True, 'saved': len(delta)})
+
+@app.route('/exam/<int:session_id>/time')
+def exam_time(session_id):
+    """Server-side deadline and remaining time of a session"""
+    if not is_user_logged_in():
+        return jsonify({'success': False, 'message': 'Authentication required.'}), 401
+    
+    conn = get_db_connection()
+    entry = deadline_cache.get(conn, session_id)
+    conn.close()
+    if not entry or entry[0] != session.get('user_id'):
+        return jsonify({'success': False, 'message': 'Exam session not found.'}), 404
+    _, deadline, is_completed = entry
+    
+    now = datetime.now()
+    response = jsonify({
+        'success': True,
+        'completed': is_completed,
+        'server_time': now.isoformat(),
+        'deadline_at': deadline.isoformat() if deadline else None,
+        'remaining_seconds': max(0, int((deadline - now).total_seconds())) if deadline else None,
+        'grace_seconds': app.config['DEADLINE_GRACE_SECONDS']
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @app.route('/exam/result')
 def exam_result():
     """Show exam result"""
@@ -2420,8 +5349,8 @@ def exam_result():
         exam = conn.execute('SELECT * FROM exams WHERE id = ?', (last_session['exam_id'],)).fetchone()
     
     # Get global exam controls
-    controls = conn.execute('SELECT * FROM exam_controls WHERE id = 1').fetchone()
-    show_result = bool(controls['show_result_immediately']) if controls else True
+    settings = settings_cache.get(conn)
+    show_result = settings.show_result_immediately
     
     conn.close()
 
@@ -2432,12 +5361,7 @@ def exam_result():
 
     session.pop('exam_result', None)
 
-    return render_template('exam_results.html', result=result, toggles={
-        'show_result_immediately': controls['show_result_immediately'] if controls else 1,
-        'enable_copy_protection': controls['enable_copy_protection'] if controls else 1,
-        'enable_screenshot_block': controls['enable_screenshot_block'] if controls else 1,
-        'enable_tab_switch_detect': controls['enable_tab_switch_detect'] if controls else 1
-    })
+    return render_template('exam_results.html', result=result, toggles=settings.toggles)
 
 @app.route('/exam/<int:session_id>/results')
 def exam_results(session_id):
@@ -2465,7 +5389,7 @@ def exam_results(session_id):
         return redirect(url_for('student_dashboard'))
     
     # Get exam controls
-    controls = conn.execute('SELECT * FROM exam_controls LIMIT 1').fetchone()
+    settings = settings_cache.get(conn)
     
     exam = conn.execute('SELECT * FROM exams WHERE id = ?', (exam_session['exam_id'],)).fetchone()
     
@@ -2477,7 +5401,7 @@ def exam_results(session_id):
         # Fallback: count all questions for this exam
         total_q = conn.execute('SELECT COUNT(*) as count FROM questions WHERE exam_id = ?', 
                               (exam_session['exam_id'],)).fetchone()['count']
-    show_result = controls['show_result_immediately'] if controls else 1
+    show_result = settings.show_result_immediately
     
     conn.close()
     
@@ -2507,12 +5431,7 @@ def exam_results(session_id):
     
     conn.close()
     
-    return render_template('exam_results.html', result=result, toggles={
-        'show_result_immediately': controls['show_result_immediately'] if controls else 1,
-        'enable_copy_protection': controls['enable_copy_protection'] if controls else 1,
-        'enable_screenshot_block': controls['enable_screenshot_block'] if controls else 1,
-        'enable_tab_switch_detect': controls['enable_tab_switch_detect'] if controls else 1
-    })
+    return render_template('exam_results.html', result=result, toggles=settings.toggles)
 
 @app.route('/student/exam/<int:session_id>/review')
 def student_exam_review(session_id):
@@ -2527,8 +5446,7 @@ def student_exam_review(session_id):
     conn = get_db_connection()
     
     # Check if answer review is allowed by admin
-    controls = conn.execute('SELECT * FROM exam_controls WHERE id = 1').fetchone()
-    allow_review = bool(controls['allow_answer_review']) if controls else True
+    allow_review = settings_cache.get(conn).allow_answer_review
     
     if not allow_review:
         flash('Answer review is currently disabled by the administrator.', 'error')
@@ -2552,93 +5470,35 @@ def student_exam_review(session_id):
         conn.close()
         return redirect(url_for('student_dashboard'))
     
-    # Get detailed answers
-    try:
-        answers_detail = json.loads(exam_session['answers_detail'] or '[]')
-    except (json.JSONDecodeError, TypeError):
-        answers_detail = []
-    
-    # Get questions with correct answers from the stored questions_json
-    try:
-        questions_data = json.loads(exam_session['questions_json'] or '[]')
-    except (json.JSONDecodeError, TypeError):
-        questions_data = []
+    # Rebuild the questions with correct answers from the session's paper
+    questions_data = load_session_questions(conn, exam_session)
+    answers = load_session_answers(conn, exam_session, questions_data)
     
     # Combine answers with full question details
     detailed_review = []
+    for i, question_data in enumerate(questions_data):
+        answer = answers.get(str(question_data.get('id')), {})
+        user_ans = answer.get('selected')
+
+        review_item = {
+            'question_number': i + 1,
+            'question_text': question_data.get('question_text', 'Question not found'),
+            'user_answer': user_ans if user_ans is not None else 'No answer selected',
+            'is_correct': bool(answer.get('is_correct')),
+            'correct_answer': '',
+            'explanation': question_data.get('explanation', ''),
+            'options': question_data.get('options', [])
+        }
 
-    # Support two shapes for answers_detail: list (by question order) or dict keyed by question id
-    if isinstance(answers_detail, dict):
-        # Build review items in the order of stored questions_data when available
-        for i, question_data in enumerate(questions_data):
-            qid = str(question_data.get('id'))
-            ad = answers_detail.get(qid, {}) if answers_detail else {}
-
-            user_ans = None
-            is_corr = False
-            if isinstance(ad, dict):
-                user_ans = ad.get('selected_answer') or ad.get('user_answer') or None
-                is_corr = bool(ad.get('is_correct'))
-            else:
-                # fallback: ad might be a raw value
-                user_ans = str(ad) if ad is not None else None
-
-            review_item = {
-                'question_number': i + 1,
-                'question_text': question_data.get('question_text', 'Question not found'),
-                'user_answer': user_ans if user_ans is not None else 'No answer selected',
-                'is_correct': is_corr,
-                'correct_answer': '',
-                'explanation': question_data.get('explanation', ''),
-                'options': question_data.get('options', [])
-            }
-
-            # Find the correct answer text
-            correct_option = question_data.get('correct_option', '')
-            if correct_option and review_item['options']:
-                for option in review_item['options']:
-                    if option[0] == correct_option:
-                        review_item['correct_answer'] = option[1]
-                        break
-
-            detailed_review.append(review_item)
-
-    else:
-        # answers_detail is expected to be a list (existing behavior)
-        for i, answer_detail in enumerate(answers_detail):
-            # Find matching question from stored questions
-            question_data = None
-            if i < len(questions_data):
-                question_data = questions_data[i]
-
-            # Handle case where answer_detail might be a dict or a raw value
-            if isinstance(answer_detail, dict):
-                user_ans = answer_detail.get('selected_answer') or answer_detail.get('user_answer') or None
-                is_corr = bool(answer_detail.get('is_correct'))
-            else:
-                user_ans = str(answer_detail) if answer_detail else None
-                is_corr = False
-
-            review_item = {
-                'question_number': i + 1,
-                'question_text': question_data.get('question_text', 'Question not found') if question_data else 'Question not found',
-                'user_answer': user_ans if user_ans is not None else 'No answer selected',
-                'is_correct': is_corr,
-                'correct_answer': '',
-                'explanation': question_data.get('explanation', '') if question_data else '',
-                'options': question_data.get('options', []) if question_data else []
-            }
-
-            # Find the correct answer text
-            if question_data:
-                correct_option = question_data.get('correct_option', '')
-                if correct_option and review_item['options']:
-                    for option in review_item['options']:
-                        if option[0] == correct_option:
-                            review_item['correct_answer'] = option[1]
-                            break
+        # Find the correct answer text
+        correct_option = question_data.get('correct_option', '')
+        if correct_option and review_item['options']:
+            for option in review_item['options']:
+                if option[0] == correct_option:
+                    review_item['correct_answer'] = option[1]
+                    break
 
-            detailed_review.append(review_item)
+        detailed_review.append(review_item)
     
     conn.close()
     
@@ -2704,28 +5564,23 @@ def admin_dashboard():
         LIMIT 10
     ''').fetchall()
     
-    # Get exam controls
-    controls = conn.execute('SELECT * FROM exam_controls WHERE id = 1').fetchone()
-    
-    # Get system settings
-    system_settings_row = conn.execute('SELECT * FROM system_settings WHERE id = 1').fetchone()
-    
-    # Create system settings dict with defaults if table doesn't exist yet
+    # Get exam controls and system settings
+    settings = settings_cache.get(conn)
     system_settings = {
-        'registration_enabled': system_settings_row['registration_enabled'] if system_settings_row else 1,
-        'maintenance_mode': system_settings_row['maintenance_mode'] if system_settings_row else 0,
-        'show_result_immediately': controls['show_result_immediately'] if controls else 1,
-        'enable_copy_protection': controls['enable_copy_protection'] if controls else 1,
+        'registration_enabled': settings.system['registration_enabled'],
+        'maintenance_mode': settings.system['maintenance_mode'],
+        'show_result_immediately': settings.controls['show_result_immediately'],
+        'enable_copy_protection': settings.controls['enable_copy_protection'],
     }
     
     # Create enhanced system stats
     import os
-    db_path = os.path.join(os.path.dirname(__file__), 'exam_system.db')
+    db_path = DATABASE if os.path.isabs(DATABASE) else os.path.join(os.path.dirname(__file__), DATABASE)
     db_size = os.path.getsize(db_path) if os.path.exists(db_path) else 0
     
     system_stats = {
         'db_size': f"{db_size / (1024 * 1024):.2f} MB",
-        'last_backup': system_settings_row['last_backup_time'] if system_settings_row and system_settings_row['last_backup_time'] else 'Never',
+        'last_backup': settings.last_backup_time or 'Never',
         'table_count': len(conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall())
     }
     
@@ -2980,6 +5835,7 @@ def edit_question(question_id):
               option_images.get('4'), option_images.get('5'), option_images.get('6'), 
               category, question_id))
         conn.commit()
+        question_pool.invalidate()
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -3000,6 +5856,7 @@ def delete_question(question_id):
         print(f"Executing DELETE for question ID: {question_id}")
         conn.execute('DELETE FROM questions WHERE id = ?', (question_id,))
         conn.commit()
+        question_pool.invalidate()
         print(f"Question {question_id} deleted successfully")
         return jsonify({'success': True})
     except Exception as e:
@@ -3137,6 +5994,7 @@ def add_question():
                   option_images.get('1'), option_images.get('2'), option_images.get('3'),
                   option_images.get('4'), option_images.get('5'), option_images.get('6'), category))
             conn.commit()
+            question_pool.invalidate()
             flash('Question added successfully!', 'success')
             return redirect(url_for('admin_questions'))
         except Exception as e:
@@ -3155,10 +6013,38 @@ def admin_exams():
         return redirect(url_for('admin_login'))
     
     conn = get_db_connection()
-    exams = conn.execute('SELECT * FROM exams ORDER BY created_at DESC').fetchall()
+    exams = conn.execute('''
+        SELECT e.*,
+               (SELECT COUNT(*) FROM prepared_papers p WHERE p.exam_id = e.id AND p.claimed_at IS NULL) AS papers_ready,
+               (SELECT COUNT(*) FROM prepared_papers p WHERE p.exam_id = e.id AND p.claimed_at IS NOT NULL) AS papers_claimed
+        FROM exams e ORDER BY e.created_at DESC
+    ''').fetchall()
     conn.close()
     
     return render_template('admin_exams.html', exams=exams)
+
+@app.route('/admin/exams/<int:exam_id>/papers', methods=['GET', 'POST'])
+@csrf.exempt
+def admin_exam_papers(exam_id):
+    """Prepared paper progress of an exam; POST (re)starts building them"""
+    if not is_admin_logged_in():
+        return jsonify({'error': 'Unauthorized access'}), 401
+    
+    conn = get_db_connection()
+    exam = conn.execute('SELECT * FROM exams WHERE id = ?', (exam_id,)).fetchone()
+    if not exam:
+        conn.close()
+        return jsonify({'error': 'Exam not found'}), 404
+    
+    if request.method == 'POST':
+        if not exam_starts_later(exam):
+            conn.close()
+            return jsonify({'error': 'Papers are only prepared for exams scheduled to start later'}), 400
+        paper_builder.schedule(exam_id)
+    
+    report = prepared_paper_report(conn, exam)
+    conn.close()
+    return jsonify({'success': True, **report})
 @app.route('/admin/exams/add', methods=['GET', 'POST'])
 @csrf.exempt  # Exempt CSRF for exam creation
 def add_exam():
@@ -3227,7 +6113,7 @@ def add_exam():
             return render_template('add_exam.html', category_counts=category_counts)
         
         try:
-            conn.execute('''
+            cursor = conn.execute('''
                 INSERT INTO exams 
                 (title, description, duration_minutes, num_questions, passing_score, max_attempts, category_config,
                  scheduled_start, scheduled_end)
@@ -3244,6 +6130,8 @@ def add_exam():
                 scheduled_end
             ))
             conn.commit()
+            if scheduled_start:
+                paper_builder.schedule(cursor.lastrowid)
             flash('Exam created successfully!', 'success')
             return redirect(url_for('admin_exams'))
         except Exception as e:
@@ -3300,6 +6188,309 @@ def deactivate_exam(exam_id):
     
     return redirect(url_for('admin_exams'))
 
+# Admin results filtering and keyset pagination
+ADMIN_RESULTS_PAGE_SIZE = 50
+ADMIN_RESULTS_MAX_PAGE_SIZE = 200
+# Percentage score as shown on the results page (rounded like the template)
+RESULT_PERCENTAGE_SQL = '''ROUND(CASE WHEN e.num_questions > 0
+    THEN CAST(es.score AS FLOAT) * 100 / e.num_questions ELSE 0 END, 1)'''
+# Keyset order of the results listing: (score, duration_minutes, end_time, id)
+ADMIN_RESULTS_ORDER = [('es.score', 'DESC'), ('es.duration_minutes', 'ASC'), ('es.end_time', 'ASC'), ('es.id', 'ASC')]
+
+def admin_results_filter_sql(args):
+    """Build the WHERE clause for the admin results filters"""
+    clauses = ['es.is_completed = 1']
+    params = []
+    exam_filter = args.get('exam', '').strip()
+    if exam_filter and exam_filter.lower() != 'all':
+        clauses.append('e.title = ? COLLATE NOCASE')
+        params.append(exam_filter)
+    for field in ['wing_name', 'division_name', 'district_name', 'section_name']:
+        value = args.get(field.replace('_name', ''), '').strip()
+        if value:
+            clauses.append(f'u.{field} = ? COLLATE NOCASE')
+            params.append(value)
+    date_from = args.get('from', '').strip()
+    if date_from:
+        clauses.append('es.end_time >= ?')
+        params.append(date_from)
+    date_to = args.get('to', '').strip()
+    if date_to:
+        # Inclusive end date: compare against the start of the following day
+        try:
+            date_to = (datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+        clauses.append('es.end_time < ?')
+        params.append(date_to)
+    status_filter = args.get('status', '').strip().lower()
+    if status_filter == 'passed':
+        clauses.append(f'{RESULT_PERCENTAGE_SQL} >= e.passing_score')
+    elif status_filter == 'failed':
+        clauses.append(f'{RESULT_PERCENTAGE_SQL} < e.passing_score')
+    search_filter = args.get('search', '').strip().lower()
+    if search_filter:
+        pattern = '%' + search_filter.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        clauses.append("(LOWER(u.name) LIKE ? ESCAPE '\\' OR LOWER(u.nsi_id) LIKE ? ESCAPE '\\')")
+        params.extend([pattern, pattern])
+    return ' AND '.join(clauses), params
+
+def keyset_after_sql(order, values):
+    """WHERE clause selecting rows strictly after `values` in `order`
+    
+    SQLite sorts NULL before any value, so NULL cursor values need their
+    own comparisons instead of plain < / >.
+    """
+    if not order:
+        return '0', []
+    (column, direction), value = order[0], values[0]
+    rest_sql, rest_params = keyset_after_sql(order[1:], values[1:])
+    if value is None:
+        after = f'{column} IS NOT NULL' if direction == 'ASC' else '0'
+        return f'({after} OR ({column} IS NULL AND {rest_sql}))', rest_params
+    if direction == 'ASC':
+        return f'({column} > ? OR ({column} = ? AND {rest_sql}))', [value, value] + rest_params
+    return f'({column} < ? OR {column} IS NULL OR ({column} = ? AND {rest_sql}))', [value, value] + rest_params
+
+def encode_results_cursor(row):
+    """Opaque cursor pointing just past a results row"""
+    # end_time_key is the stored text; the parsed datetime would not compare equal
+    key = [row['score'], row['duration_minutes'], row['end_time_key'], row['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_results_cursor(cursor):
+    """Decode a cursor from encode_results_cursor(); None if it is malformed"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(key, list) or len(key) != len(ADMIN_RESULTS_ORDER):
+        return None
+    return key
+
+def admin_results_page_sql(where_sql):
+    """Slim result rows for /admin/results/api; takes LIMIT as the last parameter"""
+    order_sql = ', '.join(f'{column} {direction}' for column, direction in ADMIN_RESULTS_ORDER)
+    return f'''
+        SELECT 
+            es.id, es.score, es.start_time, es.end_time, es.duration_minutes,
+            CAST(es.end_time AS TEXT) as end_time_key,
+            {RESULT_PERCENTAGE_SQL} as percentage,
+            u.nsi_id, u.name, u.wing_name, u.division_name, u.district_name, u.section_name,
+            e.title as exam_title, e.passing_score,
+            {global_rank_sql('gl')} as user_rank, gl.avg_score as user_avg_score
+        FROM exam_sessions es
+        JOIN users u ON es.user_id = u.id
+        JOIN exams e ON es.exam_id = e.id
+        LEFT JOIN global_leaderboard gl ON gl.user_id = es.user_id
+        WHERE {where_sql}
+        ORDER BY {order_sql}
+        LIMIT ?
+    '''
+
+register_hot_query('admin_results.page', admin_results_page_sql(admin_results_filter_sql({})[0]),
+                   (ADMIN_RESULTS_PAGE_SIZE + 1,))
+
+def admin_results_stats_sql(conn, args):
+    """Total/passed/failed/average for the filtered admin results"""
+    where_sql, params = admin_results_filter_sql(args)
+    row = conn.execute(f'''
+        SELECT 
+            COUNT(*) as total,
+            SUM(CASE WHEN {RESULT_PERCENTAGE_SQL} >= e.passing_score THEN 1 ELSE 0 END) as passed,
+            AVG({RESULT_PERCENTAGE_SQL}) as average
+        FROM exam_sessions es
+        JOIN users u ON es.user_id = u.id
+        JOIN exams e ON es.exam_id = e.id
+        WHERE {where_sql}
+    ''', params).fetchone()
+    total = row['total'] or 0
+    passed = row['passed'] or 0
+    return {
+        'total': total,
+        'passed': passed,
+        'failed': total - passed,
+        'average': round(row['average'] or 0, 1)
+    }
+
+# Streaming exports
+# Exports are generated row by row from a dedicated connection so memory
+# stays flat however many sessions match; output is flushed in chunks.
+EXPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+class _EchoWriter:
+    """File-like object handing csv.writer output straight back"""
+    def write(self, value):
+        return value
+
+def iter_query_batches(sql, params=(), batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of rows for a query from its own connection
+    
+    Generator responses outlive the request context, so they cannot use
+    the pooled request connection.
+    """
+    conn = open_db_connection()
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield conn, rows
+    finally:
+        conn.close()
+
+def export_response(filename, header, row_batches, fmt='csv', compress=False):
+    """Stream rows as CSV or NDJSON, optionally gzip-compressed
+    
+    row_batches yields lists of value lists matching header.
+    """
+    mimetype, extension = EXPORT_FORMATS.get(fmt, EXPORT_FORMATS['csv'])
+    
+    def generate_text():
+        if fmt == 'ndjson':
+            for rows in row_batches:
+                yield ''.join(json.dumps(dict(zip(header, row)), default=str, ensure_ascii=False) + '\n'
+                              for row in rows)
+        else:
+            writer = csv.writer(_EchoWriter())
+            yield writer.writerow(header)
+            for rows in row_batches:
+                yield ''.join(writer.writerow(row) for row in rows)
+    
+    def generate():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        buffer = []
+        size = 0
+        for text in generate_text():
+            buffer.append(text)
+            size += len(text)
+            if size < EXPORT_CHUNK_SIZE:
+                continue
+            chunk = ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        chunk = ''.join(buffer).encode('utf-8')
+        if compressor:
+            chunk = compressor.compress(chunk) + compressor.flush()
+        if chunk:
+            yield chunk
+    
+    download_name = f'{filename}.{extension}'
+    if compress:
+        download_name += '.gz'
+        mimetype = 'application/gzip'
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def export_options(args):
+    """Read the format/gzip query parameters of an export request"""
+    fmt = args.get('format', 'csv').strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+    compress = args.get('gzip', '').strip().lower() in ('1', 'true', 'yes')
+    return fmt, compress
+
+def format_export_time(value):
+    """Format a stored timestamp for export files"""
+    if not value:
+        return '-'
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value).replace('T', ' ').split('.')[0]
+
+def format_export_duration(duration_minutes):
+    """Format a duration the way the results dashboard shows it"""
+    if not duration_minutes:
+        return '-'
+    hours = int(duration_minutes // 60)
+    minutes = int(duration_minutes % 60)
+    seconds = int((duration_minutes % 1) * 60)
+    if hours > 0:
+        return f"{hours}h {minutes}m"
+    if minutes > 0:
+        return f"{minutes}m {seconds}s"
+    return f"{duration_minutes:.1f}m"
+
+def export_answer_summaries(conn, sessions):
+    """Build the "Q: ... | A: ..." column for a batch of sessions
+    
+    Answers for the whole batch are fetched in one query.
+    """
+    session_ids = [session['id'] for session in sessions]
+    placeholders = ','.join(['?'] * len(session_ids))
+    answers = {}
+    for row in conn.execute(f'''
+        SELECT session_id, question_id, selected FROM session_answers WHERE session_id IN ({placeholders})
+    ''', session_ids):
+        answers.setdefault(row['session_id'], {})[row['question_id']] = row['selected']
+    
+    summaries = {}
+    rows = question_pool.snapshot(conn)['rows']
+    for session in sessions:
+        session_answers = answers.get(session['id'])
+        if session_answers is not None and session['paper']:
+            # Only the question text is needed, so skip rendering the options
+            parts = []
+            for question_id, version, _permutation in json.loads(session['paper']).get('q', []):
+                qd = get_question_version(conn, question_id, version, rows)
+                question_text = qd.get('question_text', '') if qd else 'Question not found'
+                parts.append(f"Q: {question_text} | A: {session_answers.get(question_id) or '-'}")
+        else:
+            parts = [f"Q: {q['question']} | A: {q['selected_answer'] or '-'}"
+                     for q in session_answer_details(conn, session)]
+        summaries[session['id']] = '; '.join(parts)
+    return summaries
+
+# Organisation lists offered by the registration form, used by the admin
+# results filters and scripts/generate_data.py
+WINGS = [
+    'Technical Intelligence Wing',
+    'Admin Wing',
+    'External Affairs & Liasons Wing',
+    'Political Wing',
+    'Research Wing',
+    'Special Affairs Wing',
+    'DG Secretariat',
+    'DG Coordination',
+    'Economic Security Wing',
+    'Internal Wing',
+    'Border Wing',
+    'Counter Terrorism Wing',
+    'Dhaka Wing',
+    'Media Wing',
+    'Training Institute Wing',
+    'CTcell',
+]
+DIVISION_DISTRICTS = {
+    'Rajshahi': ['Rajshahi', 'Naogaon', 'Natore', 'Chapai Nawabganj', 'Pabna', 'Bogura',
+        'Sirajganj', 'Joypurhat'],
+    'Dhaka': ['Dhaka', 'Tangail', 'Narsingdi', 'Gazipur', 'Munshiganj', 'Narayanganj', 'Manikganj',
+        'Kishoreganj'],
+    'Chattogram': ['Chattogram', 'Cumilla', 'Brahmanbaria', 'Chandpur', 'Noakhali', 'Feni',
+        'Lakshmipur'],
+    'Khulna': ['Khulna', 'Bagerhat', 'Satkhira', 'Jashore (Jessore)', 'Narail', 'Jhenaidah',
+        'Magura', 'Kushtia', 'Chuadanga', 'Meherpur'],
+    'Rangpur': ['Rangpur', 'Kurigram', 'Lalmonirhat', 'Nilphamari', 'Gaibandha', 'Dinajpur',
+        'Thakurgaon', 'Panchagarh'],
+    'Barishal': ['Barishal', 'Patuakhali', 'Bhola', 'Pirojpur', 'Barguna', 'Jhalokathi'],
+    'Mymensingh': ['Mymensingh', 'Jamalpur', 'Sherpur', 'Netrokona'],
+    'Sylhet': ['Sylhet', 'Sunamganj', 'Moulvibazar', 'Habiganj'],
+    'Faridpur': ['Faridpur', 'Rajbari', 'Shariatpur', 'Gopalganj', 'Madaripur'],
+    'Chittagong Hill Tracts (Parbatya Chattagram)': ['Rangamati', 'Bandarban', 'Khagrachhari',
+        "Cox's Bazar"],
+}
+
 @app.route('/admin/results')
 def admin_results():
     """Admin results management with AJAX support for statistics refresh"""
@@ -3315,191 +6506,20 @@ def admin_results():
     district_filter = request.args.get('district', '').strip()
     section_filter = request.args.get('section', '').strip()
     status_filter = request.args.get('status', '').strip()
+    search_filter = request.args.get('search', '').strip()
     
-    query = '''
-        SELECT 
-            es.id, es.score, es.start_time, es.end_time, es.duration_minutes, es.answers, es.user_id,
-            u.nsi_id, u.name, u.wing_name, u.division_name, u.district_name, u.section_name,
-            e.title as exam_title, e.passing_score, e.num_questions
-        FROM exam_sessions es
-        JOIN users u ON es.user_id = u.id
-        JOIN exams e ON es.exam_id = e.id
-        WHERE es.is_completed = 1
-    '''
-    params = []
-    
-    if exam_filter and exam_filter.lower() != 'all':
-        query += ' AND e.title = ?'
-        params.append(exam_filter)
-    # Wing, Division, District, Section filters are handled client-side in JavaScript
-    # This allows NULL/empty values to be displayed and filtered properly
-    if status_filter and status_filter.lower() != 'all':
-        if status_filter == 'passed':
-            query += ' AND es.score >= e.passing_score'
-        elif status_filter == 'failed':
-            query += ' AND es.score < e.passing_score'
-    
-    query += ' ORDER BY es.score DESC, es.duration_minutes ASC, es.end_time ASC'
-    
-    raw_results = conn.execute(query, params).fetchall()
-    
-    # Get user rankings with percentage score and duration-based tiebreaker  
-    user_rankings = {}
-    rankings_data = conn.execute('''
-        SELECT 
-            u.id as user_id,
-            COALESCE(AVG(
-                CASE 
-                    WHEN es.score > 0 AND e.num_questions > 0 
-                    THEN (CAST(es.score AS FLOAT) / CAST(e.num_questions AS FLOAT)) * 100
-                    ELSE 0
-                END
-            ), 0) as avg_score,
-            COUNT(CASE WHEN es.is_completed = 1 THEN 1 END) as completed_exams,
-            COALESCE(AVG(CASE WHEN es.duration_minutes > 0 THEN es.duration_minutes END), 0) as avg_duration,
-            MIN(es.end_time) as earliest_submission,
-            ROW_NUMBER() OVER (
-                ORDER BY 
-                    AVG(
-                        CASE 
-                            WHEN es.score > 0 AND e.num_questions > 0 
-                            THEN (CAST(es.score AS FLOAT) / CAST(e.num_questions AS FLOAT)) * 100
-                            ELSE 0
-                        END
-                    ) DESC, 
-                    AVG(CASE WHEN es.duration_minutes > 0 THEN es.duration_minutes END) ASC,
-                    MIN(es.end_time) ASC,
-                    COUNT(CASE WHEN es.is_completed = 1 THEN 1 END) DESC
-            ) as user_rank
-        FROM users u
-        LEFT JOIN exam_sessions es ON u.id = es.user_id AND es.is_completed = 1
-        LEFT JOIN exams e ON es.exam_id = e.id
-        GROUP BY u.id
-        HAVING completed_exams > 0
-    ''').fetchall()
-    
-    for ranking in rankings_data:
-        user_rankings[ranking['user_id']] = {
-            'rank': ranking['user_rank'],
-            'avg_score': ranking['avg_score'],
-            'avg_duration': ranking['avg_duration'],
-            'completed_exams': ranking['completed_exams']
-        }
-    
-    # Add ranking information to each result and convert scores to percentages
-    results = []
-    for result in raw_results:
-        result_dict = dict(result)
-        
-        # Calculate percentage for this individual exam
-        raw_score = result_dict['score'] if result_dict['score'] else 0
-        num_questions = result_dict['num_questions'] if result_dict['num_questions'] else 1
-        percentage = round((raw_score / num_questions) * 100, 1) if num_questions > 0 else 0
-        result_dict['score'] = percentage  # Replace raw score with percentage
-        result_dict['raw_score'] = raw_score  # Keep raw score for reference
-        
-        user_id = result['user_id']
-        if user_id in user_rankings:
-            result_dict['user_rank'] = user_rankings[user_id]['rank']
-            result_dict['user_avg_score'] = round(user_rankings[user_id]['avg_score'], 1)
-            result_dict['user_avg_duration'] = user_rankings[user_id]['avg_duration']
-            result_dict['user_completed_exams'] = user_rankings[user_id]['completed_exams']
-        else:
-            result_dict['user_rank'] = None
-            result_dict['user_avg_score'] = None
-            result_dict['user_avg_duration'] = None
-            result_dict['user_completed_exams'] = 0
-        results.append(result_dict)
-    
-    filtered_results = results
-    search_filter = request.args.get('search', '').lower()
-    if search_filter:
-        filtered_results = [r for r in filtered_results 
-                          if search_filter in r['name'].lower() 
-                          or search_filter in r['nsi_id'].lower()]
-    
-    total_submissions = len(filtered_results)
-    if total_submissions > 0:
-        passed = sum(1 for r in filtered_results if r['score'] >= r['passing_score'])
-        failed = total_submissions - passed
-        avg_score = sum(r['score'] for r in filtered_results) / total_submissions
-    else:
-        passed = failed = 0
-        avg_score = 0
-    
-    stats = {
-        'total': total_submissions,
-        'passed': passed,
-        'failed': failed,
-        'average': round(avg_score, 1)
-    }
+    # Result rows are loaded page by page from /admin/results/api; only the
+    # aggregate statistics are rendered with the page
+    stats = admin_results_stats_sql(conn, request.args)
+    has_results = conn.execute('SELECT 1 FROM exam_sessions WHERE is_completed = 1 LIMIT 1').fetchone() is not None
     
     # Get exams dynamically from database
     exams = [dict(row) for row in conn.execute('SELECT DISTINCT title FROM exams ORDER BY title').fetchall()]
     
-    # Static wings list from registration form
-    wings = [
-        {'wing_name': 'Technical Intelligence Wing'},
-        {'wing_name': 'Admin Wing'},
-        {'wing_name': 'External Affairs & Liasons Wing'},
-        {'wing_name': 'Political Wing'},
-        {'wing_name': 'Research Wing'},
-        {'wing_name': 'Special Affairs Wing'},
-        {'wing_name': 'DG Secretariat'},
-        {'wing_name': 'DG Coordination'},
-        {'wing_name': 'Economic Security Wing'},
-        {'wing_name': 'Internal Wing'},
-        {'wing_name': 'Border Wing'},
-        {'wing_name': 'Counter Terrorism Wing'},
-        {'wing_name': 'Dhaka Wing'},
-        {'wing_name': 'Media Wing'},
-        {'wing_name': 'Training Institute Wing'},
-        {'wing_name': 'CTcell'}
-    ]
-    
-    # Static districts list from registration form (all districts from all divisions)
-    districts = [
-        {'district_name': 'Rajshahi'}, {'district_name': 'Naogaon'}, {'district_name': 'Natore'}, 
-        {'district_name': 'Chapai Nawabganj'}, {'district_name': 'Pabna'}, {'district_name': 'Bogura'}, 
-        {'district_name': 'Sirajganj'}, {'district_name': 'Joypurhat'},
-        {'district_name': 'Dhaka'}, {'district_name': 'Tangail'}, {'district_name': 'Narsingdi'}, 
-        {'district_name': 'Gazipur'}, {'district_name': 'Munshiganj'}, {'district_name': 'Narayanganj'}, 
-        {'district_name': 'Manikganj'}, {'district_name': 'Kishoreganj'},
-        {'district_name': 'Chattogram'}, {'district_name': 'Cumilla'}, {'district_name': 'Brahmanbaria'}, 
-        {'district_name': 'Chandpur'}, {'district_name': 'Noakhali'}, {'district_name': 'Feni'}, 
-        {'district_name': 'Lakshmipur'},
-        {'district_name': 'Khulna'}, {'district_name': 'Bagerhat'}, {'district_name': 'Satkhira'}, 
-        {'district_name': 'Jashore (Jessore)'}, {'district_name': 'Narail'}, {'district_name': 'Jhenaidah'}, 
-        {'district_name': 'Magura'}, {'district_name': 'Kushtia'}, {'district_name': 'Chuadanga'}, 
-        {'district_name': 'Meherpur'},
-        {'district_name': 'Rangpur'}, {'district_name': 'Kurigram'}, {'district_name': 'Lalmonirhat'}, 
-        {'district_name': 'Nilphamari'}, {'district_name': 'Gaibandha'}, {'district_name': 'Dinajpur'}, 
-        {'district_name': 'Thakurgaon'}, {'district_name': 'Panchagarh'},
-        {'district_name': 'Barishal'}, {'district_name': 'Patuakhali'}, {'district_name': 'Bhola'}, 
-        {'district_name': 'Pirojpur'}, {'district_name': 'Barguna'}, {'district_name': 'Jhalokathi'},
-        {'district_name': 'Mymensingh'}, {'district_name': 'Jamalpur'}, {'district_name': 'Sherpur'}, 
-        {'district_name': 'Netrokona'},
-        {'district_name': 'Sylhet'}, {'district_name': 'Sunamganj'}, {'district_name': 'Moulvibazar'}, 
-        {'district_name': 'Habiganj'},
-        {'district_name': 'Faridpur'}, {'district_name': 'Rajbari'}, {'district_name': 'Shariatpur'}, 
-        {'district_name': 'Gopalganj'}, {'district_name': 'Madaripur'},
-        {'district_name': 'Rangamati'}, {'district_name': 'Bandarban'}, {'district_name': 'Khagrachhari'}, 
-        {'district_name': "Cox's Bazar"}
-    ]
-    
-    # Static divisions list from registration form
-    divisions = [
-        {'division_name': 'Rajshahi'},
-        {'division_name': 'Dhaka'},
-        {'division_name': 'Chattogram'},
-        {'division_name': 'Khulna'},
-        {'division_name': 'Rangpur'},
-        {'division_name': 'Barishal'},
-        {'division_name': 'Mymensingh'},
-        {'division_name': 'Sylhet'},
-        {'division_name': 'Faridpur'},
-        {'division_name': 'Chittagong Hill Tracts (Parbatya Chattagram)'}
-    ]
+    # Static wings, districts and divisions from the registration form
+    wings = [{'wing_name': wing} for wing in WINGS]
+    districts = [{'district_name': district} for names in DIVISION_DISTRICTS.values() for district in names]
+    divisions = [{'division_name': division} for division in DIVISION_DISTRICTS]
     
     # Dynamic sections list from database (users who have registered)
     sections = [dict(row) for row in conn.execute('''
@@ -3509,30 +6529,20 @@ def admin_results():
         ORDER BY section_name
     ''').fetchall()]
     
-    # Get top performers for rankings section with percentage-based ranking
-    top_performers_raw = conn.execute('''
+    # Get top performers for rankings section from the materialized leaderboard
+    top_performers_raw = conn.execute(f'''
         SELECT 
             u.id,
             u.name,
             u.nsi_id,
             u.wing_name,
-            AVG(
-                CASE 
-                    WHEN e.num_questions > 0 
-                    THEN (CAST(es.score AS FLOAT) / CAST(e.num_questions AS FLOAT)) * 100
-                    ELSE 0
-                END
-            ) as avg_score,
-            COUNT(CASE WHEN es.is_completed = 1 THEN 1 END) as completed_exams,
-            COALESCE(AVG(CASE WHEN es.duration_minutes > 0 THEN es.duration_minutes END), 0) as avg_duration,
-            MIN(es.end_time) as earliest_submission
-        FROM users u
-        LEFT JOIN exam_sessions es ON u.id = es.user_id AND es.is_completed = 1
-        LEFT JOIN exams e ON es.exam_id = e.id
-        WHERE e.num_questions > 0
-        GROUP BY u.id, u.name, u.nsi_id, u.wing_name
-        HAVING completed_exams > 0
-        ORDER BY avg_score DESC, avg_duration ASC, earliest_submission ASC, completed_exams DESC
+            gl.avg_score,
+            gl.completed_exams,
+            COALESCE(gl.avg_duration, 0) as avg_duration,
+            gl.earliest_submission
+        FROM global_leaderboard gl
+        JOIN users u ON gl.user_id = u.id
+        ORDER BY {leaderboard_order_sql(GLOBAL_LEADERBOARD_KEY, 'gl')}
         LIMIT 15
     ''').fetchall()
     
@@ -3552,11 +6562,13 @@ def admin_results():
         'division': division_filter or '',
         'district': district_filter or '',
         'section': section_filter or '',
-        'status': status_filter or ''
+        'status': status_filter or '',
+        'search': search_filter or ''
     }
     
     return render_template('admin_results.html', 
-                         results=results,
+                         has_results=has_results,
+                         page_size=ADMIN_RESULTS_PAGE_SIZE,
                          rankings=top_performers,
                          stats=stats,
                          exams=exams,
@@ -3573,158 +6585,128 @@ def admin_results_stats():
         return jsonify({'error': 'unauthorized'}), 401
     
     conn = get_db_connection()
-    exam_filter = request.args.get('exam', '')
-    wing_filter = request.args.get('wing', '')
-    district_filter = request.args.get('district', '')
-    section_filter = request.args.get('section', '')
-    status_filter = request.args.get('status', '')
-    search_filter = request.args.get('search', '').lower()
-    
-    query = '''
+    stats = admin_results_stats_sql(conn, request.args)
+    conn.close()
+    return jsonify(stats)
+
+@app.route('/admin/results/api')
+def admin_results_api():
+    """Filtered, keyset-paginated admin results as slim JSON rows"""
+    if not is_admin_logged_in():
+        return jsonify({'error': 'unauthorized'}), 401
+    
+    try:
+        limit = int(request.args.get('limit', ADMIN_RESULTS_PAGE_SIZE))
+    except ValueError:
+        limit = ADMIN_RESULTS_PAGE_SIZE
+    limit = max(1, min(limit, ADMIN_RESULTS_MAX_PAGE_SIZE))
+    
+    where_sql, params = admin_results_filter_sql(request.args)
+    cursor = request.args.get('cursor', '').strip()
+    if cursor:
+        key = decode_results_cursor(cursor)
+        if key is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        after_sql, after_params = keyset_after_sql(ADMIN_RESULTS_ORDER, key)
+        where_sql += f' AND {after_sql}'
+        params += after_params
+    
+    conn = get_db_connection()
+    rows = conn.execute(admin_results_page_sql(where_sql), params + [limit + 1]).fetchall()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    results = [{
+        'id': row['id'],
+        'nsi_id': row['nsi_id'],
+        'name': row['name'],
+        'exam': row['exam_title'],
+        'score': row['percentage'],
+        'passed': row['percentage'] >= (row['passing_score'] or 0),
+        'rank': row['user_rank'],
+        'avg_score': round(row['user_avg_score'], 1) if row['user_avg_score'] is not None else None,
+        'start_time': str(row['start_time']) if row['start_time'] else None,
+        'end_time': str(row['end_time']) if row['end_time'] else None,
+        'duration_minutes': row['duration_minutes'],
+        'wing': row['wing_name'],
+        'division': row['division_name'],
+        'district': row['district_name'],
+        'section': row['section_name']
+    } for row in rows]
+    
+    response_data = {
+        'results': results,
+        'next_cursor': encode_results_cursor(rows[-1]) if has_more else None
+    }
+    if not cursor:
+        # Stats only change with the filters, so send them with the first page
+        response_data['stats'] = admin_results_stats_sql(conn, request.args)
+    conn.close()
+    return jsonify(response_data)
+
+def export_results_sql(where_sql):
+    """Result rows of the full export, newest first"""
+    # Ranks and average scores come from the materialized leaderboards
+    return f'''
         SELECT 
-            es.id, es.score, e.passing_score, u.name, u.nsi_id
+            es.id, es.user_id, es.exam_id, es.score, es.start_time, es.end_time, es.duration_minutes,
+            es.answers, es.answers_detail, es.paper, es.questions_json,
+            {RESULT_PERCENTAGE_SQL} as percentage,
+            u.nsi_id, u.name, u.wing_name, u.district_name, u.section_name,
+            e.title as exam_title, e.passing_score,
+            lb.rank as user_rank,
+            gl.avg_score as user_avg_score
         FROM exam_sessions es
         JOIN users u ON es.user_id = u.id
         JOIN exams e ON es.exam_id = e.id
-        WHERE es.is_completed = 1
+        LEFT JOIN exam_leaderboard lb ON lb.session_id = es.id
+        LEFT JOIN global_leaderboard gl ON gl.user_id = es.user_id
+        WHERE {where_sql}
+        ORDER BY es.end_time DESC
     '''
-    params = []
-    if exam_filter:
-        query += ' AND e.title = ?'
-        params.append(exam_filter)
-    if wing_filter:
-        query += ' AND u.wing_name = ?'
-        params.append(wing_filter)
-    if district_filter:
-        query += ' AND u.district_name = ?'
-        params.append(district_filter)
-    if section_filter:
-        query += ' AND u.section_name = ?'
-        params.append(section_filter)
-    if status_filter:
-        if status_filter == 'passed':
-            query += ' AND es.score >= e.passing_score'
-        elif status_filter == 'failed':
-            query += ' AND es.score < e.passing_score'
-    
-    query += ' ORDER BY es.end_time DESC'
-    
-    rows = conn.execute(query, params).fetchall()
-    
-    if search_filter:
-        rows = [r for r in rows if search_filter in r['name'].lower() or search_filter in r['nsi_id'].lower()]
-    
-    total = len(rows)
-    passed = sum(1 for r in rows if r['score'] >= r['passing_score']) if total > 0 else 0
-    failed = total - passed
-    average = round(sum(r['score'] for r in rows) / total, 1) if total > 0 else 0
-    
-    conn.close()
-    return jsonify({'total': total, 'passed': passed, 'failed': failed, 'average': average})
+
+register_hot_query('export_results.completed_sessions', export_results_sql(admin_results_filter_sql({})[0]))
 
 @app.route('/admin/results/export')
 def export_results():
-    """Export results to CSV with all dashboard columns and detailed answers"""
+    """Stream results as CSV/NDJSON with all dashboard columns and detailed answers"""
     if not is_admin_logged_in():
         flash('Please login as admin', 'error')
         return redirect(url_for('admin_login'))
     
-    conn = get_db_connection()
-    
-    # Get all results with ranking calculation (same query as admin_results)
-    results = conn.execute('''
-        WITH RankedResults AS (
-            SELECT 
-                es.id, es.user_id, es.exam_id, es.score, es.start_time, es.end_time, 
-                es.answers_detail, es.duration_minutes,
-                u.nsi_id, u.name, u.wing_name, u.district_name, u.section_name,
-                e.title as exam_title, e.passing_score,
-                RANK() OVER (
-                    PARTITION BY es.exam_id 
-                    ORDER BY es.score DESC, es.duration_minutes ASC
-                ) as user_rank
-            FROM exam_sessions es
-            JOIN users u ON es.user_id = u.id
-            JOIN exams e ON es.exam_id = e.id
-            WHERE es.is_completed = 1
-        ),
-        UserAvgScores AS (
-            SELECT 
-                user_id,
-                AVG(score) as user_avg_score
-            FROM exam_sessions 
-            WHERE is_completed = 1 
-            GROUP BY user_id
-        )
-        SELECT 
-            rr.*,
-            uas.user_avg_score
-        FROM RankedResults rr
-        LEFT JOIN UserAvgScores uas ON rr.user_id = uas.user_id
-        ORDER BY rr.end_time DESC
-    ''').fetchall()
-    
-    # CSV header with all dashboard columns
-    csv_content = "Rank,NSI ID,Name,Exam,Score,Avg Score,Start Time,End Time,Duration,Status,Wing,District,Completed,Questions and Answers\n"
-    
-    for result in results:
-        # Calculate status
-        status = "Passed" if result['score'] >= result['passing_score'] else "Failed"
-        
-        # Format duration
-        if result['duration_minutes']:
-            duration_minutes = result['duration_minutes']
-            hours = int(duration_minutes // 60)
-            minutes = int(duration_minutes % 60)
-            seconds = int((duration_minutes % 1) * 60)
-            
-            if hours > 0:
-                duration_str = f"{hours}h {minutes}m"
-            elif minutes > 0:
-                duration_str = f"{minutes}m {seconds}s"
-            else:
-                duration_str = f"{duration_minutes:.1f}m"
-        else:
-            duration_str = "-"
-        
-        # Format times
-        start_time_str = result['start_time'].strftime('%Y-%m-%d %H:%M:%S') if result['start_time'] else '-'
-        end_time_str = result['end_time'].strftime('%Y-%m-%d %H:%M:%S') if result['end_time'] else '-'
-        completed_str = result['end_time'].strftime('%Y-%m-%d %H:%M:%S') if result['end_time'] else '-'
-        
-        # Format average score
-        avg_score_str = f"{result['user_avg_score']:.1f}%" if result['user_avg_score'] else "Pending"
-        
-        # Process detailed answers
-        answers_detail = json.loads(result['answers_detail'] or '{}')
-        questions_answers = []
-        for q in answers_detail:
-            questions_answers.append(f"Q: {q['question']} | A: {q['selected_answer']}")
-        questions_answers_str = '; '.join(questions_answers)
-        
-        # Build CSV row with all columns
-        csv_content += f'#{result["user_rank"] or "-"},'
-        csv_content += f'"{result["nsi_id"]}",'
-        csv_content += f'"{result["name"]}",'
-        csv_content += f'"{result["exam_title"]}",'
-        csv_content += f'{result["score"]}%,'
-        csv_content += f'"{avg_score_str}",'
-        csv_content += f'"{start_time_str}",'
-        csv_content += f'"{end_time_str}",'
-        csv_content += f'"{duration_str}",'
-        csv_content += f'"{status}",'
-        csv_content += f'"{result["wing_name"] or "-"}",'
-        csv_content += f'"{result["district_name"] or "-"}",'
-        csv_content += f'"{completed_str}",'
-        csv_content += f'"{questions_answers_str}"\n'
-    
-    conn.close()
-    
-    response = make_response(csv_content)
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = 'attachment; filename=exam_results_complete.csv'
-    
-    return response
+    fmt, compress = export_options(request.args)
+    where_sql, params = admin_results_filter_sql(request.args)
+    
+    query = export_results_sql(where_sql)
+    header = ['Rank', 'NSI ID', 'Name', 'Exam', 'Score', 'Avg Score', 'Start Time', 'End Time', 'Duration',
+              'Status', 'Wing', 'District', 'Completed', 'Questions and Answers']
+    
+    def row_batches():
+        for conn, results in iter_query_batches(query, params):
+            summaries = export_answer_summaries(conn, results)
+            rows = []
+            for result in results:
+                status = "Passed" if result['percentage'] >= (result['passing_score'] or 0) else "Failed"
+                avg_score_str = f"{result['user_avg_score']:.1f}%" if result['user_avg_score'] else "Pending"
+                rows.append([
+                    f'#{result["user_rank"] or "-"}',
+                    result['nsi_id'],
+                    result['name'],
+                    result['exam_title'],
+                    f"{result['percentage']}%",
+                    avg_score_str,
+                    format_export_time(result['start_time']),
+                    format_export_time(result['end_time']),
+                    format_export_duration(result['duration_minutes']),
+                    status,
+                    result['wing_name'] or '-',
+                    result['district_name'] or '-',
+                    format_export_time(result['end_time']),
+                    summaries.get(result['id'], '')
+                ])
+            yield rows
+    
+    return export_response('exam_results_complete', header, row_batches(), fmt, compress)
 
 @app.route('/admin/results/<int:result_id>/details')
 def get_result_details(result_id):
@@ -3747,10 +6729,7 @@ def get_result_details(result_id):
     if not result:
         return jsonify({'error': 'Result not found'}), 404
     
-    try:
-        answers = json.loads(result['answers_detail'] or '[]')
-    except (KeyError, json.JSONDecodeError):
-        answers = []
+    answers = session_answer_details(conn, result)
     
     response_data = {
         'id': result['id'],
@@ -3829,6 +6808,8 @@ def edit_exam(exam_id):
                   max_attempts, scheduled_start, scheduled_end, exam_id))
             conn.commit()
             conn.close()
+            if scheduled_start:
+                paper_builder.schedule(exam_id)
             return jsonify({'success': True})
         except Exception as e:
             conn.close()
@@ -3865,6 +6846,8 @@ def activate_exam(exam_id):
                      (scheduled_start, exam_id))
         conn.commit()
         conn.close()
+        if scheduled_start:
+            paper_builder.schedule(exam_id)
         return jsonify({'success': True})
     except Exception as e:
         conn.close()
@@ -3885,10 +6868,13 @@ def delete_exam(exam_id):
         return jsonify({'error': 'Exam not found'}), 404
     
     try:
+        affected_users = [row[0] for row in conn.execute(
+            'SELECT DISTINCT user_id FROM exam_sessions WHERE exam_id = ?', (exam_id,))]
         # Delete associated exam sessions
         conn.execute('DELETE FROM exam_sessions WHERE exam_id = ?', (exam_id,))
         # Delete the exam
         conn.execute('DELETE FROM exams WHERE id = ?', (exam_id,))
+        update_leaderboards(conn, exam_ids=[exam_id], user_ids=affected_users)
         conn.commit()
         conn.close()
         return jsonify({'success': True})
@@ -4015,38 +7001,55 @@ def admin_users():
     
     # Handle the export action
     elif request.args.get('action') == 'export':
-        # Get all users
-        users = conn.execute('SELECT * FROM users ORDER BY created_at DESC').fetchall()
-        
-        # Create CSV content
-        import io
-        import csv
-        from flask import Response
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['NSI ID', 'Name', 'Wing', 'District', 'Section', 'Created At'])
-        
-        # Write user data
-        for user in users:
-            writer.writerow([
-                user['nsi_id'],
-                user['name'],
-                user['wing_name'] or '',
-                user['district_name'] or '',
-                user['section_name'] or '',
-                user['created_at']
-            ])
-        
-        # Create response
         conn.close()
-        return Response(
-            output.getvalue(),
-            mimetype="text/csv",
-            headers={"Content-disposition": "attachment; filename=users.csv"}
-        )
+        fmt, compress = export_options(request.args)
+        
+        clauses = ['1 = 1']
+        params = []
+        wing_filter = request.args.get('wing', '').strip()
+        if wing_filter:
+            clauses.append('wing_name = ? COLLATE NOCASE')
+            params.append(wing_filter)
+        exam_filter = request.args.get('exam', '').strip()
+        if exam_filter:
+            # Users who completed the given exam
+            clauses.append('''EXISTS (
+                SELECT 1 FROM exam_sessions es JOIN exams e ON es.exam_id = e.id
+                WHERE es.user_id = users.id AND es.is_completed = 1 AND e.title = ? COLLATE NOCASE
+            )''')
+            params.append(exam_filter)
+        date_from = request.args.get('from', '').strip()
+        if date_from:
+            clauses.append('created_at >= ?')
+            params.append(date_from)
+        date_to = request.args.get('to', '').strip()
+        if date_to:
+            try:
+                date_to = (datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            except ValueError:
+                pass
+            clauses.append('created_at < ?')
+            params.append(date_to)
+        
+        query = f'''
+            SELECT nsi_id, name, wing_name, district_name, section_name, created_at
+            FROM users WHERE {' AND '.join(clauses)}
+            ORDER BY created_at DESC
+        '''
+        header = ['NSI ID', 'Name', 'Wing', 'District', 'Section', 'Created At']
+        
+        def row_batches():
+            for _conn, users in iter_query_batches(query, params):
+                yield [[
+                    user['nsi_id'],
+                    user['name'],
+                    user['wing_name'] or '',
+                    user['district_name'] or '',
+                    user['section_name'] or '',
+                    user['created_at']
+                ] for user in users]
+        
+        return export_response('users', header, row_batches(), fmt, compress)
     
     # Handle add_new action to show the add user form
     elif request.args.get('action') == 'add_new':
@@ -4068,7 +7071,9 @@ def admin_users():
                 
                 # Delete the users
                 placeholders = ','.join(['?'] * len(user_ids))
+                affected_exams = leaderboard_scope(conn, user_ids)
                 conn.execute(f"DELETE FROM users WHERE id IN ({placeholders}) AND nsi_id != 'admin'", user_ids)
+                update_leaderboards(conn, exam_ids=affected_exams, user_ids=user_ids)
                 conn.commit()
                 
                 return jsonify({
@@ -4100,7 +7105,9 @@ def admin_users():
                 
                 # Reset attempts for these users
                 placeholders = ','.join(['?'] * len(user_ids))
+                affected_exams = leaderboard_scope(conn, user_ids)
                 conn.execute(f"DELETE FROM exam_sessions WHERE user_id IN ({placeholders})", user_ids)
+                update_leaderboards(conn, exam_ids=affected_exams, user_ids=user_ids)
                 conn.commit()
                 
                 return jsonify({
@@ -4125,7 +7132,9 @@ def admin_users():
             user_id = int(user_id)
             user = conn.execute("SELECT nsi_id FROM users WHERE id = ?", (user_id,)).fetchone()
             if user:
+                affected_exams = leaderboard_scope(conn, [user_id])
                 conn.execute("DELETE FROM exam_sessions WHERE user_id = ?", (user_id,))
+                update_leaderboards(conn, exam_ids=affected_exams, user_ids=[user_id])
                 conn.commit()
                 flash(f"Exam attempts reset for user {user['nsi_id']}", 'success')
             else:
@@ -4138,7 +7147,10 @@ def admin_users():
     elif 'delete' in request.args:
         nsi_id = request.args.get('delete')
         if nsi_id != 'admin':
+            user_ids = [row[0] for row in conn.execute('SELECT id FROM users WHERE nsi_id = ?', (nsi_id,))]
+            affected_exams = leaderboard_scope(conn, user_ids)
             conn.execute('DELETE FROM users WHERE nsi_id = ?', (nsi_id,))
+            update_leaderboards(conn, exam_ids=affected_exams, user_ids=user_ids)
             conn.commit()
             flash(f'User {nsi_id} deleted successfully!', 'success')
             return redirect(url_for('admin_dashboard'))
@@ -4246,7 +7258,10 @@ def delete_user(nsi_id):
         flash('Please login as admin', 'error')
         return redirect(url_for('admin_login'))
     conn = get_db_connection()
+    user_ids = [row[0] for row in conn.execute('SELECT id FROM users WHERE nsi_id = ?', (nsi_id,))]
+    affected_exams = leaderboard_scope(conn, user_ids)
     conn.execute('DELETE FROM users WHERE nsi_id = ?', (nsi_id,))
+    update_leaderboards(conn, exam_ids=affected_exams, user_ids=user_ids)
     conn.commit()
     conn.close()
     flash(f'User {nsi_id} deleted successfully!', 'success')
@@ -4509,9 +7524,28 @@ def youtube_debug():
     return render_template('youtube_test_standalone.html')
 
 if __name__ == '__main__':
-    migrate_database()  # Run migrations first
-    migrate_passwords_to_bcrypt()  # Migrate passwords to bcrypt
-    init_database()
+    if '--plan' in sys.argv:
+        # Dry run: report pending schema migrations and exit
+        print_migration_plan()
+        check_query_plans()
+        sys.exit(0)
+    if '--sweep' in sys.argv:
+        # Cron mode: finalize expired sessions once and exit
+        run_migrations()
+        print(f"Finalized {session_sweeper.sweep()} expired exam session(s)")
+        sys.exit(0)
+    if '--prepare-papers' in sys.argv:
+        # Build papers for every exam scheduled to start later and exit
+        run_migrations()
+        for exam_id, built in prepare_scheduled_exams().items():
+            print(f"Exam {exam_id}: {built} new paper(s)")
+        sys.exit(0)
+    if '--build-assets' in sys.argv:
+        # Build step: write the hashed static bundles and exit
+        for name, dist_name in asset_pipeline.build().items():
+            print(f"{name} -> static/{dist_name}")
+        sys.exit(0)
+    run_migrations()
     
     print("=" * 50)
     print("Simple Online Examination System")
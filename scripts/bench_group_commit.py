@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Benchmark: per-request commit vs group commit for a burst of exam submissions
+
+Seeds a scratch copy of the database with N examinees who have each started
+the same exam, then submits every paper at once from N threads (one Flask
+test client each, released together by a barrier), first with one commit per
+request and then through the group-commit writer. Each mode runs against its
+own copy of the seeded database and reports latency percentiles, throughput,
+failures and the number of write transactions.
+
+Both modes run with the default configuration, admission control included:
+a queued submit is retried after its Retry-After like the exam page does,
+and its latency covers the whole wait.
+
+    python scripts/bench_group_commit.py [--submits 500] [--synchronous FULL]
+"""
+import argparse
+import os
+import random
+import re
+import secrets
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+BENCH_EXAM = 'Group Commit Benchmark Exam'
+QUESTION_RE = re.compile(r'name="question_(\d+)" value="([A-Z])"')
+SESSION_RE = re.compile(r'/exam/(\d+)/submit')
+
+
+def default_source():
+    live = ROOT / 'exam_system.db'
+    return live if live.exists() else ROOT / 'exam_system copy 2.db'
+
+
+def login(client, user_id):
+    with client.session_transaction() as flask_session:
+        flask_session['user_logged_in'] = True
+        flask_session['user_id'] = user_id
+        flask_session['user_name'] = 'Benchmark User'
+
+
+def seed(new, database, submits, num_questions):
+    """Create the exam and users and start every paper; returns [(user_id, session_id, answers)]"""
+    conn = new.open_db_connection(str(database))
+    try:
+        num_questions = min(num_questions, conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0])
+        exam_id = conn.execute('''
+            INSERT INTO exams (title, description, duration_minutes, num_questions, passing_score,
+                               max_attempts, is_active)
+            VALUES (?, 'Synthetic burst for scripts/bench_group_commit.py', 60, ?, 60, 1, 1)
+        ''', (BENCH_EXAM, num_questions)).lastrowid
+        taken = {row[0] for row in conn.execute('SELECT nsi_id FROM users')}
+        nsi_ids = [nsi_id for nsi_id in (f'{letter}-{number:04d}' for letter in 'dcba' for number in range(9999, -1, -1))
+                   if nsi_id not in taken][:submits]
+        user_ids = []
+        for i, nsi_id in enumerate(nsi_ids):
+            user_ids.append(conn.execute('''
+                INSERT INTO users (nsi_id, name, password_hash, profile_completed, wing_name,
+                                   district_name, section_name)
+                VALUES (?, ?, '!', 1, 'Internal', 'Dhaka', 'Benchmark')
+            ''', (nsi_id, f'Benchmark User {i + 1}')).lastrowid)
+        conn.commit()
+    finally:
+        conn.force_close()
+
+    rng = random.Random(submits)
+    papers = []
+    for user_id in user_ids:
+        client = new.app.test_client()
+        login(client, user_id)
+        body = client.get(f'/exam/{exam_id}/start').get_data(as_text=True)
+        session = SESSION_RE.search(body)
+        if not session:
+            raise SystemExit(f'Could not start the exam for user {user_id}')
+        options = {}
+        for question_id, letter in QUESTION_RE.findall(body):
+            options.setdefault(question_id, []).append(letter)
+        answers = {question_id: rng.choice(letters) for question_id, letters in options.items()}
+        papers.append((user_id, int(session.group(1)), answers))
+    return papers
+
+
+def burst(new, papers):
+    """Submit every paper at once; returns (wall seconds, [latency], {error: count}, queued retries)"""
+    barrier = threading.Barrier(len(papers) + 1)
+    latencies = []
+    errors = {}
+    retries = [0]
+    lock = threading.Lock()
+
+    def examinee(user_id, session_id, answers):
+        client = new.app.test_client()
+        login(client, user_id)
+        barrier.wait()
+        started = time.perf_counter()
+        while True:
+            response = client.post(f'/exam/{session_id}/submit', json={'answers': answers})
+            data = response.get_json(silent=True) or {}
+            if not data.get('queued'):
+                break
+            with lock:
+                retries[0] += 1
+            time.sleep(data.get('retry_after', 1))
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code != 200 or not data.get('success'):
+                error = f"HTTP {response.status_code}: {data.get('message', '')[:60]}"
+                errors[error] = errors.get(error, 0) + 1
+
+    threads = [threading.Thread(target=examinee, args=paper, daemon=True) for paper in papers]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, errors, retries[0]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))]
+
+
+def run_mode(new, seeded, workdir, papers, group_commit):
+    database = workdir / ('group.db' if group_commit else 'per_request.db')
+    shutil.copy(seeded, database)
+    new.DATABASE = str(database)
+    new.app.config['GROUP_COMMIT_ENABLED'] = group_commit
+    batches_before = new.group_commit_writer.stats()['batches']
+    wall, latencies, errors, retries = burst(new, papers)
+    conn = new.open_db_connection(str(database))
+    try:
+        stored = conn.execute('SELECT COUNT(*) FROM exam_sessions WHERE id IN (%s) AND is_completed = 1'
+                              % ','.join(str(session_id) for _, session_id, _ in papers)).fetchone()[0]
+    finally:
+        conn.force_close()
+    transactions = new.group_commit_writer.stats()['batches'] - batches_before if group_commit else stored
+    return {
+        'mode': 'group commit' if group_commit else 'per-request commit',
+        'wall': wall,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': max(latencies) * 1000,
+        'errors': sum(errors.values()),
+        'error_detail': errors,
+        'retries': retries,
+        'stored': stored,
+        'transactions': transactions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--submits', type=int, default=500, help='concurrent submissions')
+    parser.add_argument('--questions', type=int, default=30, help='questions per paper')
+    parser.add_argument('--synchronous', default=None, help='PRAGMA synchronous for both runs (default: app config)')
+    parser.add_argument('--window', type=float, default=None, help='group commit window in seconds')
+    parser.add_argument('--source', default=str(default_source()), help='database to copy')
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix='exam-group-commit-'))
+    seeded = workdir / 'seeded.db'
+    shutil.copy(args.source, seeded)
+    os.environ['EXAM_DATABASE'] = str(seeded)
+    os.environ.setdefault('EXAM_SWEEPER', '0')
+    os.environ.setdefault('EXAM_METRICS', '0')
+    os.environ.setdefault('EXAM_SECRET_KEY', secrets.token_hex(32))  # never write secret_key.txt
+    sys.path.insert(0, str(ROOT))
+    import new  # noqa: E402  (imported here so EXAM_DATABASE is picked up)
+
+    if args.synchronous:
+        new.app.config['DB_SYNCHRONOUS'] = args.synchronous
+    if args.window is not None:
+        new.app.config['GROUP_COMMIT_WINDOW'] = args.window
+    try:
+        new.run_migrations()
+        print(f"Starting {args.submits} papers in {seeded} ...")
+        papers = seed(new, seeded, args.submits, args.questions)
+        new.db_pool.close_all()
+        print(f"synchronous={new.app.config['DB_SYNCHRONOUS']}, "
+              f"admission {'on' if new.app.config['ADMISSION_ENABLED'] else 'off'} "
+              f"({new.app.config['ADMISSION_WRITERS']} writers), "
+              f"group commit window {new.app.config['GROUP_COMMIT_WINDOW'] * 1000:g} ms, "
+              f"max batch {new.app.config['GROUP_COMMIT_MAX_BATCH']}\n")
+        print(f"{'mode':<20} {'wall s':>7} {'subm/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'max ms':>8} {'errors':>6} {'stored':>6} {'txns':>5} {'queued':>6}")
+        for group_commit in (False, True):
+            result = run_mode(new, seeded, workdir, papers, group_commit)
+            new.db_pool.close_all()
+            print(f"{result['mode']:<20} {result['wall']:>7.2f} {args.submits / result['wall']:>7.0f} "
+                  f"{result['p50']:>8.1f} {result['p95']:>8.1f} {result['p99']:>8.1f} {result['max']:>8.1f} "
+                  f"{result['errors']:>6} {result['stored']:>6} {result['transactions']:>5} {result['retries']:>6}")
+            for error, count in result['error_detail'].items():
+                print(f"    {count} x {error}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
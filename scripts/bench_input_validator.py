@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: precompiled InputValidator scanner vs the old per-pattern loops
+
+Checks that both implementations agree on a mixed corpus, then times them.
+
+    python scripts/bench_input_validator.py [--rounds 2000]
+"""
+import argparse
+import html
+import os
+import random
+import re
+import secrets
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault('EXAM_SECRET_KEY', secrets.token_hex(32))  # never write secret_key.txt
+import new  # noqa: E402
+
+
+# --- Previous implementation, kept verbatim for comparison -------------------
+
+def legacy_detect_sql_injection(value, strict=True):
+    if not value:
+        return False
+    value_lower = str(value).lower()
+    if strict:
+        sql_patterns = [
+            r"(\s*(;|'|\"|\-\-|\/\*|\*\/|@@|@|char|nchar|varchar|nvarchar|alter|begin|cast|create|cursor|declare|delete|drop|end|exec|execute|fetch|insert|kill|open|select|sys|sysobjects|syscolumns|table|update)\s*)",
+            r"(\s*(union|join|where|order\s+by|group\s+by|having)\s+)",
+            r"(\s*(script|javascript|vbscript|onload|onerror|onclick)\s*)",
+        ]
+    else:
+        sql_patterns = [
+            r";\s*(drop|delete|truncate|alter|create|exec|execute)\s+",
+            r"(union\s+select|union\s+all\s+select)",
+            r"(exec\s*\(|execute\s*\()",
+            r"(--|\/\*|\*\/)\s*(drop|delete|insert|update|exec)",
+        ]
+    for pattern in sql_patterns:
+        if re.search(pattern, value_lower):
+            return True
+    return False
+
+
+def legacy_detect_xss(value, strict=True):
+    if not value:
+        return False
+    value_lower = str(value).lower()
+    if strict:
+        xss_patterns = [
+            r'<script[^>]*>', r'javascript:', r'onload\s*=', r'onerror\s*=', r'onclick\s*=',
+            r'onmouseover\s*=', r'<iframe[^>]*>', r'<object[^>]*>', r'<embed[^>]*>',
+        ]
+    else:
+        xss_patterns = [
+            r'<script[^>]*>.*</script>', r'javascript:\s*[a-z]',
+            r'on\w+\s*=\s*["\']?\s*(javascript|alert)', r'<iframe[^>]*src\s*=',
+            r'<object[^>]*data\s*=', r'<embed[^>]*src\s*=',
+        ]
+    for pattern in xss_patterns:
+        if re.search(pattern, value_lower):
+            return True
+    return False
+
+
+def legacy_safe_html(value):
+    if not value:
+        return ""
+    return html.escape(re.sub(r'<[^>]+>', '', str(value)))
+
+
+def legacy_safe_text(value, max_length=500):
+    if not value:
+        return ""
+    text = str(value)
+    text = re.sub(r'<script[^>]*>.*?</script>', '', text, flags=re.IGNORECASE | re.DOTALL)
+    text = re.sub(r'javascript:', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'on\w+\s*=', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'<[^>]+>', '', text)
+    if max_length and len(text) > max_length:
+        text = text[:max_length] + "..."
+    return html.escape(text)
+
+
+def legacy_strip_dangerous(value):
+    if not value:
+        return ""
+    text = str(value)
+    for pattern in [
+        r'<script[^>]*>.*?</script>', r'<iframe[^>]*>.*?</iframe>', r'<object[^>]*>.*?</object>',
+        r'<embed[^>]*>.*?</embed>', r'javascript:', r'vbscript:', r'data:text/html', r'on\w+\s*=',
+    ]:
+        text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
+    return html.escape(text)
+
+
+# --- Corpus -------------------------------------------------------------------
+
+CORPUS = [
+    'a-1234', 'd-0042', 'Md. Abdul Karim', "O'Brien-Smith", 'Cyber Security Awareness Week',
+    'Which of the following is the strongest password policy for a shared workstation?',
+    'Phishing emails often create a sense of urgency. ' * 6,
+    'Dhaka Metropolitan', 'Border', 'Internal', 'Option C: Enable two-factor authentication',
+    "x' OR '1'='1", '1; DROP TABLE users --', 'admin@@version', 'UNION SELECT password FROM admins',
+    '<script>alert(1)</script>', '<img src=x onerror=alert(1)>', 'javascript:alert(document.cookie)',
+    '<iframe src="https://evil.example"></iframe>', 'onclick = "javascript:void(0)"',
+    'Normal answer with <b>bold</b> and <i>italic</i> markup',
+]
+
+
+FRAGMENTS = ['<', '>', 'script', '</script>', 'on', 'click', '=', ' ', 'javascript', ':', '<iframe',
+             '</iframe>', 'data:text/html', "'", '--', 'drop ', 'union select', 'exec(', '\n', 'abc']
+
+
+def fuzz_values(count, seed=2025):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 12))) for _ in range(count)]
+
+
+def check_equivalence():
+    mismatches = 0
+    for value in CORPUS + [v.upper() for v in CORPUS] + fuzz_values(5000):
+        for strict in (True, False):
+            mismatches += new.InputValidator.detect_sql_injection(value, strict) != legacy_detect_sql_injection(value, strict)
+            mismatches += new.InputValidator.detect_xss(value, strict) != legacy_detect_xss(value, strict)
+        mismatches += new.safe_html_filter(value) != legacy_safe_html(value)
+        mismatches += new.safe_text_filter(value) != legacy_safe_text(value)
+        mismatches += new.safe_text_filter(value, 40) != legacy_safe_text(value, 40)
+        mismatches += new.strip_dangerous_filter(value) != legacy_strip_dangerous(value)
+    return mismatches
+
+
+def scan_all(detect_sql, detect_xss):
+    for value in CORPUS:
+        detect_sql(value)
+        detect_xss(value)
+        detect_sql(value, False)
+        detect_xss(value, False)
+
+
+def filter_all(safe_html, safe_text, strip_dangerous):
+    for value in CORPUS:
+        safe_html(value)
+        safe_text(value)
+        strip_dangerous(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    mismatches = check_equivalence()
+    print(f"Equivalence check: {mismatches} mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+    # The memoized helpers without their cache, i.e. a page full of unseen values
+    uncached_html = new._safe_html.__wrapped__
+    uncached_text = new._safe_text.__wrapped__
+    uncached_dangerous = new._strip_dangerous.__wrapped__
+    cases = [
+        ('detect_* (per field)', 4,
+         lambda: scan_all(legacy_detect_sql_injection, legacy_detect_xss),
+         lambda: scan_all(new.InputValidator.detect_sql_injection, new.InputValidator.detect_xss)),
+        ('filters (cache cold)', 3,
+         lambda: filter_all(legacy_safe_html, legacy_safe_text, legacy_strip_dangerous),
+         lambda: filter_all(lambda v: uncached_html(str(v)), lambda v: uncached_text(str(v), 500),
+                            lambda v: uncached_dangerous(str(v)))),
+        ('filters (memoized)', 3,
+         lambda: filter_all(legacy_safe_html, legacy_safe_text, legacy_strip_dangerous),
+         lambda: filter_all(new.safe_html_filter, new.safe_text_filter, new.strip_dangerous_filter)),
+    ]
+    print(f"{'case':<24}{'before µs/call':>16}{'after µs/call':>16}{'speedup':>10}")
+    for name, calls_per_value, before, after in cases:
+        before_time = min(timeit.repeat(before, number=args.rounds, repeat=3))
+        after_time = min(timeit.repeat(after, number=args.rounds, repeat=3))
+        per_call = 1e6 / (args.rounds * len(CORPUS) * calls_per_value)
+        print(f"{name:<24}{before_time * per_call:>16.2f}{after_time * per_call:>16.2f}"
+              f"{before_time / after_time:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
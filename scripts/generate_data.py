@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""Synthetic data generator: a fresh database with a production-sized question bank, users and sessions
+
+Fills a new database (schema from run_migrations) with:
+
+- users spread over the wings, divisions and districts of the registration
+  form (new.WINGS / new.DIVISION_DISTRICTS), all with completed profiles and
+  one shared password
+- questions across easy/medium/hard/unseen/image/video, a few with E/F options
+- exams with category_config papers like the ones admin_add_exam builds
+- completed sessions with compact papers, graded by a per-user skill and
+  per-difficulty hit rate, stored in session_answers (--answers normalized)
+  or in the legacy answers/answers_detail JSON columns (--answers json)
+
+Rows are written with executemany in large transactions, then the
+leaderboards are rebuilt once at the end. The defaults (100k users, 20k
+questions, 1M sessions, ~31M answer rows) take about ten minutes and ~2 GB.
+
+    python scripts/generate_data.py --database /tmp/big.db
+    python scripts/generate_data.py --database /tmp/small.db --users 2000 --questions 500 --sessions 20000
+
+NSI ids follow the login format (a-0000 .. d-9999), which only has room for
+40,000 users; users beyond that get six-digit ids (e-000000, ...) and exist
+for data volume only - they cannot log in.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import secrets
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+PASSWORD = 'Synthetic#2025'
+LOGIN_ID_CAPACITY = 40000
+
+# Share of the question bank per category and the base hit rate of an average examinee
+QUESTION_MIX = {'easy': 0.30, 'medium': 0.30, 'hard': 0.18, 'unseen': 0.10, 'image': 0.07, 'video': 0.05}
+HIT_RATE = {'easy': 0.85, 'medium': 0.65, 'hard': 0.45, 'unseen': 0.35, 'image': 0.60, 'video': 0.60}
+SKIP_RATE = 0.04  # questions left blank
+
+# Papers per exam, as admin_add_exam would store them in category_config
+EXAM_TEMPLATES = [
+    {'easy': 10, 'medium': 6, 'hard': 4},
+    {'easy': 8, 'medium': 6, 'hard': 4, 'image': 1, 'video': 1},
+    {'easy': 5, 'medium': 10, 'hard': 10, 'image': 3, 'video': 2},
+    {'medium': 15, 'hard': 10, 'unseen': 5},
+    {'easy': 20, 'medium': 20, 'hard': 10},
+]
+
+TOPICS = ['password policy', 'phishing', 'social engineering', 'removable media', 'encryption',
+          'incident reporting', 'physical security', 'patch management', 'mobile devices',
+          'classified documents', 'network access', 'backups', 'malware', 'public Wi-Fi']
+SECTIONS = ['Analysis', 'Operations', 'Coordination', 'Logistics', 'Records', 'Liaison', 'Planning', 'IT']
+FIRST_NAMES = ['Abdul', 'Md.', 'Mohammad', 'Nusrat', 'Farhana', 'Rahim', 'Karim', 'Tanvir', 'Sadia',
+               'Imran', 'Shirin', 'Habib', 'Jahid', 'Rokeya', 'Sabbir', 'Mahmud', 'Nasrin', 'Arif']
+LAST_NAMES = ['Hossain', 'Rahman', 'Islam', 'Ahmed', 'Akter', 'Khan', 'Chowdhury', 'Uddin', 'Begum',
+              'Sarkar', 'Haque', 'Alam', 'Miah', 'Sultana', 'Kabir', 'Talukder']
+
+
+def nsi_ids(count):
+    """Login-format ids first, six-digit overflow ids after that"""
+    for i in range(count):
+        if i < LOGIN_ID_CAPACITY:
+            yield f"{'abcd'[i // 10000]}-{i % 10000:04d}"
+        else:
+            overflow = i - LOGIN_ID_CAPACITY
+            yield f"{'efghijklmnopqrstuvwxyz'[overflow // 1000000]}-{overflow % 1000000:06d}"
+
+
+def timestamp(value):
+    return value.isoformat(' ')
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_batched(conn, sql, rows, batch_size, label):
+    """executemany in batch_size chunks inside one transaction; returns the row count"""
+    total = 0
+    started = time.perf_counter()
+    for batch in batches(rows, batch_size):
+        conn.executemany(sql, batch)
+        total += len(batch)
+    conn.commit()
+    print(f"  {label}: {total:,} rows in {time.perf_counter() - started:.1f}s")
+    return total
+
+
+# --- Users --------------------------------------------------------------------
+
+def user_rows(new, rng, count, password_hash, now):
+    wings = new.WINGS
+    divisions = list(new.DIVISION_DISTRICTS)
+    # Headquarters wings are bigger than the small cells
+    wing_weights = [3 if 'Wing' in wing else 1 for wing in wings]
+    for i, nsi_id in enumerate(nsi_ids(count)):
+        wing = rng.choices(wings, wing_weights)[0]
+        internal_type = border_type = external_type = country = division = district = section = None
+        if wing in ('Internal Wing', 'Border Wing'):
+            location = 'HQ' if rng.random() < 0.3 else 'Others'
+            if wing == 'Internal Wing':
+                internal_type = location
+            else:
+                border_type = location
+            if location == 'HQ':
+                section = rng.choice(SECTIONS)
+            else:
+                division = rng.choice(divisions)
+                district = rng.choice(new.DIVISION_DISTRICTS[division])
+        elif wing == 'External Affairs & Liasons Wing':
+            external_type = 'Inside BD' if rng.random() < 0.7 else 'Outside BD'
+            if external_type == 'Inside BD':
+                section = rng.choice(SECTIONS)
+            else:
+                country = rng.choice(['India', 'Malaysia', 'Saudi Arabia', 'United Kingdom', 'USA'])
+        elif 'Wing' in wing:
+            section = rng.choice(SECTIONS)
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i + 1}'
+        created_at = timestamp(now - timedelta(days=rng.uniform(200, 900)))
+        yield (nsi_id, name, password_hash, wing, internal_type, border_type, external_type, country,
+               division, district, section, created_at)
+
+
+# --- Questions ----------------------------------------------------------------
+
+def question_rows(rng, count, now):
+    categories = list(QUESTION_MIX)
+    weights = list(QUESTION_MIX.values())
+    for i in range(count):
+        category = rng.choices(categories, weights)[0]
+        topic = rng.choice(TOPICS)
+        letters = 'ABCD'
+        extra = rng.random()
+        if extra < 0.08:
+            letters = 'ABCDEF'
+        elif extra < 0.15:
+            letters = 'ABCDE'
+        options = [f'Option {letter} about {topic} ({i + 1})' for letter in letters]
+        options += [None] * (6 - len(options))
+        question_image = question_youtube = None
+        if category == 'image':
+            question_image = f'static/uploads/synthetic/question_{i + 1}.png'
+        elif category == 'video':
+            question_youtube = f'https://www.youtube.com/watch?v=synthetic{i + 1:05d}'
+        text = f'Question {i + 1}: which practice is correct regarding {topic}?'
+        created_at = timestamp(now - timedelta(days=rng.uniform(365, 1000)))
+        yield (text, *options, rng.choice(letters), category, 'general', question_image,
+               question_youtube, category, created_at)
+
+
+# --- Exams and sessions -------------------------------------------------------
+
+def exam_rows(rng, count, now):
+    for i in range(count):
+        config = rng.choice(EXAM_TEMPLATES)
+        num_questions = sum(config.values())
+        start = now - timedelta(days=rng.uniform(0, 365))
+        yield (f'Synthetic Exam {i + 1}', f'Generated paper #{i + 1}', max(10, num_questions),
+               num_questions, 60, rng.choice([1, 1, 2, 3]), 1 if i >= count - 3 else 0,
+               json.dumps(config), timestamp(start), timestamp(start + timedelta(days=14)))
+
+
+def pick(rand, pool, k):
+    """k distinct items of pool; random.sample() is the bottleneck at this volume"""
+    n = len(pool)
+    if k >= n:
+        return list(pool)
+    chosen = set()
+    while len(chosen) < k:
+        chosen.add(pool[int(rand() * n)])
+    return list(chosen)
+
+
+def session_rows(new, rng, count, users, exams, bank, mode):
+    """Yield (session row, answer rows) for count completed sessions"""
+    OPTION_LETTERS = new.OPTION_LETTERS
+    rand = rng.random
+    by_category = {}
+    for qid, (category, letters, correct) in bank.items():
+        by_category.setdefault(category, []).append(qid)
+    # Every option order of every option count, with the position of each original letter
+    permutations = {}
+    for letters in {letters for _, letters, _ in bank.values()}:
+        permutations[letters] = [(''.join(order), {letter: OPTION_LETTERS[order.index(letter)] for letter in order})
+                                 for order in itertools.permutations(letters)]
+
+    user_ids = [user_id for user_id, _ in users]
+    skill = dict(users)
+    # A few very active examinees and a long tail of occasional ones
+    activity = [rng.paretovariate(1.5) for _ in user_ids]
+    attempts = {}
+
+    produced = 0
+    while produced < count:
+        picks = rng.choices(user_ids, activity, k=min(50000, count - produced))
+        for user_id in picks:
+            exam = rng.choice(exams)
+            key = (user_id, exam['id'])
+            if attempts.get(key, 0) >= exam['max_attempts']:
+                continue
+            attempts[key] = attempts.get(key, 0) + 1
+
+            entries = []
+            answer_rows = []
+            score = 0
+            user_skill = skill[user_id]
+            for category, num_q in exam['config'].items():
+                hit_rate = SKIP_RATE + HIT_RATE[category] * user_skill
+                for qid in pick(rand, by_category.get(category, []), num_q):
+                    _, letters, correct = bank[qid]
+                    orders = permutations[letters]
+                    permutation, shown = orders[int(rand() * len(orders))]
+                    shown_correct = shown[correct]
+                    entries.append([qid, 1, permutation])
+                    roll = rand()
+                    if roll < SKIP_RATE:
+                        selected = None
+                    elif roll < hit_rate:
+                        selected = shown_correct
+                    else:
+                        # Any of the other shown letters
+                        n = len(letters)
+                        offset = OPTION_LETTERS.index(shown_correct) + 1 + int(rand() * (n - 1))
+                        selected = OPTION_LETTERS[offset % n]
+                    is_correct = 1 if selected == shown_correct else 0
+                    score += is_correct
+                    answer_rows.append((qid, selected, shown_correct, is_correct))
+            rng.shuffle(entries)
+
+            start = exam['start'] + timedelta(days=rng.uniform(0, 14), seconds=rng.uniform(0, 36000))
+            duration = round(rng.uniform(0.3, 1.0) * exam['duration'], 2)
+            answers = answers_detail = None
+            if mode == 'json':
+                answers = json.dumps({str(qid): selected for qid, selected, _, _ in answer_rows
+                                      if selected is not None})
+                answers_detail = json.dumps({str(qid): {'selected_answer': selected, 'correct_answer': shown,
+                                                        'is_correct': bool(ok)}
+                                             for qid, selected, shown, ok in answer_rows})
+            yield ((user_id, exam['id'], timestamp(start), timestamp(start + timedelta(minutes=duration)),
+                    score, answers, answers_detail, duration, new.dump_paper(entries)), answer_rows)
+            produced += 1
+            if produced >= count:
+                break
+
+
+def write_sessions(new, conn, rows, batch_size, mode):
+    started = time.perf_counter()
+    next_id = (conn.execute('SELECT COALESCE(MAX(id), 0) FROM exam_sessions').fetchone()[0]) + 1
+    total = answers = 0
+    for batch in batches(rows, batch_size):
+        # Explicit ids so session_answers rows can be written in the same pass
+        session_batch = []
+        answer_batch = []
+        for session, answer_rows in batch:
+            session_batch.append((next_id,) + session)
+            if mode == 'normalized':
+                answer_batch.extend((next_id,) + row for row in answer_rows)
+            next_id += 1
+        conn.executemany('''
+            INSERT INTO exam_sessions (id, user_id, exam_id, start_time, end_time, score, answers,
+                                       answers_detail, duration_minutes, paper, is_completed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        ''', session_batch)
+        if answer_batch:
+            conn.executemany('''
+                INSERT INTO session_answers (session_id, question_id, selected, correct, is_correct)
+                VALUES (?, ?, ?, ?, ?)
+            ''', answer_batch)
+        conn.commit()
+        total += len(session_batch)
+        answers += len(answer_batch)
+        elapsed = time.perf_counter() - started
+        print(f"  sessions: {total:,} ({answers:,} answers) - {total / elapsed:,.0f}/s", end='\r', flush=True)
+    print(f"  sessions: {total:,} rows, {answers:,} answer rows in {time.perf_counter() - started:.1f}s")
+
+
+def generate(new, database, users=100000, questions=20000, exams=60, sessions=1000000,
+             answers='normalized', batch_size=20000, seed=2025):
+    """Fill database (already migrated by run_migrations) with synthetic rows"""
+    database = Path(database)
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    started = time.perf_counter()
+
+    conn = new.open_db_connection(str(database))
+    # Bulk load: a crash only loses a scratch database
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+    try:
+        print(f"Generating into {database}")
+        # One hash at the configured cost: logins still pay the full bcrypt price
+        password_hash = new.hash_password(PASSWORD)
+        # Sessions only go to generated users and exams, not to rows the migrations seeded
+        first_user, first_exam = (conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+                                  for table in ('users', 'exams'))
+        insert_batched(conn, '''
+            INSERT INTO users (nsi_id, name, password_hash, profile_completed, wing_name, internal_type,
+                               border_type, external_type, country_name, division_name, district_name,
+                               section_name, created_at)
+            VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', user_rows(new, rng, users, password_hash, now), batch_size, 'users')
+
+        insert_batched(conn, '''
+            INSERT INTO questions (question_text, option_a, option_b, option_c, option_d, option_e,
+                                   option_f, correct_option, difficulty, subject, question_image,
+                                   question_youtube, category, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', question_rows(rng, questions, now), batch_size, 'questions')
+
+        insert_batched(conn, '''
+            INSERT INTO exams (title, description, duration_minutes, num_questions, passing_score,
+                               max_attempts, is_active, category_config, scheduled_start, scheduled_end)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', exam_rows(rng, exams, now), batch_size, 'exams')
+
+        bank = {row['id']: (row['category'], 'ABCDEF'[:4 + bool(row['option_e']) + bool(row['option_f'])],
+                            row['correct_option'])
+                for row in conn.execute('SELECT id, category, option_e, option_f, correct_option FROM questions')}
+        exam_list = [{'id': row['id'], 'config': json.loads(row['category_config']), 'max_attempts': row['max_attempts'],
+                  'duration': row['duration_minutes'],
+                  'start': datetime.fromisoformat(str(row['scheduled_start']))}
+                 for row in conn.execute('SELECT * FROM exams WHERE id >= ?', (first_exam,))]
+        # Skill around 1.0 scales the per-difficulty hit rate (capped so nobody always scores 100%)
+        user_list = [(row[0], min(1.15, max(0.3, rng.gauss(1.0, 0.18))))
+                 for row in conn.execute('SELECT id FROM users WHERE id >= ?', (first_user,))]
+        capacity = sum(exam['max_attempts'] for exam in exam_list) * len(user_list)
+        if sessions > capacity * 0.8:
+            raise ValueError(f'{sessions:,} sessions do not fit {len(user_list):,} users x {len(exam_list)} exams '
+                             f'under max_attempts; add --users or --exams')
+
+        write_sessions(new, conn, session_rows(new, rng, sessions, user_list, exam_list, bank, answers),
+                       batch_size // 10 or 1, answers)
+
+        leaderboard_started = time.perf_counter()
+        new.update_leaderboards(conn)
+        conn.commit()
+        print(f"  leaderboards rebuilt in {time.perf_counter() - leaderboard_started:.1f}s")
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.force_close()
+
+    size = database.stat().st_size / 1024 / 1024
+    print(f"Done in {time.perf_counter() - started:.0f}s: {database} ({size:,.0f} MB). "
+          f"Password for every user: {PASSWORD}")
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True, help='database file to create')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--questions', type=int, default=20000)
+    parser.add_argument('--exams', type=int, default=60)
+    parser.add_argument('--sessions', type=int, default=1000000)
+    parser.add_argument('--answers', choices=['normalized', 'json'], default='normalized',
+                        help='store graded answers in session_answers or in the legacy JSON columns')
+    parser.add_argument('--batch-size', type=int, default=20000, help='rows per executemany')
+    parser.add_argument('--seed', type=int, default=2025)
+    parser.add_argument('--force', action='store_true', help='overwrite an existing database')
+    args = parser.parse_args()
+
+    database = Path(args.database).resolve()
+    if database.exists():
+        if not args.force:
+            raise SystemExit(f'{database} already exists (use --force to overwrite)')
+        for suffix in ('', '-wal', '-shm'):
+            Path(f'{database}{suffix}').unlink(missing_ok=True)
+    database.parent.mkdir(parents=True, exist_ok=True)
+
+    os.environ['EXAM_DATABASE'] = str(database)
+    os.environ.setdefault('EXAM_METRICS', '0')
+    os.environ.setdefault('EXAM_SQL_INSTRUMENTATION', '0')
+    os.environ.setdefault('EXAM_QUERY_PLAN_CHECK', '0')
+    os.environ.setdefault('EXAM_SECRET_KEY', secrets.token_hex(32))  # never write secret_key.txt
+    sys.path.insert(0, str(ROOT))
+    import new  # noqa: E402  (imported here so EXAM_DATABASE is picked up)
+
+    new.run_migrations()
+    try:
+        generate(new, database, users=args.users, questions=args.questions, exams=args.exams,
+                 sessions=args.sessions, answers=args.answers, batch_size=args.batch_size, seed=args.seed)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+
+if __name__ == '__main__':
+    main()
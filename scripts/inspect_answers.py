@@ -1,18 +1,30 @@
 #!/usr/bin/env python3
+import os
+import secrets
 import sqlite3
 import json
+import sys
 from pathlib import Path
 
-DB = Path(__file__).resolve().parents[1] / 'exam_system.db'
+ROOT = Path(__file__).resolve().parents[1]
+DB = ROOT / 'exam_system.db'
 if not DB.exists():
     print('DB not found:', DB)
     raise SystemExit(1)
 
+# Compact papers are rendered with the app's own code
+os.environ['EXAM_DATABASE'] = str(DB)
+os.environ.setdefault('EXAM_METRICS', '0')
+os.environ.setdefault('EXAM_SWEEPER', '0')
+os.environ.setdefault('EXAM_SECRET_KEY', secrets.token_hex(32))  # never write secret_key.txt
+sys.path.insert(0, str(ROOT))
+import new  # noqa: E402
+
 conn = sqlite3.connect(str(DB))
 conn.row_factory = sqlite3.Row
 cur = conn.cursor()
 
-cur.execute("SELECT id, questions_json, answers, answers_detail FROM exam_sessions WHERE is_completed=1 ORDER BY id DESC LIMIT 10")
+cur.execute("SELECT * FROM exam_sessions WHERE is_completed=1 ORDER BY id DESC LIMIT 10")
 sessions = cur.fetchall()
 if not sessions:
     print('No completed sessions found')
@@ -22,18 +34,31 @@ if not sessions:
 for sess in sessions:
     sid = sess['id']
     print('\n=== Session', sid, '===')
-    try:
-        q_json = json.loads(sess['questions_json'] or '[]')
-    except Exception as e:
-        q_json = []
-        print('  questions_json parse error:', e)
+    if 'paper' in sess.keys() and sess['paper']:
+        # Compact paper: [question_id, question_version, option order] per question
+        print(' Paper entries:', json.loads(sess['paper']).get('q', [])[:5])
+    # Renders compact papers, falls back to the legacy questions_json
+    q_json = new.load_session_questions(conn, sess)
     print(' Questions count:', len(q_json))
     for q in q_json[:5]:
-        print('  Q id:', q.get('id'), 'text:', q.get('question_text')[:50])
+        print('  Q id:', q.get('id'), 'text:', (q.get('question_text') or '')[:50])
         print('   options:', q.get('options'))
         if q.get('option_images'):
             print('   option_images keys:', list(q.get('option_images').keys()))
 
+    # Graded answers are normalized into session_answers; older databases
+    # may still have sessions that only carry the answers/answers_detail JSON
+    has_table = cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'session_answers'").fetchone()
+    rows = cur.execute(
+        "SELECT question_id, selected, correct, is_correct FROM session_answers WHERE session_id = ?", (sid,)
+    ).fetchall() if has_table else []
+    if rows:
+        print(' Session answers:')
+        for r in rows[:10]:
+            print('   ', 'q%s' % r['question_id'], 'selected:', r['selected'], 'correct:', r['correct'],
+                  'ok' if r['is_correct'] else 'wrong')
+        continue
+
     try:
         answers = json.loads(sess['answers'] or '{}') if sess['answers'] else {}
     except Exception as e:
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""Load test: a cohort of examinees logging in, starting one exam together and submitting
+
+Runs the app under waitress in a child process against a scratch copy of the
+database, seeds N load-test users with completed profiles and a dedicated
+exam, then drives every examinee from its own thread:
+
+    login -> dashboard -> (barrier) start_exam -> answer questions -> submit_exam -> results
+
+and reports p50/p95/p99 latency per step, error rates, the SQL time reported
+in Server-Timing and SQLite lock contention from /metrics.
+
+    python scripts/load_test.py --users 300 --threads 8
+    python scripts/load_test.py --users 50 --think-time 0.5 --source exam_system.db
+"""
+import argparse
+import http.client
+import os
+import random
+import re
+import secrets
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+LOAD_TEST_EXAM = 'Load Test Exam'
+LOAD_TEST_NAME = 'Load Test User'
+PASSWORD = 'LoadTest#2025'
+STEPS = ['login', 'dashboard', 'start_exam', 'submit_exam', 'results']
+
+QUESTION_RE = re.compile(r'name="question_(\d+)" value="([A-Z])"')
+SESSION_RE = re.compile(r'/exam/(\d+)/submit')
+SQL_TIMING_RE = re.compile(r'(?:^|,\s*)sql;dur=([\d.]+)')
+
+
+# --- Setup --------------------------------------------------------------------
+
+def default_source():
+    live = ROOT / 'exam_system.db'
+    return live if live.exists() else ROOT / 'exam_system copy 2.db'
+
+
+def free_nsi_ids(conn, count):
+    """NSI ids (a-0000 .. d-9999) not used by any existing user"""
+    taken = {row[0] for row in conn.execute('SELECT nsi_id FROM users')}
+    ids = [f'{letter}-{number:04d}' for letter in 'dcba' for number in range(9999, -1, -1)]
+    free = [nsi_id for nsi_id in ids if nsi_id not in taken]
+    if len(free) < count:
+        raise SystemExit(f'Only {len(free)} free NSI ids available, cannot seed {count} users')
+    return free[:count]
+
+
+def seed(database, users, num_questions, duration):
+    """Create the load-test exam and users; returns (exam_id, [nsi_id, ...])"""
+    os.environ['EXAM_DATABASE'] = str(database)
+    os.environ.setdefault('EXAM_SECRET_KEY', secrets.token_hex(32))  # never write secret_key.txt
+    sys.path.insert(0, str(ROOT))
+    import new  # noqa: E402  (imported here so EXAM_DATABASE is picked up)
+
+    new.run_migrations()
+    conn = new.open_db_connection(str(database))
+    try:
+        available = conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
+        if available == 0:
+            raise SystemExit('The source database has no questions')
+        num_questions = min(num_questions, available)
+        cursor = conn.execute('''
+            INSERT INTO exams (title, description, duration_minutes, num_questions, passing_score,
+                               max_attempts, is_active)
+            VALUES (?, 'Synthetic cohort for scripts/load_test.py', ?, ?, 60, 1, 1)
+        ''', (LOAD_TEST_EXAM, duration, num_questions))
+        exam_id = cursor.lastrowid
+
+        # One hash at the configured cost: logins still pay the full bcrypt price
+        password_hash = new.hash_password(PASSWORD)
+        nsi_ids = free_nsi_ids(conn, users)
+        conn.executemany('''
+            INSERT INTO users (nsi_id, name, password_hash, profile_completed, wing_name,
+                               district_name, section_name)
+            VALUES (?, ?, ?, 1, 'Internal', 'Dhaka', 'Load Test')
+        ''', [(nsi_id, f'{LOAD_TEST_NAME} {i + 1}', password_hash) for i, nsi_id in enumerate(nsi_ids)])
+        conn.commit()
+    finally:
+        conn.force_close()
+    return exam_id, nsi_ids
+
+
+def start_server(database, host, port, threads, clients):
+    """Serve new.app with waitress in a child process and wait until it answers"""
+    code = (
+        'import sys, waitress; sys.path.insert(0, sys.argv[1]); import new; '
+        'waitress.serve(new.app, host=sys.argv[2], port=int(sys.argv[3]), threads=int(sys.argv[4]), '
+        'connection_limit=int(sys.argv[5]), channel_timeout=120, _quiet=True)'
+    )
+    # Every examinee holds a keep-alive connection while waiting at the barrier
+    env = dict(os.environ, EXAM_DATABASE=str(database), EXAM_METRICS_FLUSH_INTERVAL='1',
+               EXAM_SERVER_THREADS=str(threads))
+    server = subprocess.Popen(
+        [sys.executable, '-c', code, str(ROOT), host, str(port), str(threads), str(clients + 50)],
+        cwd=str(ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise SystemExit('Server exited during startup:\n' + server.stderr.read().decode(errors='replace'))
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            conn.close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit('Server did not come up within 30 seconds')
+
+
+# --- Client -------------------------------------------------------------------
+
+class Client:
+    """One examinee: a keep-alive connection plus the Flask session cookie"""
+
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.conn = None
+        self.cookies = {}
+
+    def request(self, method, path, form=None):
+        body = urllib.parse.urlencode(form) if form is not None else None
+        headers = {'Accept-Encoding': 'identity'}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # Keep-alive connection closed by the server; retry once on a new one
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        for header, value in response.getheaders():
+            if header.lower() == 'set-cookie':
+                name, _, rest = value.partition('=')
+                self.cookies[name] = rest.split(';', 1)[0]
+        return response, data.decode('utf-8', errors='replace')
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+class Results:
+    """Thread-safe latency samples and errors per step"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {step: [] for step in STEPS}
+        self.sql_ms = {step: [] for step in STEPS}
+        self.errors = {step: {} for step in STEPS}
+        self.queued = {step: 0 for step in STEPS}
+        self.shed = {step: 0 for step in STEPS}
+
+    def record(self, step, elapsed, response=None, error=None):
+        with self._lock:
+            self.latencies[step].append(elapsed)
+            if response is not None:
+                match = SQL_TIMING_RE.search(response.getheader('Server-Timing') or '')
+                if match:
+                    self.sql_ms[step].append(float(match.group(1)))
+            if error:
+                self.errors[step][error] = self.errors[step].get(error, 0) + 1
+
+    def record_queued(self, step):
+        with self._lock:
+            self.queued[step] += 1
+
+    def record_shed(self, step):
+        with self._lock:
+            self.shed[step] += 1
+
+
+def timed(client, results, step, method, path, form=None, expect=(200,), expect_location=None):
+    """Run one step; returns the body, or None if it failed"""
+    started = time.perf_counter()
+    try:
+        response, body = client.request(method, path, form)
+        while response.status == 503 and response.getheader('Retry-After'):
+            # Admission queue page, or load shed by the password pool: wait as told
+            # and retry like the user would; the wait counts towards the step
+            if response.getheader('X-Queue-Position'):
+                results.record_queued(step)
+            else:
+                results.record_shed(step)
+            time.sleep(float(response.getheader('Retry-After')))
+            response, body = client.request(method, path, form)
+    except Exception as e:  # noqa: BLE001 - every failure is a data point
+        results.record(step, time.perf_counter() - started, error=type(e).__name__)
+        return None
+    elapsed = time.perf_counter() - started
+    error = None
+    if response.status not in expect:
+        error = f'HTTP {response.status}'
+        if 'database is locked' in body:
+            error += ' (database is locked)'
+    elif expect_location and expect_location not in (response.getheader('Location') or ''):
+        error = f'redirected to {response.getheader("Location")}'
+    results.record(step, elapsed, response, error)
+    return None if error else body
+
+
+def examinee(args, nsi_id, exam_id, barrier, results):
+    client = Client(args.host, args.port, args.timeout)
+    rng = random.Random(nsi_id)
+    try:
+        logged_in = timed(client, results, 'login', 'POST', '/login', {'nsi_id': nsi_id, 'password': PASSWORD},
+                          expect=(302,), expect_location='/student/dashboard') is not None
+        if logged_in:
+            timed(client, results, 'dashboard', 'GET', '/student/dashboard')
+        elif args.strict_barrier:
+            barrier.abort()
+        try:
+            # Everybody presses "Start" together; failed logins still check in so nobody waits for them
+            barrier.wait(timeout=args.barrier_timeout)
+        except threading.BrokenBarrierError:
+            pass
+        if not logged_in:
+            return
+        body = timed(client, results, 'start_exam', 'GET', f'/exam/{exam_id}/start')
+        if body is None:
+            return
+        session = SESSION_RE.search(body)
+        if not session:
+            results.record('submit_exam', 0.0, error='no session id on exam page')
+            return
+        options = {}
+        for question_id, letter in QUESTION_RE.findall(body):
+            options.setdefault(question_id, []).append(letter)
+        answers = {}
+        for question_id, letters in options.items():
+            time.sleep(args.think_time * rng.uniform(0.5, 1.5))  # Reading the question
+            if rng.random() > args.skip_rate:
+                answers[f'question_{question_id}'] = rng.choice(letters)
+        session_id = session.group(1)
+        if timed(client, results, 'submit_exam', 'POST', f'/exam/{session_id}/submit', answers,
+                 expect=(302,), expect_location=f'/exam/{session_id}/results') is None:
+            return
+        timed(client, results, 'results', 'GET', f'/exam/{session_id}/results')
+    finally:
+        client.close()
+
+
+# --- Reporting ----------------------------------------------------------------
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def scrape_busy_errors(host, port):
+    """exam_sqlite_busy_errors_total from /metrics (loopback is allowed without a token)"""
+    try:
+        conn = http.client.HTTPConnection(host, port, timeout=10)
+        conn.request('GET', '/metrics')
+        text = conn.getresponse().read().decode()
+        conn.close()
+    except OSError:
+        return None
+    match = re.search(r'^exam_sqlite_busy_errors_total (\d+)', text, re.M)
+    return int(match.group(1)) if match else 0
+
+
+def report(results, wall, users, busy_errors, database):
+    print(f"\n{'step':<13}{'n':>7}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'sql ms':>9}")
+    for step in STEPS:
+        samples = results.latencies[step]
+        errors = sum(results.errors[step].values())
+        sql = results.sql_ms[step]
+        error_rate = 100 * errors / len(samples) if samples else 0.0
+        print(f"{step:<13}{len(samples):>7}{error_rate:>7.1f}%"
+              f"{percentile(samples, 50) * 1000:>10.1f}{percentile(samples, 95) * 1000:>10.1f}"
+              f"{percentile(samples, 99) * 1000:>10.1f}{(max(samples) if samples else 0) * 1000:>10.1f}"
+              f"{(sum(sql) / len(sql) if sql else 0):>9.1f}")
+    for step in STEPS:
+        for error, count in sorted(results.errors[step].items(), key=lambda item: -item[1]):
+            print(f"  ! {step}: {error} x{count}")
+
+    conn = sqlite3.connect(str(database))
+    submitted = conn.execute('''
+        SELECT COUNT(*) FROM exam_sessions es JOIN exams e ON e.id = es.exam_id
+        WHERE e.title = ? AND es.is_completed = 1
+    ''', (LOAD_TEST_EXAM,)).fetchone()[0]
+    conn.close()
+    print(f"\n{users} examinees, {submitted} submissions stored, wall time {wall:.1f}s")
+    queued = {step: count for step, count in results.queued.items() if count}
+    if queued:
+        print('Admission queue pages: ' + ', '.join(f'{step} x{count}' for step, count in queued.items()))
+    shed = {step: count for step, count in results.shed.items() if count}
+    if shed:
+        print('Shed while busy (503, retried): ' + ', '.join(f'{step} x{count}' for step, count in shed.items()))
+    if busy_errors is None:
+        print("SQLite lock contention: /metrics unavailable")
+    else:
+        print(f"SQLite lock contention: {busy_errors} statements failed with SQLITE_BUSY/LOCKED")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100, help='examinees to simulate')
+    parser.add_argument('--threads', type=int, default=8, help='waitress worker threads')
+    parser.add_argument('--questions', type=int, default=30, help='questions per paper')
+    parser.add_argument('--duration', type=int, default=30, help='exam duration in minutes')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean seconds spent per question')
+    parser.add_argument('--skip-rate', type=float, default=0.1, help='share of questions left blank')
+    parser.add_argument('--source', default=str(default_source()), help='database to copy')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--timeout', type=float, default=120, help='per-request timeout in seconds')
+    parser.add_argument('--barrier-timeout', type=float, default=300)
+    parser.add_argument('--strict-barrier', action='store_true',
+                        help='abort the coordinated start if any login fails')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch database')
+    args = parser.parse_args()
+
+    if args.think_time * args.questions * 1.5 > args.duration * 60:
+        print('⚠️  Think time exceeds the exam duration; late submissions are expected')
+
+    workdir = Path(tempfile.mkdtemp(prefix='exam-load-'))
+    database = workdir / 'exam_system.db'
+    shutil.copy(args.source, database)
+    print(f"Seeding {args.users} users into {database} ...")
+    exam_id, nsi_ids = seed(database, args.users, args.questions, args.duration)
+
+    server = start_server(database, args.host, args.port, args.threads, len(nsi_ids))
+    print(f"waitress up on {args.host}:{args.port} with {args.threads} threads; exam {exam_id}")
+    try:
+        busy_before = scrape_busy_errors(args.host, args.port)
+        results = Results()
+        barrier = threading.Barrier(len(nsi_ids))
+        workers = [threading.Thread(target=examinee, args=(args, nsi_id, exam_id, barrier, results), daemon=True)
+                   for nsi_id in nsi_ids]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        wall = time.perf_counter() - started
+        time.sleep(1.5)  # Let the server flush its metrics
+        busy_after = scrape_busy_errors(args.host, args.port)
+        busy = None if busy_before is None or busy_after is None else busy_after - busy_before
+        report(results, wall, len(nsi_ids), busy, database)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        if args.keep:
+            print(f"Scratch database kept at {database}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
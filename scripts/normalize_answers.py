@@ -5,6 +5,7 @@ Migration helper: normalize stored answers in exam_sessions.
 - Loads questions_json and answers/answers_detail
 - For numeric answers, tries to map to option letters using 1-based index mapping
 - Updates answers and answers_detail with normalized letters where possible
+- Does the same for graded rows in session_answers (and re-derives is_correct)
 
 Make a DB backup before running.
 """
@@ -49,7 +50,7 @@ def normalize_value(val, options):
     return val, False
 
 # Fetch completed sessions
-cur.execute("SELECT id, questions_json, answers, answers_detail FROM exam_sessions WHERE is_completed = 1")
+cur.execute("SELECT * FROM exam_sessions WHERE is_completed = 1")
 sessions = cur.fetchall()
 print(f"Found {len(sessions)} completed sessions to inspect")
 
@@ -117,7 +118,45 @@ for sess in sessions:
         conn.commit()
         changed += 1
 
-print(f"Normalization complete. Sessions updated: {changed}. Problematic entries: {len(problems)}")
+# Normalize session_answers rows (sessions graded after the answers table was added)
+has_table = cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'session_answers'").fetchone()
+answer_updates = []
+if has_table:
+    session_options = {}
+    for sess in sessions:
+        try:
+            questions = json.loads(sess['questions_json'] or '[]')
+        except Exception:
+            questions = []
+        q_options = {str(q.get('id')): q.get('options', []) for q in questions}
+        if 'paper' in sess.keys() and sess['paper']:
+            # Compact papers only carry the option order; letters are enough for index mapping
+            try:
+                entries = json.loads(sess['paper']).get('q', [])
+            except Exception:
+                entries = []
+            for qid, _version, order in entries:
+                q_options[str(qid)] = [('ABCDEF'[i], None) for i in range(len(order))]
+        session_options[sess['id']] = q_options
+
+    cur.execute("SELECT session_id, question_id, selected, correct FROM session_answers WHERE selected IS NOT NULL")
+    for row in cur.fetchall():
+        opts = session_options.get(row['session_id'], {}).get(str(row['question_id']), [])
+        if not opts:
+            continue
+        normalized, ok = normalize_value(row['selected'], opts)
+        if ok and normalized != row['selected']:
+            answer_updates.append((normalized, 1 if normalized == row['correct'] else 0,
+                                   row['session_id'], row['question_id']))
+            print(f"Session {row['session_id']}: session_answers q{row['question_id']} normalized {row['selected']} -> {normalized}")
+        elif not ok and str(row['selected']).isdigit():
+            problems.append((row['session_id'], row['question_id'], row['selected']))
+    if answer_updates:
+        cur.executemany('UPDATE session_answers SET selected = ?, is_correct = ? WHERE session_id = ? AND question_id = ?',
+                        answer_updates)
+        conn.commit()
+
+print(f"Normalization complete. Sessions updated: {changed}. Answer rows updated: {len(answer_updates)}. Problematic entries: {len(problems)}")
 if problems:
     print("Examples of problematic entries (session_id, question_id, stored_value):")
     for p in problems[:20]:
@@ -12,6 +12,8 @@ let timeRemaining = 0;
 let examSubmitted = false;
 let tabSwitchCount = 0;
 let isExamActive = false;
+let lastSavedAnswers = null;
+let autoSaveInFlight = false;
 
 // Security toggle defaults (will be overridden by template values)
 let enableCopyProtection = false;
@@ -465,6 +467,18 @@ function initializeExam() {
 function initializeExamTimer() {
     const timerElement = document.getElementById('timeRemaining');
     
+    // The server owns the deadline; resync so sleep or a slow tab cannot stretch the exam
+    const examForm = document.getElementById('examForm');
+    const timeUrl = examForm && examForm.dataset.timeUrl;
+    if (timeUrl) {
+        setInterval(function() {
+            syncExamTimer(timeUrl, timerElement);
+        }, 60000);
+        document.addEventListener('visibilitychange', function() {
+            if (!document.hidden) syncExamTimer(timeUrl, timerElement);
+        });
+    }
+    
     examTimer = setInterval(function() {
         timeRemaining--;
         updateTimerDisplay(timerElement);
@@ -482,6 +496,22 @@ function initializeExamTimer() {
     }, 1000);
 }
 
+/**
+ * Set the remaining time from the server's deadline
+ */
+function syncExamTimer(timeUrl, timerElement) {
+    if (!isExamActive || examSubmitted) return;
+    
+    fetch(timeUrl, { cache: 'no-store' })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success || data.remaining_seconds === null) return;
+        timeRemaining = data.remaining_seconds;
+        updateTimerDisplay(timerElement);
+    })
+    .catch(error => console.warn('Timer sync failed:', error));
+}
+
 /**
  * Update timer display
  */
@@ -623,16 +653,34 @@ function updateExamProgress() {
  * Initialize auto-save functionality
  */
 function initializeAutoSave() {
+    // The page is rendered with the server's saved answers checked
+    lastSavedAnswers = collectExamAnswers();
+    
     autoSaveInterval = setInterval(function() {
         saveExamProgress();
     }, 10000); // Save every 10 seconds
     
-    // Save on answer selection
+    // Save shortly after answer selection; quick changes go out together
+    const debouncedSave = debounce(saveExamProgress, 2000);
     document.querySelectorAll('input[type="radio"]').forEach(radio => {
-        radio.addEventListener('change', function() {
-            saveExamProgress();
-        });
+        radio.addEventListener('change', debouncedSave);
+    });
+}
+
+/**
+ * Current answers keyed by question id (null when unanswered)
+ */
+function collectExamAnswers() {
+    const answers = {};
+    document.querySelectorAll('#examForm input[type="radio"][name^="question_"]').forEach(radio => {
+        const questionId = radio.name.split('_')[1];
+        if (radio.checked) {
+            answers[questionId] = radio.value;
+        } else if (!(questionId in answers)) {
+            answers[questionId] = null;
+        }
     });
+    return answers;
 }
 
 /**
@@ -641,14 +689,7 @@ function initializeAutoSave() {
 function saveExamProgress() {
     if (!isExamActive || examSubmitted) return;
     
-    const formData = new FormData(document.getElementById('examForm'));
-    const answers = {};
-    
-    for (let [key, value] of formData.entries()) {
-        if (key.startsWith('question_')) {
-            answers[key] = value;
-        }
-    }
+    const answers = collectExamAnswers();
     
     // Store in localStorage as backup
     localStorage.setItem('examProgress', JSON.stringify({
@@ -658,7 +699,38 @@ function saveExamProgress() {
         timestamp: Date.now()
     }));
     
-    console.log('Exam progress saved');
+    // Send only the answers that changed since the last successful save
+    const examForm = document.getElementById('examForm');
+    const autosaveUrl = examForm && examForm.dataset.autosaveUrl;
+    if (!autosaveUrl || autoSaveInFlight || !lastSavedAnswers) return;
+    
+    const changes = {};
+    Object.keys(answers).forEach(questionId => {
+        if (answers[questionId] !== lastSavedAnswers[questionId]) {
+            changes[questionId] = answers[questionId];
+        }
+    });
+    if (Object.keys(changes).length === 0) return;
+    
+    autoSaveInFlight = true;
+    fetch(autosaveUrl, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ answers: changes })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            Object.assign(lastSavedAnswers, changes);
+            console.log(`Exam progress saved (${data.saved} changed)`);
+        } else {
+            console.warn('Autosave rejected:', data.message);
+        }
+    })
+    .catch(error => console.warn('Autosave failed, will retry:', error))
+    .finally(() => {
+        autoSaveInFlight = false;
+    });
 }
 
 /**
@@ -0,0 +1,161 @@
+"""Fixtures for the performance suite
+
+The suite runs new.app through Flask's test client against a database filled
+by scripts/generate_data.py (generated once per run into a temp dir, or an
+existing one named by EXAM_PERF_DATABASE), plus one examinee with a long exam
+history and a 100-question exam for the start/submit budgets.
+
+    python -m pytest tests/perf
+    python -m pytest tests/perf --update-baselines   # re-record micro-benchmark baselines
+    EXAM_PERF_DATABASE=/tmp/big.db python -m pytest tests/perf
+"""
+import os
+import re
+import secrets
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+# Size of the generated database; big enough for realistic plans, small enough for a test run
+PERF_USERS = 3000
+PERF_QUESTIONS = 2000
+PERF_EXAMS = 20
+PERF_SESSIONS = 30000
+HISTORY_ROWS = 500
+BIG_EXAM_QUESTIONS = 100
+
+SQL_QUERIES_RE = re.compile(r'sql;dur=[\d.]+;desc="(\d+) queries"')
+
+
+def pytest_addoption(parser):
+    parser.addoption('--update-baselines', action='store_true',
+                     help='record micro-benchmark timings as the new baselines instead of checking them')
+
+
+def pytest_configure(config):
+    # Budgets are per request: keep bcrypt cheap, metrics and the sweeper off and slow queries out of the repo
+    os.environ.setdefault('EXAM_BCRYPT_ROUNDS', '4')
+    os.environ.setdefault('EXAM_METRICS', '0')
+    os.environ.setdefault('EXAM_SWEEPER', '0')
+    os.environ.setdefault('EXAM_QUERY_PLAN_CHECK', '0')
+    os.environ['EXAM_SQL_INSTRUMENTATION'] = '1'
+    # Throwaway session key: importing new must not write secret_key.txt into the tree
+    os.environ.setdefault('EXAM_SECRET_KEY', secrets.token_hex(32))
+
+
+@pytest.fixture(scope='session')
+def perf_db(tmp_path_factory):
+    """Path of the benchmark database, generated on first use"""
+    existing = os.environ.get('EXAM_PERF_DATABASE')
+    if existing:
+        database = Path(existing).resolve()
+    else:
+        database = tmp_path_factory.mktemp('perf') / 'perf.db'
+    os.environ['EXAM_DATABASE'] = str(database)
+    os.environ.setdefault('EXAM_SLOW_QUERY_LOG', str(database.parent / 'slow_queries.log'))
+    import new
+    import generate_data
+
+    new.DATABASE = str(database)
+    new.app.config['SLOW_QUERY_LOG'] = os.environ['EXAM_SLOW_QUERY_LOG']
+    new.run_migrations(database=str(database))
+    if not existing:
+        generate_data.generate(new, database, users=PERF_USERS, questions=PERF_QUESTIONS, exams=PERF_EXAMS,
+                               sessions=PERF_SESSIONS, batch_size=5000)
+    return database
+
+
+@pytest.fixture(scope='session')
+def app_module(perf_db):
+    import new
+
+    new.app.config['TESTING'] = True
+    new.app.config['WTF_CSRF_ENABLED'] = False
+    return new
+
+
+@pytest.fixture(scope='session')
+def heavy_user(app_module):
+    """Id of an examinee with HISTORY_ROWS completed sessions (copies of other users' sessions)"""
+    new = app_module
+    conn = new.open_db_connection()
+    try:
+        user_id = conn.execute("SELECT id FROM users WHERE nsi_id = 'a-0000'").fetchone()[0]
+        have = conn.execute('SELECT COUNT(*) FROM exam_sessions WHERE user_id = ? AND is_completed = 1',
+                            (user_id,)).fetchone()[0]
+        sources = conn.execute('''
+            SELECT id FROM exam_sessions WHERE is_completed = 1 AND user_id != ? ORDER BY id LIMIT ?
+        ''', (user_id, max(0, HISTORY_ROWS - have))).fetchall()
+        for (source_id,) in sources:
+            session_id = conn.execute('''
+                INSERT INTO exam_sessions (user_id, exam_id, start_time, end_time, score, is_completed,
+                                           duration_minutes, paper)
+                SELECT ?, exam_id, start_time, end_time, score, 1, duration_minutes, paper
+                FROM exam_sessions WHERE id = ?
+            ''', (user_id, source_id)).lastrowid
+            conn.execute('''
+                INSERT INTO session_answers (session_id, question_id, selected, correct, is_correct)
+                SELECT ?, question_id, selected, correct, is_correct FROM session_answers WHERE session_id = ?
+            ''', (session_id, source_id))
+        new.update_leaderboards(conn, exam_ids=new.leaderboard_scope(conn, [user_id]), user_ids=[user_id])
+        conn.commit()
+    finally:
+        conn.force_close()
+    return user_id
+
+
+@pytest.fixture(scope='session')
+def big_exam(app_module):
+    """The only active exam: BIG_EXAM_QUESTIONS questions, unlimited attempts"""
+    new = app_module
+    conn = new.open_db_connection()
+    try:
+        conn.execute('UPDATE exams SET is_active = 0')
+        exam_id = conn.execute('''
+            INSERT INTO exams (title, description, duration_minutes, num_questions, passing_score,
+                               max_attempts, is_active)
+            VALUES ('Performance Suite Exam', 'tests/perf', 120, ?, 60, 1000000, 1)
+        ''', (BIG_EXAM_QUESTIONS,)).lastrowid
+        conn.commit()
+    finally:
+        conn.force_close()
+    return exam_id
+
+
+def login_as(client, **session_values):
+    with client.session_transaction() as s:
+        s.update(session_values)
+    return client
+
+
+@pytest.fixture
+def student_client(app_module, heavy_user):
+    return login_as(app_module.app.test_client(), user_logged_in=True, user_id=heavy_user)
+
+
+@pytest.fixture
+def admin_client(app_module):
+    return login_as(app_module.app.test_client(), admin_logged_in=True, admin_id=1)
+
+
+class Measurement:
+    """Response, SQL query count (from Server-Timing) and wall time of one request"""
+
+    def __init__(self, response, elapsed):
+        self.response = response
+        self.ms = elapsed * 1000
+        match = SQL_QUERIES_RE.search(response.headers.get('Server-Timing', ''))
+        self.queries = int(match.group(1)) if match else None
+
+
+def measure(client, method, url, **kwargs):
+    started = time.perf_counter()
+    response = client.open(url, method=method, **kwargs)
+    response.get_data()
+    return Measurement(response, time.perf_counter() - started)
@@ -0,0 +1,157 @@
+"""Micro-benchmarks of the hot helpers, checked against stored baselines
+
+Each benchmark is timed relative to a pure-Python calibration loop run
+alongside it, so a slower (or busier) machine does not read as a regression,
+and fails when that ratio is worse than baselines.json by more than
+EXAM_PERF_TOLERANCE (default 0.5, i.e. 50%). After an intended change,
+re-record the baselines with
+
+    python -m pytest tests/perf/test_microbenchmarks.py --update-baselines
+"""
+import json
+import os
+import random
+import timeit
+from pathlib import Path
+
+import pytest
+
+from conftest import BIG_EXAM_QUESTIONS
+
+BASELINES = Path(__file__).with_name('baselines.json')
+TOLERANCE = float(os.environ.get('EXAM_PERF_TOLERANCE', '0.5'))
+
+VALIDATOR_CORPUS = [
+    'a-1234', 'Md. Abdul Karim', "O'Brien-Smith", 'Cyber Security Awareness Week',
+    'Which of the following is the strongest password policy for a shared workstation?',
+    'Phishing emails often create a sense of urgency. ' * 6,
+    "x' OR '1'='1", '1; DROP TABLE users --', 'UNION SELECT password FROM admins',
+    '<script>alert(1)</script>', '<img src=x onerror=alert(1)>', 'javascript:alert(document.cookie)',
+]
+
+
+CALIBRATION_NUMBER = 200
+
+
+def calibration_workload():
+    """Dict, string and arithmetic work in the same mix as the benchmarked helpers"""
+    data = {str(i): i * 3 % 7 for i in range(200)}
+    return sum(len(key) + value for key, value in data.items() if value % 2)
+
+
+def benchmark(func, number, repeat=7):
+    """Best-of-repeat microseconds per call and the best ratio to the calibration loop
+
+    The calibration loop is timed right after every repeat, so load that comes
+    and goes during the run slows both sides of the ratio.
+    """
+    best = ratio = float('inf')
+    for _ in range(repeat):
+        elapsed = timeit.timeit(func, number=number) / number
+        calibration = timeit.timeit(calibration_workload, number=CALIBRATION_NUMBER) / CALIBRATION_NUMBER
+        best = min(best, elapsed)
+        ratio = min(ratio, elapsed / calibration)
+    return best * 1e6, ratio
+
+
+@pytest.fixture(scope='module')
+def baselines(request):
+    stored = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    updated = {}
+    yield stored, updated
+    if request.config.getoption('--update-baselines'):
+        # A partial run (-k) keeps the baselines of the benchmarks it skipped
+        BASELINES.write_text(json.dumps(dict(sorted({**stored, **updated}.items())), indent=2) + '\n')
+
+
+@pytest.fixture
+def check(request, baselines):
+    """check(name, func, number): benchmark func and compare with (or record) its baseline
+
+    Returns microseconds per call.
+    """
+    stored, updated = baselines
+
+    def compare(name, func, number):
+        us, ratio = benchmark(func, number)
+        updated[name] = {'us': round(us, 2), 'ratio': round(ratio, 3)}
+        if request.config.getoption('--update-baselines'):
+            return us
+        if name not in stored:
+            pytest.fail(f'No baseline for {name} ({us:.1f} µs); run with --update-baselines')
+        baseline = stored[name]
+        assert ratio <= baseline['ratio'] * (1 + TOLERANCE), (
+            f"{name}: {us:.1f} µs/call ({ratio:.2f}x calibration), baseline {baseline['us']:.1f} µs "
+            f"({baseline['ratio']:.2f}x), +{TOLERANCE:.0%} allowed")
+        return us
+    return compare
+
+
+@pytest.fixture(scope='module')
+def paper(app_module):
+    """A rendered 100-question paper and its compact form"""
+    new = app_module
+    conn = new.open_db_connection()
+    try:
+        rows = new.question_pool.sample(conn, None, BIG_EXAM_QUESTIONS)
+        entries = [new.new_paper_entry(qd) for qd in rows]
+        compact = json.loads(new.dump_paper(entries))
+        questions = new.render_paper(conn, compact)
+    finally:
+        conn.force_close()
+    return rows, compact, questions
+
+
+def test_grade_answers_100_questions(app_module, paper, check):
+    _, _, questions = paper
+    rng = random.Random(7)
+    answers = {}
+    for question in questions:
+        if rng.random() < 0.9:
+            # Mostly letters, some full option texts as older clients sent them
+            letter, text = rng.choice(question['options'])
+            answers[str(question['id'])] = letter if rng.random() < 0.8 else text
+    us = check('grade_answers_100q', lambda: app_module.grade_answers(questions, answers), number=200)
+    assert us < 10000, f'grading {len(questions)} questions took {us / 1000:.2f} ms'
+
+
+def test_option_shuffling(app_module, paper, check):
+    rows, _, _ = paper
+    new_paper_entry = app_module.new_paper_entry
+    check('new_paper_entry_100q', lambda: [new_paper_entry(qd) for qd in rows], number=200)
+
+
+def test_build_paper_questions(app_module, paper, check):
+    rows, compact, _ = paper
+    build = app_module.build_paper_question
+    pairs = list(zip(rows, (permutation for _, _, permutation in compact['q'])))
+    check('build_paper_question_100q', lambda: [build(qd, permutation) for qd, permutation in pairs], number=200)
+
+
+def test_question_pool_sample(app_module, check):
+    new = app_module
+    conn = new.open_db_connection()
+    try:
+        new.question_pool.snapshot(conn)
+        config = {'easy': 30, 'medium': 30, 'hard': 25, 'image': 10, 'video': 5}
+        check('question_pool_sample_100q', lambda: new.question_pool.sample(conn, config, 100), number=200)
+    finally:
+        conn.force_close()
+
+
+def test_input_validator_scan(app_module, check):
+    validator = app_module.InputValidator
+
+    def scan():
+        for value in VALIDATOR_CORPUS:
+            validator.detect_sql_injection(value)
+            validator.detect_xss(value)
+            validator.detect_sql_injection(value, False)
+            validator.detect_xss(value, False)
+    check('input_validator_detect_corpus', scan, number=200)
+
+
+def test_input_validator_sanitize(app_module, check):
+    sanitize = app_module.InputValidator.sanitize_string
+    check('input_validator_sanitize_corpus', lambda: [sanitize(value, max_length=200) for value in VALIDATOR_CORPUS],
+          number=1000)
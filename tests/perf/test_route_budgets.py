@@ -0,0 +1,123 @@
+"""Per-route budgets: SQL queries per request and median latency through the test client
+
+Query counts come from the Server-Timing header (SQL instrumentation), so
+they only cover statements run inside the request. Latency budgets are for a
+warm process (caches loaded, pooled connection open); scale them on slow
+machines with EXAM_PERF_LATENCY_SCALE=2.
+"""
+import gc
+import os
+import statistics
+
+import pytest
+
+from conftest import BIG_EXAM_QUESTIONS, HISTORY_ROWS, measure
+
+LATENCY_SCALE = float(os.environ.get('EXAM_PERF_LATENCY_SCALE', '1'))
+RUNS = 7
+
+
+def budget(client, url, max_queries, max_ms, method='GET', status=200, **kwargs):
+    """Warm the route up, then check the query count of every run and the median latency"""
+    measure(client, method, url, **kwargs)
+    # Like timeit: collector pauses triggered by earlier tests are not the route's cost
+    gc.collect()
+    gc.disable()
+    try:
+        runs = [measure(client, method, url, **kwargs) for _ in range(RUNS)]
+    finally:
+        gc.enable()
+    for run in runs:
+        assert run.response.status_code == status, f'{url} returned {run.response.status_code}'
+        assert run.queries is not None, f'{url} has no Server-Timing SQL entry'
+        assert run.queries <= max_queries, f'{url} ran {run.queries} queries (budget {max_queries})'
+    median = statistics.median(run.ms for run in runs)
+    assert median < max_ms * LATENCY_SCALE, f'{url} took {median:.1f} ms (budget {max_ms * LATENCY_SCALE:.0f} ms)'
+    return runs[-1]
+
+
+@pytest.fixture
+def completed_session(app_module, heavy_user):
+    conn = app_module.open_db_connection()
+    try:
+        return conn.execute('SELECT id FROM exam_sessions WHERE user_id = ? AND is_completed = 1 LIMIT 1',
+                            (heavy_user,)).fetchone()[0]
+    finally:
+        conn.force_close()
+
+
+def test_student_dashboard_with_long_history(student_client, app_module, heavy_user):
+    run = budget(student_client, '/student/dashboard', max_queries=6, max_ms=50)
+    conn = app_module.open_db_connection()
+    try:
+        history = conn.execute('SELECT COUNT(*) FROM exam_sessions WHERE user_id = ? AND is_completed = 1',
+                               (heavy_user,)).fetchone()[0]
+    finally:
+        conn.force_close()
+    assert history >= HISTORY_ROWS
+    assert b'history-card' in run.response.data
+
+
+def test_exam_results(student_client, completed_session):
+    budget(student_client, f'/exam/{completed_session}/results', max_queries=5, max_ms=15)
+
+
+def test_student_exam_review(student_client, completed_session):
+    budget(student_client, f'/student/exam/{completed_session}/review', max_queries=6, max_ms=30)
+
+
+def test_start_and_submit_exam(student_client, app_module, big_exam, heavy_user):
+    """A 100-question paper: starting is one sample plus one insert, grading writes in bulk"""
+    measure(student_client, 'GET', f'/exam/{big_exam}/start')  # warm-up attempt
+    conn = app_module.open_db_connection()
+    try:
+        conn.execute('UPDATE exam_sessions SET is_completed = 1 WHERE user_id = ? AND exam_id = ?',
+                     (heavy_user, big_exam))
+        conn.commit()
+    finally:
+        conn.force_close()
+
+    start = measure(student_client, 'GET', f'/exam/{big_exam}/start')
+    assert start.response.status_code == 200
+    assert start.queries <= 8, f'start_exam ran {start.queries} queries'
+    assert start.ms < 80 * LATENCY_SCALE, f'start_exam took {start.ms:.1f} ms'
+
+    conn = app_module.open_db_connection()
+    try:
+        session = conn.execute('SELECT * FROM exam_sessions WHERE user_id = ? AND exam_id = ? AND is_completed = 0',
+                               (heavy_user, big_exam)).fetchone()
+        questions = app_module.load_session_questions(conn, session)
+    finally:
+        conn.force_close()
+    assert len(questions) == BIG_EXAM_QUESTIONS
+    answers = {str(q['id']): q['correct_option'] for q in questions}
+
+    submit = measure(student_client, 'POST', f"/exam/{session['id']}/submit", json={'answers': answers})
+    assert submit.response.get_json()['success']
+    assert submit.queries <= 10, f'submit_exam ran {submit.queries} queries'
+    assert submit.ms < 60 * LATENCY_SCALE, f'submit_exam took {submit.ms:.1f} ms'
+
+
+@pytest.mark.parametrize('url, max_queries, max_ms', [
+    ('/admin/dashboard', 13, 120),
+    ('/admin/results', 5, 150),
+    ('/admin/results/api', 2, 150),
+    ('/admin/exams', 1, 15),
+])
+def test_admin_pages(admin_client, url, max_queries, max_ms):
+    budget(admin_client, url, max_queries, max_ms)
+
+
+def test_admin_results_api_deep_page(admin_client):
+    """A page 20 cursors in costs the same as the first page (keyset, no OFFSET)"""
+    url = '/admin/results/api'
+    for _ in range(19):
+        cursor = admin_client.get(url).get_json()['next_cursor']
+        assert cursor, f'ran out of result pages before page 20 ({url})'
+        url = f'/admin/results/api?cursor={cursor}'
+    run = budget(admin_client, url, max_queries=2, max_ms=150)
+    assert run.response.get_json()['results']
+
+
+def test_admin_result_details(admin_client, completed_session):
+    budget(admin_client, f'/admin/results/{completed_session}/details', max_queries=3, max_ms=10)